@@ -0,0 +1,428 @@
+import asyncio
+import itertools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+from start_scraper import (fetch_page, reuse_analysis, analysis_args, build_items, remember_page, record_timings,
+                           analyze_archived, RESOURCE_INCLUDE, DUPLICATE_INCLUDE, KEYWORD_INCLUDE)
+from scraper import analysis, archive, duplicates, keywords, metrics, politeness, resources, settings, sitemap, snapshots
+from scraper.frontier import Frontier
+from scraper.items import SeoItem
+from scraper.linkgraph import LinkGraph
+
+
+# requests has no asyncio transport, so downloads run on a dedicated thread pool
+# sized to the concurrency limit and parsing runs on a separate, smaller pool.
+# The event loop itself only awaits, so /health and other requests stay responsive
+# while slow sites are being fetched.
+_fetch_pool = ThreadPoolExecutor(max_workers=settings.MAX_CONCURRENT_SCRAPES, thread_name_prefix='scrape-fetch')
+_analysis_pool = ThreadPoolExecutor(max_workers=settings.ANALYSIS_WORKERS, thread_name_prefix='scrape-analysis')
+
+# Parsing and scoring of new pages runs in worker processes when enabled. Only the
+# body and headers are sent over; cache and memo lookups stay in this process
+# because their tables live here. 'spawn' avoids forking a process that already
+# runs threads and an event loop.
+_process_pool = None
+if settings.ANALYSIS_PROCESSES > 0:
+    _process_pool = ProcessPoolExecutor(max_workers=settings.ANALYSIS_PROCESSES,
+                                        mp_context=multiprocessing.get_context('spawn'))
+
+# Global limit on in-flight scrapes for this worker
+_scrape_slots = asyncio.Semaphore(settings.MAX_CONCURRENT_SCRAPES)
+
+# Bounded analysis queue: at most this many pages are handed to the analysis
+# workers at once. Downloaded pages waiting here keep their scrape slot, so when
+# parsing falls behind, new downloads wait instead of piling up response bodies.
+_analysis_slots = asyncio.Semaphore(settings.ANALYSIS_QUEUE_SIZE)
+
+
+# Per-host connection limits (SCRAPER_HOST_MAX_CONNECTIONS): host -> [semaphore, scrapes using it].
+# A host's entry is dropped when its last scrape is done.
+_host_slots = {}
+
+
+def shutdown():
+    """Stop the analysis worker processes"""
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+
+
+async def _analyze(url, response, user_agent, include=(), mode='full', fields=None, timed=False):
+    loop = asyncio.get_running_loop()
+    items = await loop.run_in_executor(_analysis_pool, reuse_analysis, url, response, user_agent, include, fields)
+    if items is None:
+        args = analysis_args(url, response, include, mode, fields)
+        pool = _process_pool or _analysis_pool
+        if timed:
+            # Timings come back with the result, a worker process cannot fill a dict of ours
+            page_analysis, response.analysis_timings = await loop.run_in_executor(
+                pool, analysis.analyze_document_timed, *args)
+        else:
+            page_analysis = await loop.run_in_executor(pool, analysis.analyze_document, *args)
+        items = await loop.run_in_executor(_analysis_pool, build_items, url, response, user_agent, page_analysis,
+                                           include, fields)
+    return items
+
+
+async def _host_turn(url):
+    """
+    Wait until the URL's host takes another request; returns the function that frees its connection
+
+    The scrape needs one of the host's connections and a token of its rate
+    limit (or the end of a Retry-After pause), see scraper/politeness.py.
+    """
+    if not settings.POLITENESS:
+        return lambda: None
+    host = politeness.origin(url)
+    entry = _host_slots.setdefault(host, [asyncio.Semaphore(settings.HOST_MAX_CONNECTIONS), 0])
+    entry[1] += 1
+
+    def leave():
+        entry[1] -= 1
+        if not entry[1]:
+            _host_slots.pop(host, None)
+
+    try:
+        await entry[0].acquire()
+    except BaseException:
+        leave()
+        raise
+
+    def release():
+        entry[0].release()
+        leave()
+
+    try:
+        await asyncio.sleep(politeness.scheduler.reserve(url))
+    except BaseException:
+        release()
+        raise
+    return release
+
+
+async def _check_resources(items):
+    """Async counterpart of resources.check_items: waits for the shared checks without holding a thread"""
+    for item in items:
+        if 'error' not in item:
+            urls = item.pop('resource_urls', None) or {}
+            results = await asyncio.gather(*(asyncio.wrap_future(resources.checks.get(url)) for url in urls))
+            resources.add_totals(item, urls, results)
+
+
+async def scrape(url, include=(), mode='full', fields=None, debug_timings=False, check_resources=False,
+                 check_duplicates=False, check_keywords=False):
+    """
+    Async counterpart of run_spider: fetch and analyze without blocking the event loop
+
+    `fields` is an already resolved field selection (analysis.resolve_fields).
+    Like polite_fetch, the page waits for robots.txt, its host's connection
+    limit and rate limit, and is fetched again after a 429 / 503. A scrape
+    slot is only taken once the host is ready, so a slow or throttled host
+    does not hold up other hosts. Besides run_spider's phases, the time spent
+    waiting for all this and for an analysis slot is reported as 'queue'.
+    With `check_resources` the files the page loads are checked once the
+    scrape slot is released (scraper/resources.py); `check_duplicates` and
+    `check_keywords` work as in run_spider.
+    """
+    loop = asyncio.get_running_loop()
+    if check_resources:
+        include = tuple(include) + RESOURCE_INCLUDE
+    if check_duplicates:
+        include = tuple(include) + DUPLICATE_INCLUDE
+    if check_keywords:
+        include = tuple(include) + KEYWORD_INCLUDE
+    timed = metrics.enabled(debug_timings)
+    started = time.perf_counter()
+    metrics.scrapes_in_flight.inc()
+    try:
+        await loop.run_in_executor(_fetch_pool, politeness.check_robots, url)
+        for attempt in itertools.count():
+            release_host = await _host_turn(url)
+            try:
+                async with _scrape_slots:
+                    queued = time.perf_counter() - started
+                    try:
+                        response, user_agent = await loop.run_in_executor(_fetch_pool, fetch_page, url, include, mode,
+                                                                          fields)
+                    finally:
+                        release_host()
+                    if response.cache_status == 'hit':
+                        politeness.scheduler.refund(url)
+                    waiting = time.perf_counter()
+                    async with _analysis_slots:
+                        queued += time.perf_counter() - waiting
+                        items = await _analyze(url, response, user_agent, include, mode, fields, timed)
+                    await loop.run_in_executor(_fetch_pool, remember_page, url, response, items, include, fields)
+            except politeness.Throttled as e:
+                if attempt >= settings.RETRY_MAX or not e.retry:
+                    raise
+                continue
+            if check_duplicates:
+                # Block table lookups and inserts under the index lock: kept off the event loop
+                await loop.run_in_executor(_analysis_pool, duplicates.check_items, items)
+            if check_keywords:
+                await loop.run_in_executor(_analysis_pool, keywords.check_items, items)
+            phases = {'queue': queued}
+            if check_resources:
+                checking = time.perf_counter()
+                await _check_resources(items)
+                phases['resources'] = time.perf_counter() - checking
+            if timed:
+                phases['total'] = time.perf_counter() - started
+                record_timings(response, items, mode, phases, debug_timings)
+            return items
+    except Exception as e:
+        metrics.record_error(mode, e)
+        raise Exception(f"Failed to scrape {url}: {str(e)}")
+    finally:
+        metrics.scrapes_in_flight.dec()
+
+
+async def audit(items):
+    """Replace scraped items by their changes since each URL's last snapshot (see scraper/snapshots.py)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_fetch_pool, snapshots.compare_items, items)
+
+
+async def _scrape_record(url, include=(), fields=None, diff=False, check_resources=False, check_duplicates=False,
+                         check_keywords=False):
+    """Scrape one URL for a batch, turning failures into an error record"""
+    if not url.startswith(('http://', 'https://')):
+        return [SeoItem(url=url, error="URL must start with http:// or https://", timestamp=datetime.now().isoformat())]
+    try:
+        items = await scrape(url, include, fields=fields, check_resources=check_resources,
+                             check_duplicates=check_duplicates, check_keywords=check_keywords)
+    except Exception as e:
+        return [SeoItem(url=url, error=str(e), timestamp=datetime.now().isoformat())]
+    return await audit(items) if diff else items
+
+
+async def _iterate(urls):
+    if hasattr(urls, '__aiter__'):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+
+async def scrape_many(urls, concurrency=None, fields=None, diff=False, check_resources=False,
+                      check_duplicates=False, check_keywords=False):
+    """
+    Scrape many URLs concurrently and yield each item as soon as its page is done
+
+    URLs are pulled from `urls` (a list, generator or async generator) only when
+    a slot is free, so at most `concurrency` scrapes and their results are held
+    in memory regardless of the batch size. A failed URL yields an item with an
+    `error` key instead of stopping the batch. `fields` limits every item to
+    a field selection; with `diff` each item is replaced by its changes since
+    the URL was last scraped with `diff` (see audit). `check_resources` checks
+    the files every page loads; files shared by pages are checked once.
+    `check_duplicates` reports the near-duplicates of every page among the
+    pages of its site scraped before it, and `check_keywords` its TF-IDF
+    keywords and the pages of its site competing for them.
+    """
+    limit = min(concurrency or settings.BATCH_CONCURRENCY, settings.MAX_CONCURRENT_SCRAPES)
+    pending = set()
+    try:
+        async for url in _iterate(urls):
+            url = url.strip()
+            if not url:
+                continue
+            if len(pending) >= limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for item in task.result():
+                        yield item
+            pending.add(asyncio.create_task(_scrape_record(url, fields=fields, diff=diff,
+                                                           check_resources=check_resources,
+                                                           check_duplicates=check_duplicates,
+                                                           check_keywords=check_keywords)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for item in task.result():
+                    yield item
+    finally:
+        # Client went away or the consumer stopped early
+        for task in pending:
+            task.cancel()
+
+
+async def crawl_site(seed, max_pages=None, max_depth=None, concurrency=None, fields=None, graph=None,
+                     check_resources=False, check_duplicates=False, check_keywords=False):
+    """
+    Crawl a site breadth-first from `seed`, yielding each page's item as it finishes
+
+    Internal links of every page are normalized and queued once (see
+    scraper/frontier.py) until `max_pages` pages were scraped or no links
+    within `max_depth` clicks of the seed are left. Each item gets its
+    `crawl_depth`; failed pages yield an error item like in batches.
+    Links are still extracted when `fields` limits the items, and added to
+    `graph` (a scraper.linkgraph.LinkGraph) if one is given.
+    `check_resources`, `check_duplicates` and `check_keywords` work like in
+    scrape_many.
+    """
+    max_pages = max_pages or settings.CRAWL_MAX_PAGES
+    limit = min(concurrency or settings.BATCH_CONCURRENCY, settings.MAX_CONCURRENT_SCRAPES)
+    frontier = Frontier(seed, max_depth=max_depth, capacity=max(max_pages * 20, 10000))
+    scheduled = 0
+    pending = {}
+
+    try:
+        while pending or (frontier and scheduled < max_pages):
+            while frontier and scheduled < max_pages and len(pending) < limit:
+                url, depth = frontier.pop()
+                record = _scrape_record(url, include=('outlinks',), fields=fields, check_resources=check_resources,
+                                        check_duplicates=check_duplicates, check_keywords=check_keywords)
+                pending[asyncio.create_task(record)] = depth
+                scheduled += 1
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                depth = pending.pop(task)
+                for item in task.result():
+                    links = item.pop('outlinks', [])
+                    for link in links:
+                        frontier.add(link, depth + 1)
+                    if graph is not None and 'error' not in item:
+                        graph.add_links(item['url'], links)
+                    item['crawl_depth'] = depth
+                    yield item
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# Graph crawls only need the links, which come with every item
+GRAPH_CRAWL_FIELDS = ('status_code',)
+
+
+async def site_graph(seed, max_pages=None, max_depth=None, concurrency=None, with_sitemap=False):
+    """
+    Crawl a site and yield one item per page of its internal link graph, best PageRank first
+
+    The crawl only extracts links (no SEO analysis). With `with_sitemap` the
+    pages listed in the site's sitemaps are added too, which is how orphan
+    pages (listed but never linked) are found. Pages that failed to load are
+    yielded as error items after the graph; in the graph they are not crawled.
+    """
+    graph = LinkGraph(seed)
+    failures = []
+    async for item in crawl_site(seed, max_pages, max_depth, concurrency, GRAPH_CRAWL_FIELDS, graph):
+        if 'error' in item:
+            failures.append(item)
+    if with_sitemap:
+        try:
+            async for page_url, _ in _sitemap_entries(seed):
+                graph.add_page(page_url)
+        except Exception as e:
+            failures.append(SeoItem(url=seed, error=f"Failed to read sitemaps of {seed}: {str(e)}",
+                                    timestamp=datetime.now().isoformat()))
+    loop = asyncio.get_running_loop()
+    # CPU bound, but a single computation: a thread keeps the event loop free
+    for item in await loop.run_in_executor(_fetch_pool, list, graph.analyze()):
+        yield item
+    for item in failures:
+        yield item
+
+
+async def _sitemap_entries(url, since=None, max_urls=None):
+    """(url, lastmod) of the sitemap scan, read on a fetch thread a chunk at a time"""
+    loop = asyncio.get_running_loop()
+    reader = sitemap.iter_urls(url, since)
+    entries = itertools.islice(reader, max_urls or settings.SITEMAP_MAX_URLS)
+    try:
+        while True:
+            chunk = await loop.run_in_executor(_fetch_pool, list, itertools.islice(entries, 100))
+            for entry in chunk:
+                yield entry
+            if len(chunk) < 100:
+                return
+    finally:
+        try:
+            # Closes the sitemap download still open, if any
+            reader.close()
+        except ValueError:
+            # Cancelled while a chunk is being read on the fetch thread; that read still finishes
+            pass
+
+
+async def scan_sitemap(url, since=None, max_urls=None, concurrency=None, fields=None, diff=False,
+                       check_resources=False, check_duplicates=False, check_keywords=False):
+    """
+    Scrape the pages listed in a site's sitemaps, yielding each item as it finishes
+
+    `url` is a site or a sitemap URL (see scraper/sitemap.py); `since` (an aware
+    datetime) skips pages whose lastmod is older, so a re-audit only scrapes
+    what changed. URLs are read from the sitemaps only as fast as they are
+    scraped and every item gets its `sitemap_lastmod`. A sitemap that cannot
+    be read ends the scan with an error item for it, after the pages already
+    queued are done. `diff`, `check_resources`, `check_duplicates` and
+    `check_keywords` work like in scrape_many.
+    """
+    lastmods = {}
+    failures = []
+
+    async def urls():
+        try:
+            async for page_url, lastmod in _sitemap_entries(url, since, max_urls):
+                lastmods[page_url] = lastmod
+                yield page_url
+        except Exception as e:
+            failures.append(e)
+
+    async for item in scrape_many(urls(), concurrency, fields, diff, check_resources, check_duplicates,
+                                  check_keywords):
+        lastmod = lastmods.pop(item['url'], None)
+        item['sitemap_lastmod'] = lastmod.isoformat() if lastmod else None
+        yield item
+    for e in failures:
+        yield SeoItem(url=url, error=f"Failed to read sitemaps of {url}: {str(e)}", timestamp=datetime.now().isoformat())
+
+
+async def replay_archive(url=None, site=False, since=None, latest=True, fields=None):
+    """
+    Analyse archived pages again (scraper/archive.py), yielding items as they are done
+
+    Selects the pages like archive.Archive.select and hands their record
+    locations, SCRAPER_ARCHIVE_REPLAY_CHUNK at a time and in segment order, to
+    the analysis worker processes, which read and analyse the records; nothing
+    is fetched. At most ANALYSIS_QUEUE_SIZE chunks are in flight, so a replay
+    of any size uses bounded memory. Items come in no particular order.
+    """
+    loop = asyncio.get_running_loop()
+    directory = settings.ARCHIVE_DIR
+
+    def select():
+        reader = archive.Archive(directory)
+        try:
+            return reader.select(url, site, since, latest)
+        finally:
+            reader.close()
+
+    locations = await loop.run_in_executor(_fetch_pool, select)
+    size = max(settings.ARCHIVE_REPLAY_CHUNK, 1)
+    pool = _process_pool or _analysis_pool
+    chunks = (locations[start:start + size] for start in range(0, len(locations), size))
+    pending = set()
+    try:
+        for chunk in chunks:
+            pending.add(loop.run_in_executor(pool, analyze_archived, directory, chunk, (), fields))
+            if len(pending) < settings.ANALYSIS_QUEUE_SIZE:
+                continue
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                for item in future.result():
+                    yield item
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                for item in future.result():
+                    yield item
+    finally:
+        for future in pending:
+            future.cancel()
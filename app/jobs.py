@@ -0,0 +1,103 @@
+import asyncio
+
+from app.engine import audit, scan_sitemap, scrape, scrape_many
+from scraper import jobstore, settings, sitemap
+
+
+# Background jobs: POST /jobs stores the job and returns at once, a fixed set
+# of worker tasks on the event loop runs queued jobs through the scrape engine
+# and writes the items to the job store in batches. Jobs that were queued or
+# running when the process stopped are picked up again at startup.
+
+_queue = None
+_workers = []
+
+
+async def _store(method, *args):
+    # The store does blocking database I/O
+    return await asyncio.to_thread(method, *args)
+
+
+async def start():
+    """Start the workers and requeue unfinished jobs (called from the app lifespan)"""
+    global _queue
+    _queue = asyncio.Queue()
+    store = jobstore.get_store()
+    for job_id in await _store(store.unfinished_jobs):
+        _queue.put_nowait(job_id)
+    for number in range(settings.JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker(), name=f'job-worker-{number}'))
+
+
+async def stop():
+    """Stop the workers; running jobs are restarted from scratch on the next start"""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def submit(kind, params, idempotency_key=None):
+    """
+    Store a job and queue it; returns (job, created)
+
+    A resubmission with a known idempotency key returns the existing job
+    without queueing anything (see jobstore.create_job).
+    """
+    store = jobstore.get_store()
+    job, created = await _store(store.create_job, kind, params, idempotency_key)
+    if created:
+        _queue.put_nowait(job['id'])
+    return job, created
+
+
+async def _worker():
+    store = jobstore.get_store()
+    while True:
+        job_id = await _queue.get()
+        try:
+            job = await _store(store.get_job, job_id)
+            if job is not None and job['status'] in (jobstore.QUEUED, jobstore.RUNNING):
+                await _run(store, job)
+        finally:
+            _queue.task_done()
+
+
+async def _run(store, job):
+    await _store(store.start_job, job['id'])
+    params = job['params']
+    fields = tuple(params['fields']) if params.get('fields') is not None else None
+    check_resources = params.get('resources', False)
+    check_duplicates = params.get('duplicates', False)
+    check_keywords = params.get('keywords', False)
+    try:
+        if job['kind'] == 'scrape':
+            items = await scrape(params['url'], mode=params.get('mode', 'full'), fields=fields,
+                                 check_resources=check_resources, check_duplicates=check_duplicates,
+                                 check_keywords=check_keywords)
+            if params.get('diff'):
+                items = await audit(items)
+            await _store(store.add_results, job['id'], items)
+        else:
+            if job['kind'] == 'batch':
+                items = scrape_many(params['urls'], params.get('concurrency'), fields, params.get('diff', False),
+                                    check_resources, check_duplicates, check_keywords)
+            else:
+                since = sitemap.parse_lastmod(params['since']) if params.get('since') else None
+                items = scan_sitemap(params['sitemap'], since, params.get('max_urls'), params.get('concurrency'), fields,
+                                     params.get('diff', False), check_resources, check_duplicates,
+                                     check_keywords)
+            batch = []
+            async for item in items:
+                batch.append(item)
+                if len(batch) >= settings.JOB_RESULTS_BATCH_SIZE:
+                    await _store(store.add_results, job['id'], batch)
+                    batch = []
+            await _store(store.add_results, job['id'], batch)
+    except asyncio.CancelledError:
+        # Shutting down: the job stays running and is restarted on the next start
+        raise
+    except Exception as e:
+        await _store(store.finish_job, job['id'], str(e))
+    else:
+        await _store(store.finish_job, job['id'])
@@ -1,5 +1,9 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
 import sys
 import os
 from datetime import datetime
@@ -7,12 +11,30 @@ from datetime import datetime
 # Add the parent directory to Python path to import scraper modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from start_scraper import run_spider
+from app import engine, jobs
+from app.engine import audit, scrape, scrape_many, crawl_site, scan_sitemap, site_graph, replay_archive
+from scraper import (
+    analysis, archive, cache, client, frontier, items, jobstore, keywords, memo, metrics, results, scoring, settings,
+    sitemap, snapshots,
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Load shared resources once at startup"""
+    client.warm_up()
+    await jobs.start()
+    yield
+    await jobs.stop()
+    engine.shutdown()
+    archive.close_archive()
+
 
 app = FastAPI(
     title="SEO Scraper API",
     description="A FastAPI-based SEO scraper that extracts metadata from websites",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -23,6 +45,72 @@ class ScrapeResponse(BaseModel):
     results: list = []
 
 
+def _json(content, status_code=200):
+    """JSON response of items (or anything holding them) through items.dumps"""
+    return Response(items.dumps(content), status_code=status_code, media_type='application/json')
+
+
+class BatchRequest(BaseModel):
+    urls: List[str]
+    concurrency: Optional[int] = None
+    diff: bool = False
+    resources: bool = False
+    duplicates: bool = False
+    keywords: bool = False
+    fields: Optional[List[str]] = None
+    profile: Optional[str] = None
+
+
+class JobRequest(BaseModel):
+    url: Optional[str] = None
+    urls: Optional[List[str]] = None
+    sitemap: Optional[str] = None
+    since: Optional[str] = None
+    max_urls: Optional[int] = None
+    mode: str = 'full'
+    fields: Optional[List[str]] = None
+    profile: Optional[str] = None
+    concurrency: Optional[int] = None
+    diff: bool = False
+    resources: bool = False
+    duplicates: bool = False
+    keywords: bool = False
+    idempotency_key: Optional[str] = None
+
+
+class RescoreRequest(BaseModel):
+    rules: Optional[dict] = None
+
+
+def _field_selection(fields, profile):
+    """Resolve the fields= (comma separated or a list) and profile= options, 400 on unknown names"""
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    try:
+        return analysis.resolve_fields(fields or (), profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _crawl_seed(url):
+    """Check a crawl seed before the stream starts, 400 if it is not an http(s) URL with a host"""
+    if not url.startswith(('http://', 'https://')):
+        raise HTTPException(status_code=400, detail="URL must start with http:// or https://")
+    # The same check as the crawl frontier, which would otherwise fail inside the stream
+    if frontier.normalize_url(url) is None:
+        raise HTTPException(status_code=400, detail=f"Invalid seed URL: {url}")
+
+
+def _since(since):
+    """Parse the since= option of sitemap scans, 400 if it is not a W3C date / datetime"""
+    if since is None:
+        return None
+    try:
+        return sitemap.parse_lastmod(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be a date or datetime like 2024-05-01 or 2024-05-01T10:00:00Z")
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -30,12 +118,24 @@ async def root():
 
 
 @app.get("/scrape", response_model=ScrapeResponse)
-async def scrape_website(url: str):
+async def scrape_website(url: str, mode: str = 'full', fields: Optional[str] = None, profile: Optional[str] = None,
+                         debug_timings: bool = False, diff: bool = False, resources: bool = False,
+                         duplicates: bool = False, keywords: bool = False):
     """
     Scrape a website for SEO data
     
     Args:
         url: The URL to scrape (query parameter)
+        mode: 'full' (default) or 'head' to only download and analyse <head>
+        fields: Comma separated field names to return; only the analysis they need runs
+        profile: Named field selection (basic, social, content, links, technical, score)
+        debug_timings: Add the seconds spent per phase (fetch, parse, extract, ...) to the item
+        diff: Return only the fields that changed since the URL's last diff scrape, with old and new values
+        resources: Check the stylesheets, scripts, icons, images and media the page loads
+            (status, size, compression, caching, redirects) and add their totals
+        duplicates: List the pages of the same site scraped before whose content is a near-duplicate
+        keywords: Add the page to its site's keyword index and return its TF-IDF keywords and the
+            pages of the site scraped before that compete for them
     
     Returns:
         JSON response with scraping status
@@ -46,22 +146,419 @@ async def scrape_website(url: str):
     # Validate URL format (basic validation)
     if not url.startswith(('http://', 'https://')):
         raise HTTPException(status_code=400, detail="URL must start with http:// or https://")
+    if mode not in ('full', 'head'):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'head'")
+    selection = _field_selection(fields, profile)
     
     try:
-        # Run the scraper directly (no longer async since we're not using Scrapy)
-        results = run_spider(url)
+        # Fetch and analysis run off the event loop so other requests are not blocked
+        results = await scrape(url, mode=mode, fields=selection, debug_timings=debug_timings,
+                               check_resources=resources, check_duplicates=duplicates,
+                               check_keywords=keywords)
+        if diff:
+            results = await audit(results)
         
-        return ScrapeResponse(
-            message=f"Scraping completed for {url}",
-            url=url,
-            timestamp=datetime.now().isoformat(),
-            results=results
-        )
+        # Same body as ScrapeResponse, encoded by the fast JSON path instead of pydantic
+        return _json({
+            'message': f"Scraping completed for {url}",
+            'url': url,
+            'timestamp': datetime.now().isoformat(),
+            'results': results,
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Scraping failed: {str(e)}")
 
 
+@app.post("/scrape/batch")
+async def scrape_batch(request: Request, concurrency: Optional[int] = None, fields: Optional[str] = None,
+                       profile: Optional[str] = None, diff: bool = False, resources: bool = False,
+                       duplicates: bool = False, keywords: bool = False):
+    """
+    Scrape many URLs and stream the results as NDJSON (one JSON item per line)
+    
+    Body is either JSON ({"urls": [...], "concurrency": 10}) or a plain-text
+    file with one URL per line (Content-Type: text/plain). Items are written as
+    soon as each page finishes, so their order is not the input order. A URL
+    that fails produces {"url": ..., "error": ...} instead of failing the batch.
+    `fields` / `profile` (query or JSON body) limit every item like on /scrape,
+    `diff` turns every item into the page's changes, `resources` checks the
+    files pages load, `duplicates` finds near-duplicate pages and `keywords` adds
+    TF-IDF keywords like on /scrape;
+    a file used by many pages is checked once.
+    """
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('application/json'):
+        try:
+            batch = BatchRequest(**await request.json())
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch request: {str(e)}")
+        urls = batch.urls
+        if concurrency is None:
+            concurrency = batch.concurrency
+        fields = fields or batch.fields
+        profile = profile or batch.profile
+        diff = diff or batch.diff
+        resources = resources or batch.resources
+        duplicates = duplicates or batch.duplicates
+        keywords = keywords or batch.keywords
+    else:
+        # The body has to be read before the response starts streaming; it only
+        # holds the URLs, the results are never accumulated
+        body = await request.body()
+        urls = body.decode('utf-8', errors='ignore').splitlines()
+    
+    if concurrency is not None and concurrency < 1:
+        raise HTTPException(status_code=400, detail="concurrency must be at least 1")
+    selection = _field_selection(fields, profile)
+    
+    async def ndjson():
+        async for item in scrape_many(urls, concurrency, selection, diff, resources, duplicates, keywords):
+            yield items.ndjson_line(item)
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/crawl")
+async def crawl_website(url: str, max_pages: Optional[int] = None, max_depth: Optional[int] = None,
+                        concurrency: Optional[int] = None, fields: Optional[str] = None,
+                        profile: Optional[str] = None, resources: bool = False, duplicates: bool = False,
+                        keywords: bool = False):
+    """
+    Crawl a whole site breadth-first and stream one NDJSON item per page
+    
+    Args:
+        url: Seed URL; only links on the same host are followed
+        max_pages: Stop after this many pages (default SCRAPER_CRAWL_MAX_PAGES)
+        max_depth: Only follow links up to this many clicks from the seed
+        concurrency: Pages scraped in parallel
+        fields / profile: Limit every item like on /scrape
+        resources: Check the files pages load like on /scrape; each file once per crawl
+        duplicates: List the near-duplicates of every page among the pages crawled before it
+        keywords: Add TF-IDF keywords and competing pages like on /scrape
+    """
+    _crawl_seed(url)
+    for name, value in [('max_pages', max_pages), ('concurrency', concurrency)]:
+        if value is not None and value < 1:
+            raise HTTPException(status_code=400, detail=f"{name} must be at least 1")
+    if max_depth is not None and max_depth < 0:
+        raise HTTPException(status_code=400, detail="max_depth must not be negative")
+    selection = _field_selection(fields, profile)
+    
+    async def ndjson():
+        async for item in crawl_site(url, max_pages, max_depth, concurrency, selection, check_resources=resources,
+                                     check_duplicates=duplicates, check_keywords=keywords):
+            yield items.ndjson_line(item)
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/crawl/graph")
+async def crawl_link_graph(url: str, max_pages: Optional[int] = None, max_depth: Optional[int] = None,
+                           concurrency: Optional[int] = None, sitemap: bool = False):
+    """
+    Crawl a site and stream its internal link graph: one NDJSON item per page, best PageRank first
+    
+    Args:
+        url: Seed URL (the homepage); click depths are counted from it
+        max_pages / max_depth / concurrency: Limit the crawl like on /crawl
+        sitemap: Also add the pages listed in the sitemaps, to find orphan pages
+    
+    Each item has the page's pagerank, inlinks, outlink_count, click_depth
+    and orphan flag. The graph is computed once the crawl is done.
+    """
+    _crawl_seed(url)
+    for name, value in [('max_pages', max_pages), ('concurrency', concurrency)]:
+        if value is not None and value < 1:
+            raise HTTPException(status_code=400, detail=f"{name} must be at least 1")
+    if max_depth is not None and max_depth < 0:
+        raise HTTPException(status_code=400, detail="max_depth must not be negative")
+    
+    async def ndjson():
+        async for item in site_graph(url, max_pages, max_depth, concurrency, sitemap):
+            yield items.ndjson_line(item)
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/sitemap")
+async def scan_sitemap_urls(url: str, since: Optional[str] = None, max_urls: Optional[int] = None,
+                            concurrency: Optional[int] = None, fields: Optional[str] = None,
+                            profile: Optional[str] = None, diff: bool = False, resources: bool = False,
+                            duplicates: bool = False, keywords: bool = False):
+    """
+    Scrape every page listed in a site's sitemaps and stream one NDJSON item per page
+    
+    Args:
+        url: Site URL (sitemaps from robots.txt or /sitemap.xml) or a sitemap / sitemap index URL
+        since: Only pages with a lastmod at or after this date (pages without lastmod are included)
+        max_urls: Stop after this many pages (default SCRAPER_SITEMAP_MAX_URLS)
+        concurrency: Pages scraped in parallel
+        fields / profile: Limit every item like on /scrape
+        diff: Return each page's changes since its last diff scrape, like on /scrape
+        resources / duplicates / keywords: Check the files pages load, find near-duplicate pages and add
+            TF-IDF keywords like on /scrape
+    """
+    if not url.startswith(('http://', 'https://')):
+        raise HTTPException(status_code=400, detail="URL must start with http:// or https://")
+    for name, value in [('max_urls', max_urls), ('concurrency', concurrency)]:
+        if value is not None and value < 1:
+            raise HTTPException(status_code=400, detail=f"{name} must be at least 1")
+    since = _since(since)
+    selection = _field_selection(fields, profile)
+    
+    async def ndjson():
+        async for item in scan_sitemap(url, since, max_urls, concurrency, selection, diff, resources, duplicates,
+                                       keywords):
+            yield items.ndjson_line(item)
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/keywords")
+async def keyword_competition(url: str, term: str, limit: int = 20):
+    """
+    Pages of a site competing for a keyword, from the pages scraped with keywords=true
+    
+    Args:
+        url: Any URL of the site
+        term: The keyword (one word)
+        limit: Pages returned at most
+    
+    Pages are ranked by their TF-IDF score for the term; several pages with a
+    high score compete with each other in search results (keyword cannibalization).
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    term = term.strip().lower()
+    
+    def competition():
+        # Ranking every page of the term is CPU bound on large sites: done on a worker thread
+        index = keywords.indexes.find(url)
+        if index is None:
+            return None
+        return {
+            'url': url,
+            'term': term,
+            'pages_indexed': len(index),
+            'document_frequency': index.document_frequency(term),
+            'pages': index.competing(term, limit),
+        }
+    
+    result = await asyncio.to_thread(competition)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No page of this site was scraped with keywords=true")
+    return _json(result)
+
+
+@app.get("/archive/replay")
+async def replay_archived_pages(url: Optional[str] = None, site: bool = False, since: Optional[str] = None,
+                                latest: bool = True, fields: Optional[str] = None, profile: Optional[str] = None):
+    """
+    Analyse archived pages again without fetching them, streamed as NDJSON (one item per line)
+    
+    Args:
+        url: Only this URL's archived fetches; all pages when omitted
+        site: With url, every page of its site
+        since: Only pages fetched from this date / datetime on
+        latest: Only the last fetch of every URL (false replays every fetch)
+        fields: Comma separated field names to return; only the analysis they need runs
+        profile: Named field selection (basic, social, content, links, technical, score)
+    
+    Needs SCRAPER_ARCHIVE_DIR. Pages are read and analysed by the analysis
+    worker processes in parallel; items come in archive order per worker
+    chunk, each with the time its page was fetched as timestamp.
+    """
+    if not settings.ARCHIVE_DIR:
+        raise HTTPException(status_code=404, detail="The page archive is disabled (SCRAPER_ARCHIVE_DIR)")
+    if site and url is None:
+        raise HTTPException(status_code=400, detail="site=true needs a url")
+    selection = _field_selection(fields, profile)
+    since = _since(since)
+    
+    async def ndjson():
+        async for item in replay_archive(url, site, since, latest, selection):
+            yield items.ndjson_line(item)
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/archive/stats")
+async def archive_stats():
+    """Pages, distinct bodies, segments and bytes of the page archive, and what this process archived"""
+    return await asyncio.to_thread(archive.get_stats)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(job: JobRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Queue a scrape ({"url": ...}), a batch ({"urls": [...]}) or a sitemap scan
+    ({"sitemap": ..., "since": ...}) and return its job id at once
+    
+    Poll GET /jobs/{id} for progress and page through GET /jobs/{id}/results.
+    Send an Idempotency-Key header (or idempotency_key in the body) to make
+    retries safe: a known key returns the existing job instead of scraping again.
+    """
+    if [job.url, job.urls, job.sitemap].count(None) != 2:
+        raise HTTPException(status_code=400, detail="Send one of url, urls or sitemap")
+    for url in job.urls if job.urls is not None else [job.url or job.sitemap]:
+        if not url.startswith(('http://', 'https://')):
+            raise HTTPException(status_code=400, detail=f"URL must start with http:// or https://: {url}")
+    if job.mode not in ('full', 'head'):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'head'")
+    if job.url is None and job.mode != 'full':
+        raise HTTPException(status_code=400, detail="Batch and sitemap jobs only support mode 'full'")
+    for name, value in [('concurrency', job.concurrency), ('max_urls', job.max_urls)]:
+        if value is not None and value < 1:
+            raise HTTPException(status_code=400, detail=f"{name} must be at least 1")
+    _since(job.since)
+    selection = _field_selection(job.fields, job.profile)
+    
+    fields = list(selection) if selection is not None else None
+    if job.url is not None:
+        kind, params = 'scrape', {'url': job.url, 'mode': job.mode, 'fields': fields}
+    elif job.urls is not None:
+        kind, params = 'batch', {'urls': job.urls, 'concurrency': job.concurrency, 'fields': fields}
+    else:
+        kind, params = 'sitemap', {'sitemap': job.sitemap, 'since': job.since, 'max_urls': job.max_urls,
+                                   'concurrency': job.concurrency, 'fields': fields}
+    params['diff'] = job.diff
+    params['resources'] = job.resources
+    params['duplicates'] = job.duplicates
+    params['keywords'] = job.keywords
+    try:
+        created_job, created = await jobs.submit(kind, params, idempotency_key or job.idempotency_key)
+    except jobstore.IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(_job_status(created_job), status_code=202 if created else 200)
+
+
+def _job_status(job):
+    params = job['params']
+    if job['kind'] == 'scrape':
+        total = 1
+    elif job['kind'] == 'batch':
+        total = len(params['urls'])
+    else:
+        # Sitemap scans only know their size once the sitemaps are read
+        total = None
+    return {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'total': total,
+        'completed': job['completed'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'results_url': f"/jobs/{job['id']}/results",
+    }
+
+
+async def _get_job(job_id):
+    job = await asyncio.to_thread(jobstore.get_store().get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of a background job"""
+    return _job_status(await _get_job(job_id))
+
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = 0, limit: int = 100):
+    """
+    One page of a job's result items, in the order they finished
+    
+    Available while the job is still running; next_offset is null once the
+    job is finished and every result was returned.
+    """
+    if offset < 0 or not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 1000")
+    job = await _get_job(job_id)
+    results = await asyncio.to_thread(jobstore.get_store().get_results, job_id, offset, limit)
+    more = len(results) == limit or job['status'] in (jobstore.QUEUED, jobstore.RUNNING)
+    return _json({
+        'job_id': job_id,
+        'status': job['status'],
+        'offset': offset,
+        'limit': limit,
+        'results': results,
+        'next_offset': offset + len(results) if more else None,
+    })
+
+
+@app.post("/jobs/{job_id}/rescore")
+async def rescore_job_results(job_id: str, request: Optional[RescoreRequest] = None):
+    """
+    Recompute seo_score and seo_recommendations of a finished job's stored results
+    
+    Uses the rules in the body ({"rules": {"score": [...], "recommendations":
+    [...]}}, see GET /scoring/rules) or the server's rules. Nothing is fetched
+    again; results stored without the fields the rules read are skipped.
+    """
+    rules = scoring.rules
+    if request is not None and request.rules is not None:
+        try:
+            rules = scoring.RuleSet.from_dict(request.rules)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    job = await _get_job(job_id)
+    if job['status'] in (jobstore.QUEUED, jobstore.RUNNING):
+        raise HTTPException(status_code=409, detail="Job is still running")
+    rescored, changed, skipped = await asyncio.to_thread(jobstore.get_store().rescore_results, job_id, rules)
+    return {'job_id': job_id, 'rescored': rescored, 'changed': changed, 'skipped': skipped}
+
+
+@app.get("/scoring/rules")
+async def get_scoring_rules():
+    """The scoring and recommendation rules pages are scored with, in the JSON form SCRAPER_SCORE_RULES takes"""
+    return scoring.rules.to_dict()
+
+
+@app.get("/jobs/{job_id}/export")
+async def export_job_results(job_id: str, format: str = 'csv'):
+    """
+    Stream all results of a job as csv, ndjson, arrow (IPC stream) or parquet
+    
+    Rows are read from the store in chunks and written out as they come, so
+    exports of any size use constant memory. Arrow and Parquet need pyarrow.
+    """
+    try:
+        writer, media_type, extension = results.exporter(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = await _get_job(job_id)
+    fields = job['params'].get('fields')
+    if job['params'].get('diff'):
+        # Diff items only hold the changes, whatever fields were compared
+        fields = list(snapshots.DIFF_FIELDS)
+    if fields is not None and job['kind'] == 'sitemap':
+        fields = fields + ['sitemap_lastmod']
+    chunks = jobstore.get_store().iter_result_rows(job_id)
+    # A plain generator: StreamingResponse iterates it in a worker thread
+    return StreamingResponse(writer(chunks, fields), media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="{job_id}.{extension}"'})
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Response cache counters (hits, 304 revalidations, misses, bytes saved) and analysis memo counters"""
+    stats = cache.get_stats()
+    stats['memo'] = memo.get_stats()
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Phase timings, response sizes, parse node counts, errors and scrapes in flight in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -0,0 +1,124 @@
+"""
+Benchmark: page archive writes, index lookups, raw reads and parallel replay
+
+Usage:
+    python benchmarks/bench_archive.py [--pages 10000] [--duplicates 0.3] [--processes 4]
+
+Pages are built from the fixtures (the large ones left out) into a temporary
+archive; a `--duplicates` share of them repeats an earlier body and is stored
+as a revisit record. Every page is first read back and checked to have the
+body, status and headers it was written with; the run stops on the first
+difference. Then it reports how fast pages are archived, looked up by URL,
+read and analysed again, inline and in `--processes` worker processes.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fixtures
+from scraper import archive, settings
+from start_scraper import analyze_archived
+
+
+def generate_pages(count, duplicates, rng):
+    """(url, response) pairs; a `duplicates` share repeats the body of an earlier page"""
+    bodies = [html for name, html in fixtures.corpus().items() if len(html) < 64 * 1024]
+    pages, distinct = [], []
+    for index in range(count):
+        if distinct and rng.random() < duplicates:
+            body = rng.choice(distinct)
+        else:
+            body = rng.choice(bodies) + f'<!-- page {index} -->'.encode()
+            distinct.append(body)
+        url = f'https://site{index % 20}.bench.local/page/{index}'
+        headers = {'Content-Type': 'text/html; charset=utf-8', 'Content-Encoding': 'gzip',
+                   'Server': 'bench', 'Cache-Control': 'max-age=600'}
+        pages.append((url, SimpleNamespace(url=url, status_code=200, reason='OK', headers=headers, content=body)))
+    return pages
+
+
+def check_parity(directory, pages):
+    reader = archive.Archive(directory)
+    try:
+        for (url, response), location in zip(pages, sorted(reader.select(latest=False), key=lambda l: l[:2])):
+            stored = reader.read(location)
+            expected = (url, response.status_code, response.content, response.headers)
+            actual = (stored.requested_url, stored.status_code, stored.content, dict(stored.headers))
+            if expected != actual:
+                sys.exit(f'Parity check failed for {url}:\n  written {expected[:2]}\n  read    {actual[:2]}')
+    finally:
+        reader.close()
+
+
+def replay(directory, locations, processes):
+    size = settings.ARCHIVE_REPLAY_CHUNK
+    chunks = [locations[start:start + size] for start in range(0, len(locations), size)]
+    if not processes:
+        return sum(len(analyze_archived(directory, chunk)) for chunk in chunks)
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        # Includes starting the workers, which the API keeps running between replays
+        return sum(len(items) for items in pool.map(analyze_archived, [directory] * len(chunks), chunks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10000)
+    parser.add_argument('--duplicates', type=float, default=0.3)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--replay-pages', type=int, default=1000, help='pages analysed again per replay run')
+    args = parser.parse_args()
+
+    pages = generate_pages(args.pages, args.duplicates, random.Random(0))
+    body_bytes = sum(len(response.content) for _, response in pages)
+    with tempfile.TemporaryDirectory() as directory:
+        writer = archive.Archive(directory, writable=True)
+        fetched = datetime(2024, 5, 1, tzinfo=timezone.utc)
+        start = time.perf_counter()
+        revisits = 0
+        for index, (url, response) in enumerate(pages):
+            revisits += writer.add(url, response, 'bench', fetched + timedelta(seconds=index)) == 'revisit'
+        writer.close()
+        elapsed = time.perf_counter() - start
+        stored = sum(os.path.getsize(writer.segment_path(segment)) for segment in writer.segments())
+        print(f'Write: {args.pages} pages ({body_bytes / 2 ** 20:.1f} MB of bodies) in {elapsed:.2f}s,'
+              f' {args.pages / elapsed:.0f} pages/s; {revisits} revisits, {stored / 2 ** 20:.1f} MB on disk')
+
+        check_parity(directory, pages)
+        print(f'Parity: {args.pages} pages read back identical')
+
+        reader = archive.Archive(directory)
+        start = time.perf_counter()
+        for url, _ in pages[:10000]:
+            reader.select(url)
+        elapsed = time.perf_counter() - start
+        print(f'Lookup: {min(args.pages, 10000)} URLs in {elapsed:.2f}s ({elapsed / min(args.pages, 10000) * 1e6:.0f} µs each)')
+
+        start = time.perf_counter()
+        locations = reader.select(latest=False)
+        read_bytes = sum(len(reader.read(location).content) for location in locations)
+        elapsed = time.perf_counter() - start
+        print(f'Read: {len(locations)} pages in {elapsed:.2f}s, {len(locations) / elapsed:.0f} pages/s,'
+              f' {read_bytes / 2 ** 20 / elapsed:.0f} MB/s of bodies')
+        reader.close()
+
+        locations = locations[:args.replay_pages]
+        for processes in (0, args.processes):
+            start = time.perf_counter()
+            replayed = replay(directory, locations, processes)
+            elapsed = time.perf_counter() - start
+            label = f'{processes} processes' if processes else 'inline'
+            print(f'Replay ({label}): {replayed} pages analysed in {elapsed:.2f}s,'
+                  f' {replayed / elapsed:.0f} pages/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark: single-pass extraction engine vs the old one-find_all-per-field code
+
+Usage:
+    python benchmarks/bench_extract.py [--repeat 5]
+
+Pages are generated in memory, so the benchmark runs offline. For each page
+size and parser it reports the time spent parsing and the time spent
+extracting fields from the already parsed tree.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from scraper import extract
+
+WORDS = ('search engine optimization content ranking page website readability keyword '
+         'analysis marketing quick brown fox jumps over the lazy dog').split()
+
+
+def generate_page(sections, seed=0):
+    """Build a synthetic page with headings, paragraphs, links, images and scripts"""
+    rng = random.Random(seed)
+
+    def sentence():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))).capitalize() + '.'
+
+    parts = ['<!DOCTYPE html><html lang="en"><head><title>Benchmark page</title>',
+             '<meta name="description" content="Synthetic benchmark page">',
+             '<meta property="og:title" content="Benchmark"><link rel="stylesheet" href="/app.min.css">',
+             '<script src="https://www.googletagmanager.com/gtag/js"></script></head><body>',
+             '<header><nav><a href="/">Home</a><a href="/about">About</a></nav></header>']
+    for i in range(sections):
+        level = rng.randint(1, 4)
+        parts.append(f'<h{level}>Section {i}</h{level}>')
+        parts.append('<p>' + ' '.join(sentence() for _ in range(rng.randint(2, 6))) + '</p>')
+        parts.append(f'<p><a href="/page/{i}">Page {i}</a> <a href="https://example{i % 50}.com/">Ref</a></p>')
+        if i % 5 == 0:
+            parts.append(f'<img src="/img/{i}.jpg" alt="Image {i}"><ul><li>One</li><li>Two</li></ul>')
+    parts.append('<footer><p>Footer</p></footer></body></html>')
+    return ''.join(parts)
+
+
+def legacy_extract(soup, url):
+    """The previous extraction: one soup.find/find_all traversal per field, then decompose()"""
+    item = {}
+    title_tag = soup.find('title')
+    item['title'] = title_tag.get_text().strip() if title_tag else ''
+    for name in ['description', 'keywords', 'twitter:card', 'twitter:title', 'twitter:description', 'robots', 'viewport']:
+        tag = soup.find('meta', attrs={'name': name})
+        item[name] = tag.get('content', '') if tag else ''
+    for prop in ['og:title', 'og:description', 'og:image', 'og:url']:
+        tag = soup.find('meta', attrs={'property': prop})
+        item[prop] = tag.get('content', '') if tag else ''
+    canonical = soup.find('link', attrs={'rel': 'canonical'})
+    item['canonical_url'] = canonical.get('href', '') if canonical else ''
+    item['alternate_links'] = [link.get('href', '') for link in soup.find_all('link', attrs={'rel': 'alternate'})]
+    for level in range(1, 7):
+        item[f'h{level}'] = [h.get_text().strip() for h in soup.find_all(f'h{level}')]
+
+    for script in soup(["script", "style", "nav", "footer", "header"]):
+        script.decompose()
+    # Same word statistics as the engine, so only the tree traversal differs
+    extract.content_fields(SimpleNamespace(text=soup.get_text(), url=url), item)
+
+    paragraphs = soup.find_all('p')
+    item['paragraphs_with_text'] = len([p for p in paragraphs if p.get_text().strip()])
+    all_links = soup.find_all('a', href=True)
+    item['internal'] = [link for link in all_links if url in link.get('href', '')]
+    item['link_texts'] = [link.get_text().strip() for link in all_links if link.get_text().strip()]
+    item['images'] = [img.get('src', '') for img in soup.find_all('img')]
+    item['videos'] = len(soup.find_all(['video', 'iframe']))
+    for name in ['audio', 'form', 'table', 'ul', 'ol', 'style']:
+        item[name] = len(soup.find_all(name))
+    item['css'] = [css.get('href', '') for css in soup.find_all('link', rel='stylesheet')]
+    item['js'] = [js.get('src', '') for js in soup.find_all('script', src=True)]
+    item['inline_js'] = len(soup.find_all('script', src=False))
+    item['charset'] = soup.find('meta', attrs={'charset': True})
+    item['meta'] = len(soup.find_all('meta'))
+    item['schema'] = len(soup.find_all('script', type='application/ld+json'))
+    item['ga'] = len(soup.find_all('script', src=re.compile(r'google-analytics|gtag|googletagmanager')))
+    item['fb'] = len(soup.find_all('script', src=re.compile(r'facebook|fbevents')))
+    return item
+
+
+def best_of(repeat, func):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    url = 'https://example.com'
+    print(f"{'page':>8} {'parser':>12} {'parse ms':>10} {'legacy ms':>10} {'single ms':>10} {'speedup':>8}")
+    for sections in [100, 1000, 5000]:
+        html = generate_page(sections)
+        for parser_name in ['html.parser', 'lxml']:
+            parse_time = best_of(args.repeat, lambda: BeautifulSoup(html, parser_name))
+            # legacy_extract decomposes tags, so it needs a fresh tree every run (not timed)
+            legacy_time = float('inf')
+            for _ in range(args.repeat):
+                soup = BeautifulSoup(html, parser_name)
+                start = time.perf_counter()
+                legacy_extract(soup, url)
+                legacy_time = min(legacy_time, time.perf_counter() - start)
+            # The single pass does not mutate the tree, so one parse is reused
+            soup = BeautifulSoup(html, parser_name)
+            single_time = best_of(args.repeat, lambda: extract.extract_from_soup(soup, url, {}))
+            size = f'{len(html) // 1024}KB'
+            print(f'{size:>8} {parser_name:>12} {parse_time * 1000:>10.1f} {legacy_time * 1000:>10.1f} '
+                  f'{single_time * 1000:>10.1f} {legacy_time / single_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Benchmark: rule-based SEO scoring vs the old if-chain, with a parity check
+
+Usage:
+    python benchmarks/bench_scoring.py [--rows 1000000]
+
+Items are generated in memory with values around every rule's threshold, and
+the fixture pages are analysed for real ones. Every item is first checked to
+get exactly the same seo_score and seo_recommendations from the old code,
+from RuleSet.score and from RuleSet.score_columns; the run stops on the first
+difference. Then `--rows` items are scored one by one and as columns, and
+the results of a stored job of `--store-rows` items are rescored.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fixtures
+from scraper import analysis, jobstore, scoring
+
+CHUNK = 1000
+
+
+def legacy_score(item):
+    """The previous score_page: one hardcoded if per rule"""
+    seo_score = 0
+    if item['title']: seo_score += 5
+    if item['meta_description']: seo_score += 5
+    if item['canonical_url']: seo_score += 3
+    if item['h1_count'] == 1: seo_score += 5
+    if item['images_with_alt'] > 0: seo_score += 3
+    if item['has_ssl']: seo_score += 4
+    if item['total_words'] > 300: seo_score += 5
+    if item['total_words'] > 1000: seo_score += 5
+    if item['paragraph_count'] > 5: seo_score += 3
+    if item['sentence_count'] > 10: seo_score += 3
+    if item['flesch_reading_ease'] > 60: seo_score += 4
+    if item['unique_words'] > 100: seo_score += 5
+    if item['mobile_friendly']: seo_score += 5
+    if item['og_title']: seo_score += 3
+    if item['og_description']: seo_score += 3
+    if item['twitter_card']: seo_score += 3
+    if item['schema_scripts'] > 0: seo_score += 5
+    if item['robots_directive']: seo_score += 3
+    if item['language']: seo_score += 3
+    if item['internal_links'] > 5: seo_score += 5
+    if item['external_links'] > 0: seo_score += 3
+    if item['total_links'] > 10: seo_score += 4
+    if item['nofollow_links'] < item['total_links'] * 0.5: seo_score += 3
+    if item['images_with_alt'] > item['total_images'] * 0.8: seo_score += 5
+    if item['video_count'] > 0: seo_score += 3
+    if item['css_files']: seo_score += 2
+    item['seo_score'] = min(seo_score, 100)
+
+    recommendations = []
+    if not item['title']: recommendations.append("Missing page title")
+    if not item['meta_description']: recommendations.append("Missing meta description")
+    if item['h1_count'] == 0: recommendations.append("Missing H1 tag")
+    if item['h1_count'] > 1: recommendations.append("Multiple H1 tags found")
+    if item['images_without_alt'] > 0: recommendations.append(f"{item['images_without_alt']} images missing alt text")
+    if not item['has_ssl']: recommendations.append("Website not using HTTPS")
+    if not item['mobile_friendly']: recommendations.append("No viewport meta tag for mobile")
+    if item['total_words'] < 300: recommendations.append("Content too short (less than 300 words)")
+    if item['flesch_reading_ease'] < 60: recommendations.append("Content may be too complex to read")
+    if item['nofollow_links'] > item['total_links'] * 0.5: recommendations.append("Too many nofollow links")
+    if not item['og_title']: recommendations.append("Missing Open Graph title")
+    if not item['og_description']: recommendations.append("Missing Open Graph description")
+    if not item['twitter_card']: recommendations.append("Missing Twitter Card")
+    if item['schema_scripts'] == 0: recommendations.append("No structured data found")
+    if not item['robots_directive']: recommendations.append("No robots meta tag")
+    item['seo_recommendations'] = recommendations
+
+
+def generate_item(rng):
+    """Random field values, many of them on or next to a threshold"""
+    def text():
+        return rng.choice([None, '', 'Some text'])
+
+    total_links = rng.choice([0, 1, 10, 11, 40])
+    total_images = rng.choice([0, 1, 5, 10])
+    images_with_alt = rng.randint(0, total_images)
+    return {
+        'title': text(), 'meta_description': text(), 'canonical_url': text(), 'og_title': text(),
+        'og_description': text(), 'twitter_card': text(), 'robots_directive': text(), 'language': text(),
+        'h1_count': rng.choice([0, 1, 2]),
+        'images_with_alt': images_with_alt,
+        'images_without_alt': total_images - images_with_alt,
+        'total_images': total_images,
+        'has_ssl': rng.random() < 0.5,
+        'mobile_friendly': rng.random() < 0.5,
+        'total_words': rng.choice([0, 299, 300, 301, 1000, 1001, 2500]),
+        'unique_words': rng.choice([0, 100, 101, 800]),
+        'paragraph_count': rng.choice([0, 5, 6]),
+        'sentence_count': rng.choice([0, 10, 11]),
+        'flesch_reading_ease': rng.choice([0, 59.99, 60, 60.01, 85.5, -12.3]),
+        'schema_scripts': rng.choice([0, 1]),
+        'internal_links': rng.choice([0, 5, 6]),
+        'external_links': rng.choice([0, 1]),
+        'total_links': total_links,
+        'nofollow_links': rng.randint(0, total_links),
+        'video_count': rng.choice([0, 1]),
+        'css_files': rng.choice([[], ['/app.css']]),
+    }
+
+
+def analysed_items():
+    items = []
+    for name, html in fixtures.corpus().items():
+        for url in ('https://bench.local/', 'http://bench.local/'):
+            item = analysis.analyze_document(url, html, {'content-type': 'text/html; charset=utf-8'})
+            items.append(item)
+    return items
+
+
+def check_parity(items):
+    rules = scoring.RuleSet()
+    expected = []
+    for item in items:
+        legacy, new = dict(item), dict(item)
+        legacy_score(legacy)
+        rules.score(new)
+        result = (legacy['seo_score'], legacy['seo_recommendations'])
+        if result != (new['seo_score'], new['seo_recommendations']):
+            sys.exit(f'Parity check failed (RuleSet.score) for {item}:\n  legacy {result}\n'
+                     f'  new    {(new["seo_score"], new["seo_recommendations"])}')
+        expected.append(result)
+    scores, recommendations = rules.score_columns(scoring.columns(items, rules.requires))
+    for item, result, actual in zip(items, expected, zip(scores, recommendations)):
+        if result != actual:
+            sys.exit(f'Parity check failed (RuleSet.score_columns) for {item}:\n  legacy {result}\n  new    {actual}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--store-rows', type=int, default=100000, help='results in a temporary SQLite job; 0 to skip')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    items = analysed_items() + [generate_item(rng) for _ in range(20000)]
+    check_parity(items)
+    print(f'Parity: {len(items)} items identical')
+
+    rows = [items[index % len(items)] for index in range(args.rows)]
+    rules = scoring.RuleSet()
+
+    start = time.perf_counter()
+    for item in rows:
+        legacy_score(dict(item))
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for item in rows:
+        rules.score(dict(item))
+    single = time.perf_counter() - start
+
+    # In chunks, as stored results are rescored
+    chunks = [scoring.columns(rows[start:start + CHUNK], rules.requires) for start in range(0, len(rows), CHUNK)]
+    start = time.perf_counter()
+    for chunk in chunks:
+        rules.score_columns(chunk)
+    batch = time.perf_counter() - start
+
+    print(f'{args.rows} rows: legacy {legacy:.2f}s, rules per item {single:.2f}s, rules as columns {batch:.2f}s')
+
+    if args.store_rows:
+        with tempfile.TemporaryDirectory() as directory:
+            store = jobstore.SQLiteJobStore(os.path.join(directory, 'jobs.sqlite3'))
+            job, _ = store.create_job('batch', {'urls': []})
+            for start in range(0, args.store_rows, CHUNK):
+                batch_items = []
+                for index in range(start, min(start + CHUNK, args.store_rows)):
+                    item = dict(items[index % len(items)], url=f'https://bench.local/{index}')
+                    legacy_score(item)
+                    batch_items.append(item)
+                store.add_results(job['id'], batch_items)
+            # A rule change that moves some scores, then the default rules again
+            changed_rules = scoring.RuleSet.from_dict(dict(rules.to_dict(), score=[
+                [field, predicate, operand, 10 if field == 'h1_count' else points]
+                for field, predicate, operand, points in rules.to_dict()['score']]))
+            for name, rule_set in (('changed rules', changed_rules), ('default rules', rules)):
+                start = time.perf_counter()
+                rescored, changed, skipped = store.rescore_results(job['id'], rule_set)
+                elapsed = time.perf_counter() - start
+                print(f'Stored job of {args.store_rows} results rescored with {name} in {elapsed:.2f}s'
+                      f' ({rescored} rescored, {changed} changed, {skipped} skipped)')
+
+
+if __name__ == '__main__':
+    main()
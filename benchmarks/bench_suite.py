@@ -0,0 +1,241 @@
+"""
+Benchmark suite: end-to-end latency, per-phase cost, peak memory and API throughput
+
+Usage:
+    python benchmarks/bench_suite.py [--repeat 5] [--latency 0.02] [--output bench.json]
+    python benchmarks/bench_suite.py --compare old.json [--threshold 10]
+
+Everything runs offline: the fixture corpus (benchmarks/fixtures.py) is served
+by an in-process HTTP server (benchmarks/server.py) that can add latency to
+every response. The response cache and the analysis memo are disabled so every
+run does the full work. Results are written as JSON; --compare prints the
+change of every metric against an earlier file and exits with 1 if any got
+slower or bigger by more than --threshold percent.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Measure the work itself, not the caches or per-host rate limits; no truncation of the 10 MB fixture
+os.environ['SCRAPER_CACHE'] = 'off'
+os.environ['SCRAPER_MEMO_MAX_ENTRIES'] = '0'
+os.environ['SCRAPER_POLITENESS'] = 'off'
+os.environ.setdefault('SCRAPER_MAX_BODY_BYTES', str(64 * 1024 * 1024))
+
+import requests
+
+import start_scraper
+from fixtures import corpus
+from scraper import analysis, extract, settings, textstats
+from server import FixtureServer
+
+CONTENT_GROUP = 'content_fields'
+
+
+def _timed(func, repeat):
+    """Median and min seconds of repeat calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'median_ms': round(statistics.median(times) * 1000, 3), 'min_ms': round(min(times) * 1000, 3)}
+
+
+def end_to_end(server, names, repeat):
+    return {name: _timed(lambda: start_scraper.run_spider(server.url(name)), repeat) for name in names}
+
+
+def phases(server, names, repeat):
+    """Cost of each stage of run_spider measured on its own"""
+    other_groups = [group.__name__ for group, *_ in extract.FIELD_GROUPS if group.__name__ != CONTENT_GROUP]
+    result = {}
+    for name in names:
+        url = server.url(name)
+        response, _ = start_scraper.fetch_page(url)
+        html = analysis.decode_body(response.content, {k.lower(): v for k, v in response.headers.items()})
+        soup = extract.parse_html(html)
+        text = extract.Page(url, soup, (), ()).text
+        item = analysis.analyze_document(url, response.content, {'content-type': response.headers.get('content-type', '')})
+        result[name] = {
+            'fetch': _timed(lambda: start_scraper.fetch_page(url), repeat),
+            'parse': _timed(lambda: extract.parse_html(html), repeat),
+            'extract': _timed(lambda: extract.extract_from_soup(soup, url, {}, groups=other_groups), repeat),
+            'text_stats': _timed(lambda: textstats.text_statistics(text), repeat),
+            'scoring': _timed(lambda: analysis.score_page(dict(item)), repeat),
+        }
+    return result
+
+
+def memory(server, names):
+    """Peak Python heap allocated during one run_spider call"""
+    result = {}
+    for name in names:
+        tracemalloc.start()
+        start_scraper.run_spider(server.url(name))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result[name] = {'peak_mb': round(peak / 1024 / 1024, 2)}
+    return result
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def throughput(server, fixture, requests_count, concurrency):
+    """Requests per second and latency percentiles of GET /scrape under concurrent load"""
+    import uvicorn
+    from app.main import app
+
+    port = _free_port()
+    api = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=api.run, daemon=True)
+    thread.start()
+    while not api.started:
+        time.sleep(0.05)
+
+    local = threading.local()
+    target = f'http://127.0.0.1:{port}/scrape'
+
+    def one(_):
+        session = getattr(local, 'session', None) or requests.Session()
+        local.session = session
+        start = time.perf_counter()
+        response = session.get(target, params={'url': server.url(fixture)}, timeout=120)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    try:
+        one(None)  # warm up the worker processes
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = sorted(pool.map(one, range(requests_count)))
+        elapsed = time.perf_counter() - start
+    finally:
+        api.should_exit = True
+        thread.join()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+
+    return {'fixture': fixture, 'requests': requests_count, 'concurrency': concurrency,
+            'requests_per_second': round(requests_count / elapsed, 2),
+            'p50_ms': percentile(0.5), 'p95_ms': percentile(0.95), 'max_ms': round(latencies[-1] * 1000, 3)}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _metrics(data, prefix=''):
+    """Flatten the numeric leaves of a result file into {path: value}"""
+    metrics = {}
+    for key, value in data.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            metrics.update(_metrics(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[path] = value
+    return metrics
+
+
+def compare(old, new, threshold):
+    """Print the change of every metric; returns True if one regressed beyond threshold percent"""
+    old_metrics, new_metrics = _metrics(old['results']), _metrics(new['results'])
+    regressed = False
+    print(f"{'metric':<48} {'old':>10} {'new':>10} {'change':>8}")
+    for path in sorted(set(old_metrics) & set(new_metrics)):
+        before, after = old_metrics[path], new_metrics[path]
+        if path.endswith(('requests', 'concurrency')) or not before:
+            continue
+        change = (after - before) / before * 100
+        # Throughput regresses when it drops, everything else when it grows
+        worse = -change if path.endswith('requests_per_second') else change
+        flag = '  <-- regression' if worse > threshold else ''
+        regressed = regressed or bool(flag)
+        print(f'{path:<48} {before:>10.3f} {after:>10.3f} {change:>+7.1f}%{flag}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fixtures', default=None, help='comma separated fixture names (default: all)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--load-requests', type=int, default=200)
+    parser.add_argument('--load-concurrency', type=int, default=20)
+    parser.add_argument('--load-fixture', default='typical')
+    parser.add_argument('--skip-load', action='store_true', help='do not measure /scrape throughput')
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', metavar='OLD_JSON', help='compare the new results with an earlier file')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    args = parser.parse_args()
+
+    pages = corpus()
+    names = args.fixtures.split(',') if args.fixtures else list(pages)
+    results = {}
+    with FixtureServer(pages, latency=args.latency) as server:
+        print('end to end ...')
+        results['end_to_end'] = end_to_end(server, names, args.repeat)
+        print('phases ...')
+        results['phases'] = phases(server, names, args.repeat)
+        print('memory ...')
+        results['memory'] = memory(server, names)
+        if not args.skip_load:
+            print('throughput ...')
+            results['throughput'] = throughput(server, args.load_fixture, args.load_requests, args.load_concurrency)
+
+    report = {
+        'meta': {
+            'commit': _commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'html_parser': settings.HTML_PARSER,
+            'repeat': args.repeat,
+            'latency': args.latency,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    for name in names:
+        phase = results['phases'][name]
+        print(f"{name:>10} total {results['end_to_end'][name]['median_ms']:>9.1f} ms  "
+              + '  '.join(f"{key} {value['median_ms']:.1f}" for key, value in phase.items())
+              + f"  peak {results['memory'][name]['peak_mb']} MB")
+    if 'throughput' in results:
+        print('throughput', results['throughput'])
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        sys.exit(1 if compare(old, report, args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: text statistics engine vs the old per-word loops, with a parity check
+
+Usage:
+    python benchmarks/bench_textstats.py [--repeat 5]
+
+Texts are generated in memory (plus a few edge cases), so the benchmark runs
+offline. Every text is first checked to produce exactly the same fields with
+both implementations; the run stops on the first difference.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper import textstats
+
+WORDS = ('search engine optimization content ranking page website readability keyword '
+         'analysis marketing quick brown fox jumps over the lazy dog a an of to '
+         'Über café naïve 2024 e-mail x_y').split()
+PUNCTUATION = ['.', '!', '?', '...', '?!', ',', ';', ' -', '\n', '\t', '  ']
+
+EDGE_CASES = ['', '   ', '...', 'Word', 'no punctuation at all', '!!!Hello!!! world?? ok.',
+              'a.b.c', 'Tie tie tie bar bar bar foo foo foo', ' spaced out.　Sentence!']
+
+
+def generate_text(words, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(WORDS))
+        parts.append(rng.choice(PUNCTUATION) if rng.random() < 0.12 else ' ')
+    return ''.join(parts)
+
+
+def legacy_statistics(text):
+    """The previous content analysis: dict-get counting, full sort, regex per word"""
+    item = {}
+    words = re.findall(r'\b\w+\b', text.lower())
+    item['total_words'] = len(words)
+    item['unique_words'] = len(set(words))
+
+    word_freq = {}
+    for word in words:
+        if len(word) > 2:
+            word_freq[word] = word_freq.get(word, 0) + 1
+    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+    item['top_keywords'] = sorted_words[:20]
+    item['keyword_density'] = {word: round((count/len(words)*100), 2) for word, count in sorted_words[:10]}
+
+    sentences = re.split(r'[.!?]+', text)
+    sentences = [s.strip() for s in sentences if s.strip()]
+    item['sentence_count'] = len(sentences)
+    item['avg_sentence_length'] = round(sum(len(s.split()) for s in sentences) / len(sentences), 2) if sentences else 0
+
+    syllables = 0
+    for word in words:
+        syllables += len(re.findall(r'[aeiouy]+', word.lower()))
+    item['avg_syllables_per_word'] = round(syllables / len(words), 2) if words else 0
+
+    if item['avg_sentence_length'] > 0 and item['avg_syllables_per_word'] > 0:
+        item['flesch_reading_ease'] = round(206.835 - (1.015 * item['avg_sentence_length']) - (84.6 * item['avg_syllables_per_word']), 2)
+    else:
+        item['flesch_reading_ease'] = 0
+    return item
+
+
+def best_time(func, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    texts = EDGE_CASES + [generate_text(random.Random(seed).randint(1, 300), seed) for seed in range(300)]
+    for text in texts:
+        expected, actual = legacy_statistics(text), textstats.text_statistics(text)
+        if expected != actual:
+            sys.exit(f'Parity check failed for {text[:60]!r}:\n  legacy {expected}\n  new    {actual}')
+    print(f'Parity: {len(texts)} texts identical')
+
+    print(f'{"words":>8} {"legacy ms":>10} {"new ms":>10} {"speedup":>8}')
+    for size in (1000, 10000, 100000):
+        text = generate_text(size, seed=size)
+        legacy = best_time(legacy_statistics, text, args.repeat)
+        new = best_time(textstats.text_statistics, text, args.repeat)
+        print(f'{size:>8} {legacy * 1000:>10.2f} {new * 1000:>10.2f} {legacy / new:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+HTML fixture corpus for the benchmarks
+
+Pages are generated deterministically in memory (nothing large is committed),
+each stressing a different part of the analysis. `corpus()` returns
+{name: html bytes}; `python benchmarks/fixtures.py DIR` writes them to disk.
+"""
+import json
+import os
+import random
+import sys
+
+WORDS = ('search engine optimization content ranking page website readability keyword '
+         'analysis marketing quick brown fox jumps over the lazy dog performance crawler '
+         'structured data heading paragraph image link audit').split()
+
+FOOTER = '</main><footer><p>Footer text</p></footer></body></html>'
+
+
+def _sentence(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))).capitalize() + rng.choice('..!?')
+
+
+def _head(title, extra=''):
+    return ('<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+            f'<title>{title}</title>'
+            '<meta name="description" content="Benchmark fixture page used to measure the SEO scraper.">'
+            '<meta name="viewport" content="width=device-width, initial-scale=1">'
+            '<meta property="og:title" content="Fixture"><meta name="twitter:card" content="summary">'
+            '<link rel="canonical" href="https://bench.local/"><link rel="stylesheet" href="/app.min.css">'
+            '<script src="https://www.googletagmanager.com/gtag/js?id=G-1"></script>'
+            f'{extra}</head>')
+
+
+def _body(rng, sections, links_per_section=2, images_per_section=0.2, headings_per_section=1):
+    parts = ['<body><header><nav><a href="/">Home</a><a href="/about">About</a><a href="/contact">Contact</a></nav></header><main>']
+    for i in range(sections):
+        for _ in range(headings_per_section):
+            level = rng.randint(1, 4) if i else 1
+            parts.append(f'<h{level}>Section {i} {rng.choice(WORDS)}</h{level}>')
+        parts.append('<p>' + ' '.join(_sentence(rng) for _ in range(rng.randint(2, 6))) + '</p>')
+        links = []
+        for j in range(links_per_section):
+            if j % 2:
+                links.append(f'<a href="https://example{(i + j) % 50}.com/ref" rel="nofollow">Ref {j}</a>')
+            else:
+                links.append(f'<a href="https://bench.local/page/{i}/{j}">Page {i}.{j}</a>')
+        if links:
+            parts.append('<p>' + ' '.join(links) + '</p>')
+        images = int(images_per_section) + (rng.random() < images_per_section % 1)
+        for k in range(images):
+            alt = f' alt="Image {i}.{k}"' if (i + k) % 3 else ''
+            parts.append(f'<img src="/img/{i}-{k}.jpg"{alt} loading="lazy" width="640" height="480">')
+    parts.append(FOOTER)
+    return ''.join(parts)
+
+
+def _sized(name, target_bytes, seed):
+    """Typical page grown to roughly target_bytes"""
+    rng = random.Random(seed)
+    head = _head(name)
+    body_parts = [_body(rng, 50)[:-len(FOOTER)]]
+    size = len(head) + len(body_parts[0])
+    section = 50
+    while size < target_bytes:
+        chunk = f'<h2>Part {section}</h2><p>' + ' '.join(_sentence(rng) for _ in range(20)) + '</p>'
+        body_parts.append(chunk)
+        size += len(chunk)
+        section += 1
+    body_parts.append(FOOTER)
+    return head + ''.join(body_parts)
+
+
+def _jsonld(count, rng):
+    scripts = []
+    for i in range(count):
+        data = {'@context': 'https://schema.org', '@type': 'Product', 'name': f'Product {i}',
+                'description': _sentence(rng), 'sku': f'SKU-{i:05d}',
+                'offers': {'@type': 'Offer', 'price': f'{rng.randint(1, 999)}.99', 'priceCurrency': 'EUR'},
+                'aggregateRating': {'@type': 'AggregateRating', 'ratingValue': rng.randint(1, 5), 'reviewCount': i}}
+        scripts.append(f'<script type="application/ld+json">{json.dumps(data)}</script>')
+    return ''.join(scripts)
+
+
+def corpus():
+    """All fixtures as {name: html bytes}, smallest first"""
+    rng = random.Random
+    pages = {
+        'tiny': _head('Tiny page') + '<body><h1>Hello</h1><p>Just a short page.</p></body></html>',
+        'typical': _head('A typical article page of about sixty characters in length') + _body(rng(1), 60),
+        'headings': _head('Heading heavy') + _body(rng(2), 400, links_per_section=0, headings_per_section=8),
+        'links': _head('Link heavy') + _body(rng(3), 300, links_per_section=20),
+        'images': _head('Image heavy') + _body(rng(4), 400, links_per_section=0, images_per_section=3),
+        'jsonld': _head('JSON-LD heavy', _jsonld(300, rng(5))) + _body(rng(5), 20),
+        '1mb': _sized('One megabyte', 1024 * 1024, 6),
+        '10mb': _sized('Ten megabytes', 10 * 1024 * 1024, 7),
+    }
+    return {name: html.encode('utf-8') for name, html in pages.items()}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python benchmarks/fixtures.py <output directory>')
+        sys.exit(1)
+    os.makedirs(sys.argv[1], exist_ok=True)
+    for name, body in corpus().items():
+        with open(os.path.join(sys.argv[1], f'{name}.html'), 'wb') as f:
+            f.write(body)
+        print(f'{name}.html {len(body) // 1024} KB')
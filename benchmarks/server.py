@@ -0,0 +1,70 @@
+"""
+In-process HTTP server for the benchmarks
+
+Serves the fixture corpus over keep-alive HTTP/1.1 from a background thread.
+Every response can be delayed to simulate network latency: server-wide with
+`latency` or per request with a `?delay=<seconds>` query parameter.
+
+    with FixtureServer(corpus(), latency=0.05) as server:
+        server.url('typical')   # http://127.0.0.1:<port>/typical.html
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        delay = float(parse_qs(parts.query).get('delay', [self.server.latency])[0])
+        body = self.server.pages.get(parts.path.lstrip('/').removesuffix('.html'))
+        if delay:
+            time.sleep(delay)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FixtureServer:
+    """Serve {name: body} pages at /<name>.html on a free local port"""
+
+    def __init__(self, pages, latency=0.0, host='127.0.0.1', port=0):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.pages = pages
+        self._server.latency = latency
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def latency(self):
+        return self._server.latency
+
+    @latency.setter
+    def latency(self, seconds):
+        self._server.latency = seconds
+
+    def url(self, name, delay=None):
+        host, port = self._server.server_address[:2]
+        query = f'?delay={delay}' if delay is not None else ''
+        return f'http://{host}:{port}/{name}.html{query}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
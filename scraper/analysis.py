@@ -0,0 +1,136 @@
+import time
+
+from requests.utils import get_encoding_from_headers
+
+from scraper import extract, scoring
+
+
+# Analysis stage: everything CPU bound that turns a downloaded page into SEO
+# fields. analyze_document only takes plain picklable values (no response
+# object, no network access), so it can run inline, in a thread or in a
+# worker process of the analysis process pool.
+
+
+def decode_body(body, headers):
+    """Decode like requests' response.text, or leave bytes to the parser's own detection"""
+    encoding = get_encoding_from_headers(headers)
+    if encoding:
+        try:
+            return str(body, encoding, errors='replace')
+        except LookupError:
+            pass
+    return body
+
+
+# Fields filled from the response rather than the HTML (see start_scraper.build_items)
+RESPONSE_FIELDS = (
+    'url', 'timestamp', 'user_agent', 'status_code', 'content_type', 'content_length', 'body_truncated',
+    'load_time', 'dns_time', 'connect_time', 'tls_time', 'ttfb', 'connection_reused', 'cache_status',
+    'memoized', 'security_headers', 'server_info',
+)
+
+SCORE_FIELDS = ('seo_score', 'seo_recommendations')
+
+# Fields score_page reads; pages are scored before the response fields are added
+SCORE_REQUIRES = scoring.rules.requires
+if not set(SCORE_REQUIRES) <= set(extract.FIELD_INDEX):
+    raise ValueError("Scoring rules can only read fields extracted from the HTML, not: "
+                     + ', '.join(name for name in SCORE_REQUIRES if name not in extract.FIELD_INDEX))
+
+# Named field selections for the fields= / profile= options
+PROFILES = {
+    'basic': ('status_code', 'title', 'meta_description', 'canonical_url', 'h1_count', 'robots_directive'),
+    'social': ('og_title', 'og_description', 'og_image', 'og_url', 'twitter_card', 'twitter_title',
+               'twitter_description'),
+    'content': ('title', 'h1_count', 'h2_count', 'h3_count', 'h1_texts', 'total_words', 'unique_words',
+                'top_keywords', 'keyword_density', 'sentence_count', 'avg_sentence_length',
+                'avg_syllables_per_word', 'flesch_reading_ease', 'paragraph_count'),
+    'links': ('total_links', 'internal_links', 'external_links', 'nofollow_links', 'external_domains',
+              'internal_pages', 'link_texts', 'social_media_links', 'contact_links'),
+    'technical': ('status_code', 'load_time', 'ttfb', 'robots_directive', 'viewport', 'language', 'charset',
+                  'has_ssl', 'mobile_friendly', 'has_compressed_resources', 'security_headers', 'server_info'),
+    'score': SCORE_FIELDS,
+}
+
+
+def resolve_fields(fields=(), profile=None):
+    """
+    Field selection from a list of field names and/or a profile name
+
+    Returns None when neither is given, meaning every field. Raises
+    ValueError for unknown profiles or fields.
+    """
+    if not fields and not profile:
+        return None
+    if profile and profile not in PROFILES:
+        raise ValueError(f"Unknown profile '{profile}', expected one of: {', '.join(PROFILES)}")
+    selected = list(PROFILES[profile]) if profile else []
+    known = set(RESPONSE_FIELDS) | set(SCORE_FIELDS) | set(extract.FIELD_INDEX)
+    for name in fields:
+        name = name.strip()
+        if not name:
+            continue
+        if name not in known:
+            raise ValueError(f"Unknown field '{name}'")
+        if name not in selected:
+            selected.append(name)
+    return tuple(selected)
+
+
+def select_fields(item, fields, include=()):
+    """Keep only the selected fields of an item, plus the url and the fields of `include` groups"""
+    if fields is None:
+        return item
+    return type(item)((key, value) for key, value in item.items()
+                      if key in fields or key == 'url' or extract.FIELD_INDEX.get(key) in include)
+
+
+def score_page(item):
+    """Add seo_score and seo_recommendations to an analysed item, with the rules of scraper/scoring.py"""
+    scoring.rules.score(item)
+
+
+def analyze_document(url, body, headers, include=(), base_url=None, mode='full', fields=None, timings=None):
+    """
+    Analyse a page from its raw body, response headers and URL
+
+    Args:
+        url: The requested URL
+        body: Raw response body (bytes)
+        headers: Response headers as a dict with lowercase names
+        include: Optional field groups to add, e.g. 'outlinks'
+        base_url: Final URL after redirects, used to resolve relative links
+        mode: 'full', or 'head' when body only holds the <head> of the page
+        fields: Field selection from resolve_fields; only the groups these
+            fields need (dependencies included) run. None runs everything
+        timings: Optional dict that gets the seconds spent on 'parse',
+            'extract', 'text_stats' and 'score' plus 'parse_nodes'
+
+    Returns:
+        dict of the HTML-derived fields, plus seo_score and seo_recommendations
+        in full mode (scoring needs the body, so head mode has no score)
+    """
+    scored = mode != 'head' and (fields is None or any(name in SCORE_FIELDS for name in fields))
+    groups = None
+    if fields is not None:
+        groups = extract.groups_for_fields(tuple(fields) + (SCORE_REQUIRES if scored else ()))
+    if mode == 'head':
+        groups = set(extract.HEAD_FIELD_GROUPS) if groups is None else groups & set(extract.HEAD_FIELD_GROUPS)
+
+    item = {}
+    # Everything derived from the HTML, extracted in a single pass over the document
+    extract.extract_fields(decode_body(body, headers), url, item, include=include, base_url=base_url, groups=groups,
+                           timings=timings)
+    if scored:
+        started = time.perf_counter()
+        score_page(item)
+        if timings is not None:
+            timings['score'] = time.perf_counter() - started
+    return item
+
+
+def analyze_document_timed(url, body, headers, include=(), base_url=None, mode='full', fields=None):
+    """analyze_document returning (item, timings), for worker processes that cannot fill a caller's dict"""
+    timings = {}
+    item = analyze_document(url, body, headers, include, base_url, mode, fields, timings)
+    return item, timings
@@ -0,0 +1,495 @@
+import base64
+import gzip
+import hashlib
+import heapq
+import mmap
+import os
+import re
+import struct
+import threading
+import uuid
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from requests.structures import CaseInsensitiveDict
+
+from scraper import settings
+from scraper.frontier import site_key
+
+
+# Append-only archive of the raw pages fetched, to analyse them again offline.
+#
+# Pages are written as WARC/1.1 records, one gzip member each, to segment
+# files of about SCRAPER_ARCHIVE_SEGMENT_BYTES, so standard WARC tools read
+# the archive too. A body is stored once: a page whose body (by sha256) is
+# already archived gets a revisit record with its headers only. Bodies are
+# stored decoded, as the analysis reads them; the headers of the encoded
+# transfer are kept as X-Archive-Orig-Content-Encoding and so on.
+#
+# Two indexes find records without reading segments: pages by (site, URL,
+# fetch time) and bodies by hash. Each is a file of fixed-size entries sorted
+# by key, memory-mapped and binary searched, plus an append-only log of the
+# entries added since; the log is merged into the sorted file once it holds a
+# quarter as many entries, so merges cost O(1) per entry over time. One process
+# writes to an archive (a lock file makes sure of it) and any number read it:
+# replay hands record locations to the analysis worker processes, which read
+# the segments at those offsets themselves.
+
+SEGMENT_NAME = 'pages-{:05d}.warc.gz'
+SEGMENT_PATTERN = re.compile(r'pages-(\d{5})\.warc\.gz$')
+REVISIT_PROFILE = 'http://netpreserve.org/warc/1.1/revisit/identical-payload-digest'
+# cache_status of items analysed from the archive
+CACHE_STATUS = 'archive'
+
+# Headers describing the encoded transfer rather than the stored body
+TRANSFER_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+ORIGINAL_HEADER_PREFIX = 'X-Archive-Orig-'
+
+# Sorted indexes are rewritten when their log holds this many entries or a quarter of the sorted ones
+MERGE_MIN_ENTRIES = 4096
+
+# Page keys: site hash (8 bytes), URL hash (8), fetch time in microseconds (8);
+# values: the page's record and the record holding its body as (segment, offset, length)
+PAGE_KEY_SIZE = 24
+URL_PREFIX_SIZE = 16
+PAGE_VALUE = '>IQIIQI'
+# Body keys: the first 16 bytes of the body's sha256; values: (segment, offset, length)
+BODY_KEY_SIZE = 16
+BODY_VALUE = '>IQI'
+
+_TIME = struct.Struct('>Q')
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class ArchiveLocked(Exception):
+    """Another process writes to the archive"""
+
+
+def _hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+
+def _microseconds(moment):
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+def page_prefix(url, site=False):
+    """Key prefix of a URL's entries in the pages index, or of its site's with `site`"""
+    prefix = _hash(site_key(url))
+    return prefix if site else prefix + _hash(url)
+
+
+class _Keys:
+    """Keys of a sorted index file as a sequence, for bisect"""
+
+    def __init__(self, data, count, entry_size, key_size):
+        self.data = data
+        self.count = count
+        self.entry_size = entry_size
+        self.key_size = key_size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        start = position * self.entry_size
+        return self.data[start:start + self.key_size]
+
+
+class SortedIndex:
+    """
+    Fixed-size (key, value) entries: a memory-mapped file sorted by key plus a log of newer entries
+
+    Entries are bytes (the key, then the value packed with `value_format`);
+    the log's are also kept in memory by their first `prefix_size` bytes. A
+    writable index merges a log left over by a previous writer when it opens.
+    """
+
+    def __init__(self, path, key_size, value_format, prefix_size, writable=False):
+        self.path = path
+        self.log_path = path + '.log'
+        self.key_size = key_size
+        self.prefix_size = prefix_size
+        self.value = struct.Struct(value_format)
+        self.entry_size = key_size + self.value.size
+        self._map = None
+        self._count = 0
+        self._pending = {}
+        self._pending_count = 0
+        self._log = None
+        self._open_sorted()
+        self._load_log()
+        if writable:
+            if self._pending_count:
+                self.merge()
+            self._log = open(self.log_path, 'ab')
+
+    def __len__(self):
+        return self._count + self._pending_count
+
+    def _open_sorted(self):
+        if self._map is not None:
+            self._map.close()
+        self._map, self._count = None, 0
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._count = len(self._map) // self.entry_size
+
+    def _load_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+        # A partly written last entry (the writer stopped mid-write) is ignored
+        for start in range(0, len(data) - self.entry_size + 1, self.entry_size):
+            self._remember(data[start:start + self.entry_size])
+
+    def _remember(self, entry):
+        self._pending.setdefault(entry[:self.prefix_size], []).append(entry)
+        self._pending_count += 1
+
+    def add(self, key, *values):
+        entry = key + self.value.pack(*values)
+        self._log.write(entry)
+        self._log.flush()
+        self._remember(entry)
+        if self._pending_count >= max(MERGE_MIN_ENTRIES, self._count // 4):
+            self.merge()
+
+    def _sorted_entries(self, start=0):
+        data, size = self._map, self.entry_size
+        for position in range(start, self._count):
+            yield data[position * size:(position + 1) * size]
+
+    def merge(self):
+        """Rewrite the sorted file with the log's entries and empty the log"""
+        pending = sorted(entry for entries in self._pending.values() for entry in entries)
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            buffer, previous = [], None
+            # Entries both in the file and the log (a merge cut short before the log was emptied) are kept once
+            for entry in heapq.merge(self._sorted_entries(), pending):
+                if entry != previous:
+                    buffer.append(entry)
+                    previous = entry
+                if len(buffer) >= 8192:
+                    f.write(b''.join(buffer))
+                    buffer.clear()
+            f.write(b''.join(buffer))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self._open_sorted()
+        self._pending, self._pending_count = {}, 0
+        if self._log is not None:
+            self._log.truncate(0)
+        else:
+            open(self.log_path, 'wb').close()
+
+    def entries(self, prefix=b''):
+        """(key, values) of the entries whose key starts with `prefix`, in key order"""
+        sorted_part = []
+        if self._count:
+            start = 0
+            if prefix:
+                keys = _Keys(self._map, self._count, self.entry_size, self.key_size)
+                start = bisect_left(keys, prefix)
+            for entry in self._sorted_entries(start):
+                if not entry.startswith(prefix):
+                    break
+                sorted_part.append(entry)
+        if len(prefix) == self.prefix_size:
+            pending = self._pending.get(prefix, [])
+        else:
+            pending = [entry for entries in self._pending.values() for entry in entries if entry.startswith(prefix)]
+        size, unpack = self.key_size, self.value.unpack_from
+        return [(entry[:size], unpack(entry, size)) for entry in heapq.merge(sorted_part, sorted(pending))]
+
+    def close(self):
+        if self._log is not None:
+            if self._pending_count:
+                self.merge()
+            self._log.close()
+            self._log = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def _warc_record(warc_type, fields, block):
+    head = [f'WARC/1.1\r\nWARC-Type: {warc_type}']
+    head += [f'{name}: {value}' for name, value in fields]
+    head += ['Content-Type: application/http; msgtype=response', f'Content-Length: {len(block)}']
+    return '\r\n'.join(head).encode('utf-8') + b'\r\n\r\n' + block + b'\r\n\r\n'
+
+
+def _http_head(response):
+    # The headers as received, except those of the transfer encoding: the body is stored decoded
+    lines = [f'HTTP/1.1 {response.status_code} {response.reason or ""}'.rstrip()]
+    for name, value in response.headers.items():
+        if name.lower() in TRANSFER_HEADERS:
+            name = ORIGINAL_HEADER_PREFIX + name
+        lines.append(f'{name}: {value}')
+    lines.append(f'Content-Length: {len(response.content)}')
+    return '\r\n'.join(lines).encode('latin-1', 'replace') + b'\r\n\r\n'
+
+
+def _parse_record(record):
+    """(WARC fields, status line, HTTP headers, body) of an uncompressed record"""
+    head, _, rest = record.partition(b'\r\n\r\n')
+    warc = dict(line.split(': ', 1) for line in head.decode('utf-8').split('\r\n')[1:])
+    block = rest[:int(warc['Content-Length'])]
+    http, _, body = block.partition(b'\r\n\r\n')
+    status_line, *lines = http.decode('latin-1').split('\r\n')
+    headers = CaseInsensitiveDict()
+    for line in lines:
+        name, _, value = line.partition(':')
+        if name.startswith(ORIGINAL_HEADER_PREFIX):
+            name = name[len(ORIGINAL_HEADER_PREFIX):]
+        elif name.lower() == 'content-length':
+            continue
+        headers[name] = value.strip()
+    return warc, status_line, headers, body
+
+
+class ArchivedResponse:
+    """Stands in for the HTTP response when an archived page is analysed again"""
+
+    elapsed = timedelta(0)
+    cache_status = CACHE_STATUS
+
+    def __init__(self, warc, status_line, headers, body):
+        self.requested_url = warc['WARC-Target-URI']
+        self.url = warc.get('X-Archive-Response-URI', self.requested_url)
+        _, status, *reason = status_line.split(' ', 2)
+        self.status_code = int(status)
+        self.reason = reason[0] if reason else ''
+        self.headers = headers
+        self.content = body
+        self.truncated = 'WARC-Truncated' in warc
+        self.fetched = datetime.strptime(warc['WARC-Date'], '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
+        self.user_agent = warc.get('X-Archive-User-Agent', '')
+        self.timings = {}
+
+
+class Archive:
+    """
+    Raw pages in WARC segments with their indexes, see the comment at the top
+
+    Opened read-only unless `writable`; a writable archive raises
+    ArchiveLocked when another process is writing to the directory.
+    """
+
+    def __init__(self, directory, writable=False, segment_bytes=None, compression=None):
+        self.directory = directory
+        self.writable = writable
+        self.segment_bytes = segment_bytes or settings.ARCHIVE_SEGMENT_BYTES
+        self.compression = settings.ARCHIVE_COMPRESSION if compression is None else compression
+        self._lock = threading.Lock()
+        self._lock_file = None
+        if writable:
+            os.makedirs(directory, exist_ok=True)
+            self._lock_file = open(os.path.join(directory, 'writer.lock'), 'w')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    self._lock_file.close()
+                    raise ArchiveLocked(f"Another process writes to the archive in {directory}")
+        self.pages = SortedIndex(os.path.join(directory, 'pages.idx'), PAGE_KEY_SIZE, PAGE_VALUE, URL_PREFIX_SIZE,
+                                 writable)
+        self.bodies = SortedIndex(os.path.join(directory, 'bodies.idx'), BODY_KEY_SIZE, BODY_VALUE, BODY_KEY_SIZE,
+                                  writable)
+        self._files = {}
+        self._segment = self._segment_file = None
+        self._segment_size = 0
+        self.counts = {'pages': 0, 'revisits': 0, 'bytes_written': 0}
+
+    def segments(self):
+        """Numbers of the segment files, in order"""
+        names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+        return sorted(int(match.group(1)) for match in map(SEGMENT_PATTERN.match, names) if match)
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, SEGMENT_NAME.format(segment))
+
+    def _append(self, data):
+        # Every writer starts a new segment, so a record cut short by a crash is never followed by others
+        if self._segment_file is None or self._segment_size + len(data) > self.segment_bytes:
+            if self._segment_file is not None:
+                self._segment_file.close()
+            existing = self.segments()
+            self._segment = existing[-1] + 1 if existing else 0
+            self._segment_file = open(self.segment_path(self._segment), 'ab')
+            self._segment_size = 0
+        offset = self._segment_size
+        self._segment_file.write(data)
+        self._segment_file.flush()
+        self._segment_size += len(data)
+        self.counts['bytes_written'] += len(data)
+        return self._segment, offset, len(data)
+
+    def add(self, url, response, user_agent='', fetched=None):
+        """
+        Archive a downloaded page under the URL it was requested for
+
+        Returns 'response' when the body was stored, 'revisit' when a page
+        with the same body already is in the archive.
+        """
+        body = response.content
+        digest = hashlib.sha256(body).digest()
+        fetched = fetched or datetime.now(timezone.utc)
+        with self._lock:
+            known = self.bodies.entries(digest[:BODY_KEY_SIZE])
+        fields = [
+            ('WARC-Record-ID', f'<urn:uuid:{uuid.uuid4()}>'),
+            ('WARC-Date', fetched.strftime('%Y-%m-%dT%H:%M:%S.%fZ')),
+            ('WARC-Target-URI', url),
+            ('WARC-Payload-Digest', 'sha256:' + base64.b32encode(digest).decode('ascii')),
+        ]
+        if response.url != url:
+            fields.append(('X-Archive-Response-URI', response.url))
+        if user_agent:
+            fields.append(('X-Archive-User-Agent', user_agent))
+        if getattr(response, 'truncated', False):
+            fields.append(('WARC-Truncated', 'length'))
+        if known:
+            warc_type = 'revisit'
+            fields.append(('WARC-Profile', REVISIT_PROFILE))
+            block = _http_head(response)
+        else:
+            warc_type = 'response'
+            block = _http_head(response) + body
+        # Compressed outside the lock: zlib releases the GIL, other fetch threads keep archiving
+        record = gzip.compress(_warc_record(warc_type, fields, block), self.compression)
+        with self._lock:
+            location = self._append(record)
+            body_location = known[0][1] if known else location
+            if not known:
+                # A thread may have archived the same body meanwhile; the first location stays the indexed one
+                if not self.bodies.entries(digest[:BODY_KEY_SIZE]):
+                    self.bodies.add(digest[:BODY_KEY_SIZE], *location)
+            self.pages.add(page_prefix(url) + _TIME.pack(_microseconds(fetched)), *location, *body_location)
+            self.counts['pages'] += 1
+            if known:
+                self.counts['revisits'] += 1
+        return warc_type
+
+    def _read(self, segment, offset, length):
+        fd = self._files.get(segment)
+        if fd is None:
+            fd = self._files.setdefault(segment, os.open(self.segment_path(segment), os.O_RDONLY))
+        return gzip.decompress(os.pread(fd, length, offset))
+
+    def read(self, location):
+        """ArchivedResponse of a page from its location in the pages index"""
+        segment, offset, length, body_segment, body_offset, body_length = location
+        warc, status_line, headers, body = _parse_record(self._read(segment, offset, length))
+        if (body_segment, body_offset) != (segment, offset):
+            body = _parse_record(self._read(body_segment, body_offset, body_length))[3]
+        return ArchivedResponse(warc, status_line, headers, body)
+
+    def select(self, url=None, site=False, since=None, latest=True):
+        """
+        Locations of archived pages: every page, a URL's or (with `site`) its site's
+
+        `since` (an aware datetime) keeps the pages fetched from then on and
+        `latest` the last fetch of every URL. Locations are in segment order,
+        so reading them goes through the segments sequentially.
+        """
+        prefix = page_prefix(url, site) if url else b''
+        with self._lock:
+            entries = self.pages.entries(prefix)
+        if latest:
+            # Entries are sorted by URL, then fetch time: keep the last one of every URL
+            entries = [entry for entry, following in zip(entries, entries[1:] + [(b'', None)])
+                       if entry[0][:URL_PREFIX_SIZE] != following[0][:URL_PREFIX_SIZE]]
+        if since is not None:
+            since = _TIME.pack(_microseconds(since))
+            entries = [entry for entry in entries if entry[0][URL_PREFIX_SIZE:] >= since]
+        return sorted(location for _, location in entries)
+
+    def stats(self):
+        segments = self.segments()
+        return {
+            'directory': self.directory,
+            'pages': len(self.pages),
+            'bodies': len(self.bodies),
+            'segments': len(segments),
+            'bytes': sum(os.path.getsize(self.segment_path(segment)) for segment in segments),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._segment_file is not None:
+                self._segment_file.close()
+                self._segment_file = None
+            for fd in self._files.values():
+                os.close(fd)
+            self._files.clear()
+            self.pages.close()
+            self.bodies.close()
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+
+_archive = None
+_archive_lock = threading.Lock()
+_readers = {}
+
+
+def get_archive():
+    """
+    The archive this process writes fetched pages to (SCRAPER_ARCHIVE_DIR), or None
+
+    None when the archive is disabled or another process writes to it; only
+    the first process to open the directory archives pages.
+    """
+    global _archive
+    if _archive is None and settings.ARCHIVE_DIR:
+        with _archive_lock:
+            if _archive is None:
+                try:
+                    _archive = Archive(settings.ARCHIVE_DIR, writable=True)
+                except ArchiveLocked:
+                    _archive = False
+    return _archive or None
+
+
+def close_archive():
+    """Close the written archive, merging its index logs"""
+    global _archive
+    with _archive_lock:
+        if _archive:
+            _archive.close()
+        _archive = None
+
+
+def reader(directory):
+    """A read-only archive kept open for the process, to read records at known locations"""
+    archive = _readers.get(directory)
+    if archive is None:
+        archive = _readers.setdefault(directory, Archive(directory))
+    return archive
+
+
+def get_stats():
+    """Size of the archive, and what this process wrote to it"""
+    if not settings.ARCHIVE_DIR:
+        return {'enabled': False}
+    archive = Archive(settings.ARCHIVE_DIR)
+    try:
+        stats = archive.stats()
+    finally:
+        archive.close()
+    # Not opened for writing here: only a process that archived a page is the writer
+    written = _archive or None
+    stats.update(enabled=True, writer=written is not None, written=written.counts if written else None)
+    return stats
@@ -0,0 +1,270 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+
+from scraper import items, settings
+
+
+# HTTP response cache for the fetch layer.
+#
+# An entry stores the validators (ETag / Last-Modified), the freshness deadline
+# from Cache-Control / Expires and the finished analysis of the page as JSON.
+# A fresh entry is served without any request; a stale one is revalidated with
+# If-None-Match / If-Modified-Since and a 304 reuses the stored analysis, so
+# neither the download nor the parsing happens again.
+
+_stats_lock = threading.Lock()
+stats = {
+    'hits': 0,            # served fresh from the cache, no request made
+    'revalidated': 0,     # 304 Not Modified, stored analysis reused
+    'misses': 0,          # full download and analysis
+    'stores': 0,
+    'evictions': 0,
+    'bytes_saved': 0,     # response bytes not downloaded thanks to the cache
+}
+
+
+def count(name, amount=1):
+    with _stats_lock:
+        stats[name] += amount
+
+
+def get_stats():
+    """Snapshot of the cache counters plus the current backend size"""
+    with _stats_lock:
+        snapshot = dict(stats)
+    cache = get_cache()
+    snapshot['backend'] = settings.CACHE_BACKEND
+    snapshot['entries'], snapshot['bytes'] = cache.size() if cache else (0, 0)
+    lookups = snapshot['hits'] + snapshot['revalidated'] + snapshot['misses']
+    snapshot['hit_ratio'] = round((snapshot['hits'] + snapshot['revalidated']) / lookups, 4) if lookups else 0
+    return snapshot
+
+
+def cache_key(url, version, include=(), fields=None):
+    """Entries are per URL, analyzer version, set of optional field groups and field selection"""
+    selection = ",".join(sorted(fields)) if fields is not None else '*'
+    return f'{url}|{version}|{",".join(sorted(include))}|{selection}'
+
+
+def _cache_control(headers):
+    directives = {}
+    for part in headers.get('cache-control', '').lower().split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name] = value.strip('"')
+    return directives
+
+
+def freshness_lifetime(headers):
+    """Seconds the response may be reused without revalidation (0 = always revalidate)"""
+    directives = _cache_control(headers)
+    if 'no-cache' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if re.fullmatch(r'\d+', directives.get(name, '')):
+            age = int(headers.get('age', '0')) if headers.get('age', '').isdigit() else 0
+            return max(int(directives[name]) - age, 0)
+    try:
+        if headers.get('expires') and headers.get('date'):
+            lifetime = parsedate_to_datetime(headers['expires']) - parsedate_to_datetime(headers['date'])
+            return max(lifetime.total_seconds(), 0)
+    except (TypeError, ValueError):
+        pass
+    return 0
+
+
+def is_cacheable(response):
+    """Only complete 200 responses that allow storage and can be reused somehow"""
+    headers = response.headers
+    if response.status_code != 200 or 'no-store' in _cache_control(headers):
+        return False
+    return bool(headers.get('etag') or headers.get('last-modified') or freshness_lifetime(headers) > 0)
+
+
+class CacheEntry:
+    """Cached analysis of a URL with the HTTP metadata needed to reuse it"""
+
+    def __init__(self, analysis, etag='', last_modified='', lifetime=0, expires_at=0, content_length=0):
+        self.analysis = analysis
+        self.etag = etag
+        self.last_modified = last_modified
+        self.lifetime = lifetime
+        self.expires_at = expires_at
+        self.content_length = content_length
+
+    @classmethod
+    def from_response(cls, response, analysis):
+        entry = cls(analysis,
+                    etag=response.headers.get('etag', ''),
+                    last_modified=response.headers.get('last-modified', ''),
+                    content_length=len(response.content))
+        entry.revalidated(response.headers)
+        return entry
+
+    def revalidated(self, headers):
+        """Restart the freshness lifetime; a 304 without caching headers keeps the stored one"""
+        if 'cache-control' in headers or 'expires' in headers:
+            self.lifetime = freshness_lifetime(headers)
+        if headers.get('etag'):
+            self.etag = headers['etag']
+        self.expires_at = time.time() + self.lifetime if self.lifetime else 0
+
+    def is_fresh(self):
+        return self.expires_at > time.time()
+
+    def validators(self):
+        """Conditional request headers for revalidating this entry"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def dumps(self):
+        return items.dumps({
+            'analysis': self.analysis,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'lifetime': self.lifetime,
+            'expires_at': self.expires_at,
+            'content_length': self.content_length,
+        }).decode('utf-8')
+
+    @classmethod
+    def loads(cls, data):
+        return cls(**json.loads(data))
+
+
+class MemoryCache:
+    """In-process LRU cache bounded by the total size of the stored entries"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                return None
+            self._entries.move_to_end(key)
+        return CacheEntry.loads(data)
+
+    def set(self, key, entry):
+        data = entry.dumps()
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                count('evictions')
+
+    def size(self):
+        with self._lock:
+            return len(self._entries), self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SQLiteCache:
+    """On-disk cache in a SQLite file, shared by workers and kept across restarts"""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS http_cache ('
+            ' key TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS http_cache_accessed ON http_cache (accessed_at)')
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT data FROM http_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE http_cache SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return CacheEntry.loads(row[0])
+
+    def set(self, key, entry):
+        data = entry.dumps()
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO http_cache (key, data, size, accessed_at) VALUES (?, ?, ?, ?)',
+                             (key, data, len(data), time.time()))
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM http_cache').fetchone()[0]
+            while total > self.max_bytes:
+                # Evict the least recently used entries
+                rows = self._db.execute('SELECT key, size FROM http_cache ORDER BY accessed_at LIMIT 100').fetchall()
+                for old_key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._db.execute('DELETE FROM http_cache WHERE key = ?', (old_key,))
+                    total -= size
+                    count('evictions')
+
+    def size(self):
+        with self._lock:
+            return tuple(self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_cache').fetchone())
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM http_cache')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide cache configured by SCRAPER_CACHE, or None when disabled"""
+    global _cache
+    if _cache is None and settings.CACHE_BACKEND != 'off':
+        with _cache_lock:
+            if _cache is None:
+                if settings.CACHE_BACKEND == 'sqlite':
+                    _cache = SQLiteCache(settings.CACHE_PATH, settings.CACHE_MAX_BYTES)
+                else:
+                    _cache = MemoryCache(settings.CACHE_MAX_BYTES)
+    return _cache
+
+
+class CachedResponse:
+    """Stands in for the HTTP response when a fresh entry is served without a request"""
+
+    status_code = 200
+    elapsed = timedelta(0)
+    content = b''
+    text = ''
+
+    def __init__(self, url, entry):
+        self.url = url
+        self.headers = {}
+        self.timings = {}
+        self.cached_analysis = entry.analysis
+        self.cache_status = 'hit'
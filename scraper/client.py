@@ -0,0 +1,236 @@
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from fake_useragent import UserAgent
+
+from scraper import settings
+
+
+# Process-wide HTTP client.
+#
+# The connection pools live in one HTTPAdapter shared by every thread,
+# so keep-alive connections are reused across scrapes. requests.Session itself is
+# not guaranteed to be thread-safe, so each thread gets its own lightweight
+# session that mounts the shared adapters. Only the connection pools are
+# shared: cookies are cleared before every request, so a scrape never sends
+# cookies set by an earlier, unrelated one.
+
+_local = threading.local()
+
+_dns_cache = {}
+_dns_lock = threading.Lock()
+
+_user_agents = None
+_user_agents_lock = threading.Lock()
+
+
+def _record_timing(name, seconds):
+    """Add a timing to the request currently running on this thread"""
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + seconds
+
+
+def resolve(host, port):
+    """Resolve a host to its IP addresses, caching the answer for DNS_CACHE_TTL seconds"""
+    key = (host, port)
+    now = time.monotonic()
+    with _dns_lock:
+        cached = _dns_cache.get(key)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    start = time.perf_counter()
+    try:
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    except socket.gaierror:
+        # Let urllib3 resolve again and raise its usual NameResolutionError
+        return [host]
+    _record_timing('dns', time.perf_counter() - start)
+
+    # Every address, in the resolver's order, so a connection can fail over to the next one
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    with _dns_lock:
+        _dns_cache[key] = (addresses, now + settings.DNS_CACHE_TTL)
+    return addresses
+
+
+def forget_host(host, port):
+    """Drop a cached DNS answer, e.g. after the address refused a connection"""
+    with _dns_lock:
+        _dns_cache.pop((host, port), None)
+
+
+class _TimedConnectionMixin:
+    """Records DNS, TCP connect and time-to-first-byte for each request"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+        addresses = resolve(host, self.port)
+        self._resolve_time = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            for position, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except Exception:
+                    # Try the host's next address; the answer is resolved again once all of them failed
+                    if position == len(addresses) - 1:
+                        forget_host(host, self.port)
+                        raise
+        finally:
+            # The host property (used for SNI and certificate checks) reads _dns_host
+            self._dns_host = host
+        self._tcp_connect_time = time.perf_counter() - start
+        _record_timing('connect', self._tcp_connect_time)
+        return sock
+
+    def getresponse(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().getresponse(*args, **kwargs)
+        _record_timing('ttfb', time.perf_counter() - start)
+        return response
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+
+    def connect(self):
+        self._resolve_time = self._tcp_connect_time = 0
+        start = time.perf_counter()
+        super().connect()
+        # connect() = resolve + TCP connect + TLS handshake; resolve and TCP are recorded separately
+        tls_time = time.perf_counter() - start - self._resolve_time - self._tcp_connect_time
+        _record_timing('tls', max(tls_time, 0))
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+# pool_connections = number of hosts kept in the pool cache,
+# pool_maxsize = keep-alive connections kept per host
+_adapter = _TimedAdapter(
+    pool_connections=settings.HTTP_POOL_HOSTS,
+    pool_maxsize=settings.HTTP_POOL_SIZE_PER_HOST,
+)
+
+
+def _get_session():
+    """Return this thread's session (sharing the process-wide connection pools)"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.mount('http://', _adapter)
+        session.mount('https://', _adapter)
+        _local.session = session
+    return session
+
+
+def random_user_agent():
+    """Return a random browser user agent from a pool loaded once per process"""
+    global _user_agents
+    if _user_agents is None:
+        with _user_agents_lock:
+            if _user_agents is None:
+                _user_agents = UserAgent()
+    return _user_agents.random
+
+
+def warm_up():
+    """Load the user agent pool up front so the first request does not pay for it"""
+    random_user_agent()
+
+
+def read_body(response, max_bytes, stop=None):
+    """
+    Read a streamed response (stream=True) into response.content, at most max_bytes
+
+    `stop` is called with every chunk and ends the download early when it
+    returns True. A response read to the end goes back to the keep-alive pool;
+    one cut short is closed, and response.truncated tells which happened.
+    """
+    chunks = []
+    size = 0
+    truncated = False
+    for chunk in response.iter_content(chunk_size=16 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes or (stop is not None and stop(chunk)):
+            truncated = True
+            break
+
+    body = b''.join(chunks)
+    if truncated:
+        body = body[:max_bytes]
+        # Drops the connection: the rest of the body is never read
+        response.close()
+    response._content = body
+    response._content_consumed = True
+    response.truncated = truncated
+    return response
+
+
+def get(url, headers=None, timeout=None, **kwargs):
+    """
+    GET a URL through the shared connection pools
+
+    The returned response has a `timings` dict with the seconds spent on
+    dns, connect, tls and ttfb (summed over redirects). Phases that did not
+    happen, e.g. connect on a reused keep-alive connection, are reported as 0.
+    """
+    return request('GET', url, headers, timeout, **kwargs)
+
+
+def head(url, headers=None, timeout=None, **kwargs):
+    """HEAD a URL through the shared connection pools, with `timings` like get()"""
+    return request('HEAD', url, headers, timeout, **kwargs)
+
+
+def request(method, url, headers=None, timeout=None, **kwargs):
+    if timeout is None:
+        timeout = (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+    session = _get_session()
+    # Cookies set during this request (e.g. across its redirects) are still sent
+    session.cookies.clear()
+    _local.timings = {}
+    try:
+        response = session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+        timings = _local.timings
+    finally:
+        _local.timings = None
+
+    response.timings = {
+        'dns': round(timings.get('dns', 0), 6),
+        'connect': round(timings.get('connect', 0), 6),
+        'tls': round(timings.get('tls', 0), 6),
+        'ttfb': round(timings.get('ttfb', 0), 6),
+        'connection_reused': 'connect' not in timings,
+    }
+    return response
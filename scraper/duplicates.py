@@ -0,0 +1,200 @@
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from operator import mul
+
+from scraper import settings
+from scraper.frontier import site_key
+
+
+# Near-duplicate detection of page content with SimHash.
+#
+# A page's fingerprint is a 64-bit SimHash of its words weighted by their
+# counts (the counts the text statistics are computed from): pages made of
+# mostly the same words get fingerprints that differ in few bits. Each site
+# has an index of the fingerprints of its pages scraped so far. As in Manku et
+# al., "Detecting near-duplicates for web crawling", the 64 bits are cut into
+# max_distance + 1 blocks: two fingerprints within max_distance bits agree on
+# at least one whole block, so a lookup only compares the pages sharing a
+# block value with the new page instead of every page of the site. The
+# fingerprints are one array of 64-bit integers and every block table maps a
+# block value to an array of page ids.
+
+BITS = 64
+# Pages with fewer words are not fingerprinted: a few words say nothing about duplication
+MIN_WORDS = 20
+# Closest near-duplicates listed in an item; near_duplicate_count has them all
+MAX_LISTED = 20
+
+# Width of the vote counter of every bit, more than enough for the words of a page
+FIELD_BITS = 32
+FIELD_MASK = (1 << FIELD_BITS) - 1
+# Bits of a byte value spread into FIELD_BITS wide fields
+_BYTE_SPREAD = [sum(1 << (FIELD_BITS * bit) for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+@lru_cache(maxsize=65536)
+def _spread(word):
+    """The bits of a word's hash, each moved to the bottom of its own FIELD_BITS wide field of one integer"""
+    spread = 0
+    for position, value in enumerate(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest()):
+        spread |= _BYTE_SPREAD[value] << (FIELD_BITS * 8 * position)
+    return spread
+
+
+def simhash(counts):
+    """
+    64-bit SimHash of a text from its word counts
+
+    Every word votes for the bits of its hash with its count; a bit is set
+    when the words voting for it outweigh the others. With the hash bits
+    spread into fields of one integer, a multiplication and an addition
+    count a word's votes for all 64 bits at once.
+    """
+    votes = sum(map(mul, map(_spread, counts), counts.values()))
+    total = sum(counts.values())
+    fingerprint = 0
+    for bit in range(BITS):
+        if 2 * (votes >> (FIELD_BITS * bit) & FIELD_MASK) > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def content_simhash(counts):
+    """Hex SimHash of a page's word counts, None for pages with fewer than MIN_WORDS words"""
+    if sum(counts.values()) < MIN_WORDS:
+        return None
+    return f'{simhash(counts):016x}'
+
+
+def similarity(distance):
+    """Share of equal fingerprint bits"""
+    return round(1 - distance / BITS, 4)
+
+
+class SimHashIndex:
+    """Fingerprints of one site's pages, looked up for those within `max_distance` bits"""
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        blocks = max_distance + 1
+        # (shift, mask) of every block; the first ones take the bits that do not divide evenly
+        self._blocks = []
+        shift = 0
+        for block in range(blocks):
+            size = BITS // blocks + (block < BITS % blocks)
+            self._blocks.append((shift, (1 << size) - 1))
+            shift += size
+        self._tables = [{} for _ in self._blocks]
+        self.urls = []
+        self._ids = {}
+        self.fingerprints = array('Q')
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def _keys(self, fingerprint):
+        return [fingerprint >> shift & mask for shift, mask in self._blocks]
+
+    def _insert(self, page, fingerprint):
+        for table, key in zip(self._tables, self._keys(fingerprint)):
+            ids = table.get(key)
+            if ids is None:
+                ids = table[key] = array('I')
+            ids.append(page)
+
+    def _remove(self, page, fingerprint):
+        for table, key in zip(self._tables, self._keys(fingerprint)):
+            ids = table[key]
+            ids.remove(page)
+            if not ids:
+                del table[key]
+
+    def _matches(self, fingerprint, exclude):
+        candidates = set()
+        for table, key in zip(self._tables, self._keys(fingerprint)):
+            candidates.update(table.get(key, ()))
+        candidates.discard(exclude)
+        found = []
+        for page in candidates:
+            distance = (self.fingerprints[page] ^ fingerprint).bit_count()
+            if distance <= self.max_distance:
+                found.append((distance, page))
+        found.sort()
+        return [(self.urls[page], distance) for distance, page in found]
+
+    def add(self, url, fingerprint):
+        """
+        Index a page and return its near-duplicates as (url, distance in bits), closest first
+
+        A page that is already indexed gets its new fingerprint and is not its
+        own duplicate.
+        """
+        with self._lock:
+            page = self._ids.get(url)
+            if page is None:
+                page = self._ids[url] = len(self.urls)
+                self.urls.append(url)
+                self.fingerprints.append(fingerprint)
+                self._insert(page, fingerprint)
+            elif self.fingerprints[page] != fingerprint:
+                self._remove(page, self.fingerprints[page])
+                self.fingerprints[page] = fingerprint
+                self._insert(page, fingerprint)
+            return self._matches(fingerprint, page)
+
+
+class SiteIndexes:
+    """One index per site, made by `factory()`, for the `max_sites` sites scraped last"""
+
+    def __init__(self, factory, max_sites):
+        self.factory = factory
+        self.max_sites = max_sites
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Index of the URL's site, created if there is none"""
+        key = site_key(url)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = self.factory()
+                while len(self._indexes) > self.max_sites:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(key)
+            return index
+
+    def find(self, url):
+        """Index of the URL's site, None if none of its pages were indexed"""
+        with self._lock:
+            return self._indexes.get(site_key(url))
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+indexes = SiteIndexes(lambda: SimHashIndex(settings.DUPLICATE_MAX_DISTANCE), settings.DUPLICATE_SITES)
+
+
+def check_items(scraped):
+    """
+    Index the items that have a content_simhash and add their near_duplicates and near_duplicate_count
+
+    near_duplicates lists the closest pages of the same site scraped before
+    in this process, with their similarity (share of equal bits).
+    """
+    for item in scraped:
+        fingerprint = item.get('content_simhash')
+        if fingerprint is None or 'error' in item:
+            continue
+        matches = indexes.get(item['url']).add(item['url'], int(fingerprint, 16))
+        item['near_duplicate_count'] = len(matches)
+        item['near_duplicates'] = [{'url': url, 'similarity': similarity(distance)}
+                                   for url, distance in matches[:MAX_LISTED]]
+    return scraped
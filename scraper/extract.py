@@ -0,0 +1,568 @@
+import json
+import re
+import time
+from collections import Counter
+from functools import cached_property
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from bs4 import BeautifulSoup, CData, NavigableString, SoupStrainer, Tag
+
+from scraper import duplicates, keywords, settings, textstats
+from scraper.frontier import normalize_url, site_key
+
+
+# Single-pass extraction engine.
+#
+# The document tree is walked exactly once. During the walk every tag that a
+# registered field group asked for is bucketed by name; the field groups then
+# build their part of the item from those buckets instead of running their own
+# soup.find / soup.find_all traversals.
+#
+# Tags inside script/style/nav/footer/header are boilerplate: they are kept out
+# of the page text and of the "main content" buckets (links, images, paragraphs,
+# ...), which is what decomposing those tags used to achieve, but without
+# mutating the tree.
+
+# Bump whenever the analysis output changes, so cached and memoized results are not reused
+ANALYZER_VERSION = 3
+
+BOILERPLATE_TAGS = frozenset(['script', 'style', 'nav', 'footer', 'header'])
+
+# Same string types soup.get_text() returns (no comments, doctypes, script text...)
+TEXT_TYPES = (NavigableString, CData)
+
+SOCIAL_DOMAINS = ['facebook.com', 'twitter.com', 'linkedin.com', 'instagram.com', 'youtube.com', 'tiktok.com', 'pinterest.com']
+CONTACT_MARKERS = ['mailto:', 'tel:', 'contact', 'about', 'support']
+
+GA_PATTERN = re.compile(r'google-analytics|gtag|googletagmanager')
+FB_PATTERN = re.compile(r'facebook|fbevents')
+
+# Registered field groups, in the order their fields appear in the item
+FIELD_GROUPS = []
+
+# Field name -> name of the group that produces it, and group name -> fields it reads
+# from other groups; used to run only what a field selection needs
+FIELD_INDEX = {}
+GROUP_REQUIRES = {}
+
+# Groups that only need the <head> of the page (mode=head)
+HEAD_FIELD_GROUPS = ('title_fields', 'meta_fields', 'canonical_fields', 'technical_fields', 'structured_data_fields')
+
+
+def field_group(tags=(), main_content_tags=(), optional=False, fields=(), requires=(), text=False):
+    """
+    Register a function that fills part of the item
+
+    Args:
+        tags: tag names the group reads from the whole document
+        main_content_tags: tag names the group reads outside boilerplate only
+        optional: only run the group when extract_fields is asked for it by name
+        fields: names of the item fields the group adds
+        requires: fields of other groups the group reads from the item
+        text: the group reads the visible page text
+
+    A tuple of names collects those tags into one list in document order.
+    """
+    def register(func):
+        FIELD_GROUPS.append((func, tuple(tags), tuple(main_content_tags), optional, text))
+        for name in fields:
+            FIELD_INDEX[name] = func.__name__
+        GROUP_REQUIRES[func.__name__] = tuple(requires)
+        return func
+    return register
+
+
+def groups_for_fields(fields):
+    """
+    Names of the groups needed to produce the given fields, dependencies included
+
+    Fields that no group produces are ignored; they come from the response
+    rather than the HTML.
+    """
+    groups = set()
+    pending = list(fields)
+    while pending:
+        group = FIELD_INDEX.get(pending.pop())
+        if group is not None and group not in groups:
+            groups.add(group)
+            pending.extend(GROUP_REQUIRES[group])
+    return groups
+
+
+class Page:
+    """Tags and text collected from one walk over the document"""
+
+    def __init__(self, url, soup, tags, main_content_tags, base_url=None, text=True):
+        self.url = url
+        # URL the page was actually served from (after redirects), for resolving links
+        self.base_url = base_url or url
+        self.soup = soup
+        self._tags = self._buckets(tags)
+        self._main = self._buckets(main_content_tags)
+        self._walk(text)
+
+    @staticmethod
+    def _buckets(keys):
+        """Map every tag name to its list; names grouped in a tuple share one list"""
+        buckets = {}
+        for key in keys:
+            bucket = []
+            for name in (key if isinstance(key, tuple) else (key,)):
+                buckets.setdefault(name, bucket)
+            buckets[key] = bucket
+        return buckets
+
+    def _walk(self, collect_text):
+        # Only plain tag names are looked up during the walk, tuple keys share their lists
+        tags = {name: bucket for name, bucket in self._tags.items() if isinstance(name, str)}
+        main = {name: bucket for name, bucket in self._main.items() if isinstance(name, str)}
+        text_parts = []
+        nodes = 0
+        stack = [(child, False) for child in reversed(self.soup.contents)]
+
+        while stack:
+            node, boilerplate = stack.pop()
+
+            if not isinstance(node, Tag):
+                if collect_text and not boilerplate and type(node) in TEXT_TYPES:
+                    text_parts.append(node)
+                continue
+
+            nodes += 1
+            name = node.name
+            if name in BOILERPLATE_TAGS:
+                boilerplate = True
+            bucket = tags.get(name)
+            if bucket is not None:
+                bucket.append(node)
+            if not boilerplate:
+                bucket = main.get(name)
+                if bucket is not None:
+                    bucket.append(node)
+
+            children = node.contents
+            if children:
+                stack.extend([(child, boilerplate) for child in reversed(children)])
+
+        self.text = ''.join(text_parts)
+        self.node_count = nodes
+
+    @cached_property
+    def word_counts(self):
+        """Counter of the words of the page text, shared by the groups that read the text"""
+        return Counter(textstats.words(self.text))
+
+    def find_all(self, name):
+        """All <name> tags in the document, in document order"""
+        return self._tags[name]
+
+    def find(self, name, attrs):
+        """First <name> tag whose attributes equal the given values"""
+        for tag in self._tags[name]:
+            if all(tag.get(key) == value for key, value in attrs.items()):
+                return tag
+        return None
+
+    def main_content(self, name):
+        """All <name> tags outside script/style/nav/footer/header"""
+        return self._main[name]
+
+
+def _content(tag):
+    return tag.get('content', '') if tag else ''
+
+
+def _has_rel(tag, value):
+    # rel is a multi-valued attribute, parsed into a list
+    return value in (tag.get('rel') or [])
+
+
+@field_group(tags=['title'], fields=['title', 'title_length', 'title_optimal'])
+def title_fields(page, item):
+    titles = page.find_all('title')
+    item['title'] = titles[0].get_text().strip() if titles else ''
+    item['title_length'] = len(item['title'])
+    item['title_optimal'] = 50 <= len(item['title']) <= 60
+
+
+@field_group(tags=['meta'], fields=['meta_description', 'meta_description_length', 'meta_description_optimal',
+                                   'meta_keywords', 'og_title', 'og_description', 'og_image', 'og_url',
+                                   'twitter_card', 'twitter_title', 'twitter_description'])
+def meta_fields(page, item):
+    item['meta_description'] = _content(page.find('meta', {'name': 'description'}))
+    item['meta_description_length'] = len(item['meta_description'])
+    item['meta_description_optimal'] = 150 <= len(item['meta_description']) <= 160
+    item['meta_keywords'] = _content(page.find('meta', {'name': 'keywords'}))
+
+    # Open Graph tags
+    item['og_title'] = _content(page.find('meta', {'property': 'og:title'}))
+    item['og_description'] = _content(page.find('meta', {'property': 'og:description'}))
+    item['og_image'] = _content(page.find('meta', {'property': 'og:image'}))
+    item['og_url'] = _content(page.find('meta', {'property': 'og:url'}))
+
+    # Twitter Card tags
+    item['twitter_card'] = _content(page.find('meta', {'name': 'twitter:card'}))
+    item['twitter_title'] = _content(page.find('meta', {'name': 'twitter:title'}))
+    item['twitter_description'] = _content(page.find('meta', {'name': 'twitter:description'}))
+
+
+@field_group(tags=['link'], fields=['canonical_url', 'alternate_links'])
+def canonical_fields(page, item):
+    links = page.find_all('link')
+    canonical = next((link for link in links if _has_rel(link, 'canonical')), None)
+    item['canonical_url'] = canonical.get('href', '') if canonical else ''
+    item['alternate_links'] = [link.get('href', '') for link in links if _has_rel(link, 'alternate')]
+
+
+@field_group(tags=['h1', 'h2', 'h3', 'h4', 'h5', 'h6'],
+             fields=[f'h{level}_count' for level in range(1, 7)] + [f'h{level}_texts' for level in range(1, 5)])
+def heading_fields(page, item):
+    for level in range(1, 7):
+        headings = page.find_all(f'h{level}')
+        item[f'h{level}_count'] = len(headings)
+        if level <= 4:
+            item[f'h{level}_texts'] = [heading.get_text().strip() for heading in headings]
+
+
+@field_group(text=True, fields=['total_words', 'unique_words', 'top_keywords', 'keyword_density', 'sentence_count',
+                                'avg_sentence_length', 'avg_syllables_per_word', 'flesch_reading_ease'])
+def content_fields(page, item):
+    item.update(textstats.text_statistics(page.text, page.word_counts))
+
+
+@field_group(text=True, optional=True, fields=['content_simhash'])
+def content_fingerprint(page, item):
+    """SimHash of the page text for near-duplicate detection (scraper/duplicates.py)"""
+    item['content_simhash'] = duplicates.content_simhash(page.word_counts)
+
+
+@field_group(text=True, optional=True, fields=['term_counts'])
+def term_counts(page, item):
+    """Most frequent keywords of the page text and its word total, for the site keyword index (scraper/keywords.py)"""
+    counts = page.word_counts
+    item['term_counts'] = {'total_words': sum(counts.values()),
+                           'terms': textstats.top_keywords(counts, keywords.TERMS_PER_PAGE)}
+
+
+@field_group(main_content_tags=['p'], fields=['paragraph_count', 'paragraphs_with_text'])
+def paragraph_fields(page, item):
+    paragraphs = page.main_content('p')
+    item['paragraph_count'] = len(paragraphs)
+    item['paragraphs_with_text'] = len([p for p in paragraphs if p.get_text().strip()])
+
+
+@field_group(tags=['base'], main_content_tags=['a'], fields=['total_links', 'internal_links', 'external_links',
+                                                             'link_texts', 'nofollow_links', 'external_domains',
+                                                             'internal_pages'])
+def link_fields(page, item):
+    all_links = [link for link in page.main_content('a') if link.get('href') is not None]
+    item['total_links'] = len(all_links)
+
+    # Links are resolved against the page (or its <base>) and compared by site, so
+    # relative links count as internal; in-page anchors, mailto: etc. are neither
+    base = _link_base(page)
+    site = site_key(page.base_url)
+    internal_links = []
+    external_links = []
+    for link in all_links:
+        href = link.get('href').strip()
+        target = normalize_url(href, base) if not href.startswith('#') else None
+        if target is not None:
+            (internal_links if site_key(target) == site else external_links).append(target)
+    item['internal_links'] = len(internal_links)
+    item['external_links'] = len(external_links)
+
+    # Advanced link analysis
+    link_texts = [text for text in (link.get_text().strip() for link in all_links) if text]
+    item['link_texts'] = link_texts[:20]  # First 20 link texts
+
+    # Nofollow links
+    item['nofollow_links'] = len([link for link in all_links if _has_rel(link, 'nofollow')])
+
+    # External domains (first-seen order)
+    item['external_domains'] = list(dict.fromkeys(urlsplit(target).netloc for target in external_links))
+
+    # Internal page links
+    item['internal_pages'] = list(dict.fromkeys(internal_links))[:20]  # First 20 internal pages
+
+
+@field_group(main_content_tags=['img'], fields=['total_images', 'images_without_alt', 'images_with_alt',
+                                                 'image_details', 'image_sources'])
+def image_fields(page, item):
+    images = page.main_content('img')
+    item['total_images'] = len(images)
+    item['images_without_alt'] = len([img for img in images if not img.get('alt')])
+    item['images_with_alt'] = item['total_images'] - item['images_without_alt']
+
+    item['image_details'] = [{
+        'src': img.get('src', ''),
+        'alt': img.get('alt', ''),
+        'title': img.get('title', ''),
+        'width': img.get('width', ''),
+        'height': img.get('height', ''),
+        'loading': img.get('loading', ''),
+        'decoding': img.get('decoding', '')
+    } for img in images[:10]]  # First 10 images
+
+    item['image_sources'] = [img.get('src', '') for img in images if img.get('src')][:10]  # First 10 image sources
+
+
+@field_group(main_content_tags=[('video', 'iframe'), 'audio', 'form', 'table', 'ul', 'ol'],
+             fields=['video_count', 'video_sources', 'audio_count', 'form_count', 'table_count',
+                     'unordered_lists', 'ordered_lists'])
+def media_fields(page, item):
+    # Video analysis (embedded players count as video)
+    videos = page.main_content(('video', 'iframe'))
+    item['video_count'] = len(videos)
+    video_sources = []
+    for video in videos:
+        if video.name == 'video':
+            video_sources.extend(source.get('src', '') for source in video.find_all('source'))
+        else:
+            video_sources.append(video.get('src', ''))
+    item['video_sources'] = video_sources
+
+    item['audio_count'] = len(page.main_content('audio'))
+    item['form_count'] = len(page.main_content('form'))
+    item['table_count'] = len(page.main_content('table'))
+    item['unordered_lists'] = len(page.main_content('ul'))
+    item['ordered_lists'] = len(page.main_content('ol'))
+
+
+@field_group(tags=['link', 'script', 'style'], fields=['css_files', 'js_files', 'inline_css_count', 'inline_js_count'])
+def asset_fields(page, item):
+    scripts = page.find_all('script')
+    item['css_files'] = [link.get('href', '') for link in page.find_all('link') if _has_rel(link, 'stylesheet')]
+    item['js_files'] = [script.get('src', '') for script in scripts if script.get('src') is not None]
+
+    # Inline CSS and JS
+    item['inline_css_count'] = len(page.find_all('style'))
+    item['inline_js_count'] = len([script for script in scripts if script.get('src') is None])
+
+
+@field_group(tags=['html', 'meta'], fields=['robots_directive', 'viewport', 'language', 'charset', 'all_meta_tags'])
+def technical_fields(page, item):
+    item['robots_directive'] = _content(page.find('meta', {'name': 'robots'}))
+    item['viewport'] = _content(page.find('meta', {'name': 'viewport'}))
+
+    html = page.find_all('html')
+    item['language'] = html[0].get('lang', '') if html else ''
+
+    # Character encoding
+    metas = page.find_all('meta')
+    charset = next((meta for meta in metas if meta.get('charset') is not None), None)
+    if charset:
+        item['charset'] = charset.get('charset', '')
+    else:
+        charset_meta = page.find('meta', {'http-equiv': 'content-type'})
+        item['charset'] = charset_meta.get('content', '').split('charset=')[-1] if charset_meta else ''
+
+    # All meta tags analysis
+    meta_analysis = {}
+    for meta in metas:
+        name = meta.get('name', meta.get('property', ''))
+        content = meta.get('content', '')
+        if name and content:
+            meta_analysis[name] = content
+    item['all_meta_tags'] = meta_analysis
+
+
+@field_group(tags=['script'], fields=['schema_scripts', 'structured_data_content'])
+def structured_data_fields(page, item):
+    schema_scripts = [script for script in page.find_all('script') if script.get('type') == 'application/ld+json']
+    item['schema_scripts'] = len(schema_scripts)
+
+    structured_data = []
+    for script in schema_scripts:
+        try:
+            structured_data.append(json.loads(script.string))
+        except (TypeError, ValueError):
+            pass
+    item['structured_data_content'] = structured_data
+
+
+@field_group(tags=['script'], main_content_tags=['a'],
+             fields=['google_analytics', 'facebook_pixel', 'social_media_links', 'contact_links'])
+def tracking_fields(page, item):
+    script_srcs = [script.get('src') for script in page.find_all('script') if script.get('src') is not None]
+    item['google_analytics'] = any(GA_PATTERN.search(src) for src in script_srcs)
+    item['facebook_pixel'] = any(FB_PATTERN.search(src) for src in script_srcs)
+
+    # Social media and contact links
+    hrefs = [link.get('href').lower() for link in page.main_content('a') if link.get('href') is not None]
+    item['social_media_links'] = [href for href in hrefs if any(social in href for social in SOCIAL_DOMAINS)]
+    item['contact_links'] = [href for href in hrefs if any(contact in href for contact in CONTACT_MARKERS)]
+
+
+@field_group(fields=['has_ssl', 'mobile_friendly', 'has_minified_css', 'has_minified_js', 'has_compressed_resources'],
+             requires=['viewport', 'css_files', 'js_files'])
+def performance_fields(page, item):
+    item['has_ssl'] = page.url.startswith('https://')
+    item['mobile_friendly'] = bool(item['viewport'])
+
+    # Page speed indicators
+    item['has_minified_css'] = any('min.css' in css for css in item['css_files'])
+    item['has_minified_js'] = any('min.js' in js for js in item['js_files'])
+    item['has_compressed_resources'] = item['has_minified_css'] or item['has_minified_js']
+
+
+def _link_base(page):
+    """URL relative links are resolved against: the first <base href>, else the page URL"""
+    base_tags = [tag for tag in page.find_all('base') if tag.get('href')]
+    if base_tags:
+        return urljoin(page.base_url, base_tags[0]['href'])
+    return page.base_url
+
+
+@field_group(tags=['a', 'base'], optional=True, fields=['outlinks'])
+def outlinks(page, item):
+    """Every link of the page (navigation included), absolute and in document order"""
+    base = _link_base(page)
+    links = {}
+    for link in page.find_all('a'):
+        href = link.get('href')
+        if href and not href.startswith(('#', 'mailto:', 'tel:', 'javascript:')):
+            links[urljoin(base, href.strip()).split('#')[0]] = True
+    item['outlinks'] = list(links)
+
+
+# <link rel> values of files the browser downloads with the page
+RESOURCE_LINK_RELS = {'stylesheet': 'css', 'icon': 'icon', 'shortcut': 'icon', 'apple-touch-icon': 'icon'}
+
+
+@field_group(tags=['link', 'script', 'img', 'video', 'audio', 'source', 'base'], optional=True,
+             fields=['resource_urls'])
+def resource_urls(page, item):
+    """Every stylesheet, script, icon, image and media file the page loads: {absolute url: kind}, in document order"""
+    base = _link_base(page)
+    found = []
+    for link in page.find_all('link'):
+        kind = next((RESOURCE_LINK_RELS[rel] for rel in link.get('rel') or [] if rel in RESOURCE_LINK_RELS), None)
+        if kind:
+            found.append((link.get('href'), kind))
+    found.extend((script.get('src'), 'js') for script in page.find_all('script'))
+    found.extend((img.get('src'), 'image') for img in page.find_all('img'))
+    for name in ('video', 'audio'):
+        for media in page.find_all(name):
+            found.append((media.get('src'), name))
+            if name == 'video':
+                found.append((media.get('poster'), 'image'))
+    for source in page.find_all('source'):
+        # <source> of a <picture> uses srcset, not src
+        parent = source.parent.name if source.parent is not None else None
+        if parent in ('video', 'audio'):
+            found.append((source.get('src'), parent))
+
+    resources = {}
+    for src, kind in found:
+        if src and not src.strip().startswith('data:'):
+            url = urljoin(base, src.strip()).split('#')[0]
+            if url.startswith(('http://', 'https://')):
+                resources.setdefault(url, kind)
+    item['resource_urls'] = resources
+
+
+class HeadScanner(HTMLParser):
+    """
+    Incremental tokenizer that notices where the <head> of a page ends
+
+    Feed it the body chunk by chunk while downloading; `feed_chunk` returns True
+    once </head> or <body> was seen. Script and style content is skipped like
+    a browser would, so a "</head>" string inside a script does not count.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.done = True
+
+    def feed_chunk(self, chunk):
+        # Tag names are ASCII, so latin-1 is enough to find them in any ASCII-compatible encoding
+        if not self.done:
+            self.feed(chunk.decode('latin-1'))
+        return self.done
+
+
+def parse_html(html, parser=None, parse_only=None):
+    """Parse HTML with the configured parser (lxml by default, html.parser as fallback)"""
+    parser = parser or settings.HTML_PARSER
+    try:
+        return BeautifulSoup(html, parser, parse_only=parse_only)
+    except Exception:
+        if parser == 'html.parser':
+            raise
+        return BeautifulSoup(html, 'html.parser', parse_only=parse_only)
+
+
+def _selected_groups(include=(), groups=None):
+    """(func, tags, main_content_tags, text) of the groups to run, in registration order"""
+    return [(group, group_tags, group_main_tags, text) for group, group_tags, group_main_tags, optional, text in FIELD_GROUPS
+            if group.__name__ in include or not optional and (groups is None or group.__name__ in groups)]
+
+
+def _tag_names(keys):
+    for key in keys:
+        yield from (key if isinstance(key, tuple) else (key,))
+
+
+def extract_fields(html, url, item, parser=None, include=(), base_url=None, groups=None, timings=None):
+    """
+    Parse the page once, walk it once and add every registered field group to item
+
+    `include` names optional groups to run as well (e.g. 'outlinks') and
+    `base_url` is the final URL after redirects, used to resolve relative links.
+    `groups` restricts the non-optional groups to the given names. A `timings`
+    dict gets the seconds spent on 'parse', 'extract' and 'text_stats' and
+    the number of element nodes as 'parse_nodes'.
+    """
+    selected = _selected_groups(include, groups)
+    parse_only = None
+    if groups is not None and not any(text or group_main_tags for _, _, group_main_tags, text in selected):
+        # No text and no boilerplate check needed: only build the tags the groups read
+        parse_only = SoupStrainer(sorted(set(_tag_names(tag for _, group_tags, _, _ in selected for tag in group_tags))))
+    if timings is None:
+        return _extract(parse_html(html, parser, parse_only), url, item, selected, base_url)
+    started = time.perf_counter()
+    soup = parse_html(html, parser, parse_only)
+    timings['parse'] = time.perf_counter() - started
+    return _extract(soup, url, item, selected, base_url, timings)
+
+
+def extract_from_soup(soup, url, item, include=(), base_url=None, groups=None):
+    """Walk an already parsed document once and add the field groups to item"""
+    return _extract(soup, url, item, _selected_groups(include, groups), base_url)
+
+
+def _extract(soup, url, item, groups, base_url, timings=None):
+    tags = set()
+    main_content_tags = set()
+    for _, group_tags, group_main_tags, _ in groups:
+        tags.update(group_tags)
+        main_content_tags.update(group_main_tags)
+
+    if timings is None:
+        page = Page(url, soup, tags, main_content_tags, base_url, text=any(text for _, _, _, text in groups))
+        for group, _, _, _ in groups:
+            group(page, item)
+        return item
+
+    # Same as above, timing the walk and the groups; groups that read the page text are text_stats
+    started = time.perf_counter()
+    page = Page(url, soup, tags, main_content_tags, base_url, text=any(text for _, _, _, text in groups))
+    phases = {'extract': time.perf_counter() - started}
+    for group, _, _, text in groups:
+        started = time.perf_counter()
+        group(page, item)
+        phase = 'text_stats' if text else 'extract'
+        phases[phase] = phases.get(phase, 0) + time.perf_counter() - started
+    timings.update(phases)
+    timings['parse_nodes'] = page.node_count
+    return item
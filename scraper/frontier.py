@@ -0,0 +1,145 @@
+import hashlib
+import math
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+
+# Query parameters that only track the visit and never change the page
+TRACKING_PARAMS = frozenset([
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'gclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga',
+])
+
+# Links to these are never HTML pages, so the crawler does not download them
+SKIP_EXTENSIONS = (
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico', '.bmp',
+    '.pdf', '.zip', '.gz', '.tar', '.rar', '.7z', '.exe', '.dmg',
+    '.mp3', '.mp4', '.avi', '.mov', '.webm', '.wav',
+    '.css', '.js', '.json', '.xml', '.txt', '.woff', '.woff2', '.ttf',
+)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url, base=None):
+    """
+    Canonical form of a URL, used to decide whether two links point to the same page
+
+    Resolves relative links against `base`, strips the fragment, lowercases
+    scheme and host, drops default ports, removes the trailing slash from
+    non-root paths and sorts the query string without tracking parameters.
+    Returns None for links that are not http(s) pages (mailto:, javascript:, ...).
+    """
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f'{netloc}:{port}'
+
+    path = parts.path or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/') or '/'
+
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key.lower() not in TRACKING_PARAMS)
+    return urlunsplit((scheme, netloc, path, urlencode(query), ''))
+
+
+def site_key(url):
+    """Host a URL belongs to for same-site checks ('www.' is ignored)"""
+    host = urlsplit(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+
+class BloomFilter:
+    """
+    Fixed-size probabilistic set of strings
+
+    Uses about 1.8 bytes per expected item at the default 0.1% false positive
+    rate instead of keeping every string. A false positive means a never-seen
+    URL is reported as seen (and skipped); an added item is always reported as seen.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: k positions derived from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        """Add a value; returns False if it was (probably) already present"""
+        added = False
+        for position in self._positions(value):
+            byte, bit = divmod(position, 8)
+            mask = 1 << bit
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, value):
+        for position in self._positions(value):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+
+class Frontier:
+    """Breadth-first queue of same-site URLs; every normalized URL is queued at most once"""
+
+    def __init__(self, seed, max_depth=None, capacity=1000000):
+        self.seed = normalize_url(seed)
+        if not self.seed:
+            raise ValueError(f"Invalid seed URL: {seed}")
+        self.site = site_key(self.seed)
+        self.max_depth = max_depth
+        self.seen = BloomFilter(capacity)
+        self.queue = deque()
+        self.add(self.seed, 0)
+
+    def add(self, url, depth, base=None):
+        """Queue a link found at `depth`; returns True if it was new and in scope"""
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        url = normalize_url(url, base)
+        if not url or site_key(url) != self.site:
+            return False
+        if urlsplit(url).path.lower().endswith(SKIP_EXTENSIONS):
+            return False
+        if not self.seen.add(url):
+            return False
+        self.queue.append((url, depth))
+        return True
+
+    def pop(self):
+        """Next (url, depth) to crawl"""
+        return self.queue.popleft()
+
+    def __len__(self):
+        return len(self.queue)
@@ -1,98 +1,297 @@
-import scrapy
-
-
-class SeoItem(scrapy.Item):
-    """Comprehensive SEO item for storing detailed website analysis data"""
-    # Basic info
-    url = scrapy.Field()
-    timestamp = scrapy.Field()
-    user_agent = scrapy.Field()
-    
-    # Page performance
-    status_code = scrapy.Field()
-    content_type = scrapy.Field()
-    content_length = scrapy.Field()
-    load_time = scrapy.Field()
-    
-    # Title analysis
-    title = scrapy.Field()
-    title_length = scrapy.Field()
-    title_optimal = scrapy.Field()
-    
-    # Meta tags
-    meta_description = scrapy.Field()
-    meta_description_length = scrapy.Field()
-    meta_description_optimal = scrapy.Field()
-    meta_keywords = scrapy.Field()
-    
-    # Open Graph
-    og_title = scrapy.Field()
-    og_description = scrapy.Field()
-    og_image = scrapy.Field()
-    og_url = scrapy.Field()
-    
-    # Twitter Cards
-    twitter_card = scrapy.Field()
-    twitter_title = scrapy.Field()
-    twitter_description = scrapy.Field()
-    
-    # Links
-    canonical_url = scrapy.Field()
-    alternate_links = scrapy.Field()
-    
+import json
+from collections.abc import MutableMapping
+from datetime import date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# The SEO record: one schema for every field a scraped item can have.
+#
+# FIELDS lists each field once, in output order, with the type the job store
+# and the exports give it. SeoItem keeps a record in __slots__ built from that
+# list instead of a per-item dict, so a record is about half the size and an
+# unknown (misspelt) field is an error instead of a silently new key. It is a
+# MutableMapping, so code reading and writing items like dicts keeps working.
+# dumps() is the JSON encoder for API responses, NDJSON streams and exports:
+# orjson when it is installed, the json module otherwise (and for the values
+# orjson refuses, such as integers beyond 64 bits).
+
+INT = 'int'
+REAL = 'real'
+BOOL = 'bool'
+TEXT = 'text'
+JSON = 'json'
+
+FIELDS = (
+    # Request and response
+    ('url', TEXT),
+    ('timestamp', TEXT),
+    ('user_agent', TEXT),
+    ('status_code', INT),
+    ('content_type', TEXT),
+    ('content_length', INT),
+    ('body_truncated', BOOL),
+    ('load_time', REAL),
+    ('dns_time', REAL),
+    ('connect_time', REAL),
+    ('tls_time', REAL),
+    ('ttfb', REAL),
+    ('connection_reused', BOOL),
+    ('cache_status', TEXT),
+    ('memoized', BOOL),
+    # Title and meta tags
+    ('title', TEXT),
+    ('title_length', INT),
+    ('title_optimal', BOOL),
+    ('meta_description', TEXT),
+    ('meta_description_length', INT),
+    ('meta_description_optimal', BOOL),
+    ('meta_keywords', TEXT),
+    # Open Graph and Twitter Cards
+    ('og_title', TEXT),
+    ('og_description', TEXT),
+    ('og_image', TEXT),
+    ('og_url', TEXT),
+    ('twitter_card', TEXT),
+    ('twitter_title', TEXT),
+    ('twitter_description', TEXT),
+    # Canonical and alternates
+    ('canonical_url', TEXT),
+    ('alternate_links', JSON),
     # Headings
-    h1_count = scrapy.Field()
-    h1_texts = scrapy.Field()
-    h2_count = scrapy.Field()
-    h2_texts = scrapy.Field()
-    h3_count = scrapy.Field()
-    h4_count = scrapy.Field()
-    h5_count = scrapy.Field()
-    h6_count = scrapy.Field()
-    
+    ('h1_count', INT),
+    ('h1_texts', JSON),
+    ('h2_count', INT),
+    ('h2_texts', JSON),
+    ('h3_count', INT),
+    ('h3_texts', JSON),
+    ('h4_count', INT),
+    ('h4_texts', JSON),
+    ('h5_count', INT),
+    ('h6_count', INT),
     # Content
-    total_words = scrapy.Field()
-    unique_words = scrapy.Field()
-    paragraph_count = scrapy.Field()
-    paragraphs_with_text = scrapy.Field()
-    
-    # Links analysis
-    total_links = scrapy.Field()
-    internal_links = scrapy.Field()
-    external_links = scrapy.Field()
-    
-    # Images
-    total_images = scrapy.Field()
-    images_without_alt = scrapy.Field()
-    images_with_alt = scrapy.Field()
-    image_sources = scrapy.Field()
-    
-    # Forms and tables
-    form_count = scrapy.Field()
-    table_count = scrapy.Field()
-    
-    # Lists
-    unordered_lists = scrapy.Field()
-    ordered_lists = scrapy.Field()
-    
+    ('total_words', INT),
+    ('unique_words', INT),
+    ('top_keywords', JSON),
+    ('keyword_density', JSON),
+    ('sentence_count', INT),
+    ('avg_sentence_length', REAL),
+    ('avg_syllables_per_word', REAL),
+    ('flesch_reading_ease', REAL),
+    ('paragraph_count', INT),
+    ('paragraphs_with_text', INT),
+    # Links
+    ('total_links', INT),
+    ('internal_links', INT),
+    ('external_links', INT),
+    ('link_texts', JSON),
+    ('nofollow_links', INT),
+    ('external_domains', JSON),
+    ('internal_pages', JSON),
+    # Media, forms, tables and lists
+    ('total_images', INT),
+    ('images_without_alt', INT),
+    ('images_with_alt', INT),
+    ('image_details', JSON),
+    ('image_sources', JSON),
+    ('video_count', INT),
+    ('video_sources', JSON),
+    ('audio_count', INT),
+    ('form_count', INT),
+    ('table_count', INT),
+    ('unordered_lists', INT),
+    ('ordered_lists', INT),
     # Technical SEO
-    robots_directive = scrapy.Field()
-    viewport = scrapy.Field()
-    language = scrapy.Field()
-    charset = scrapy.Field()
-    
-    # Structured data
-    schema_scripts = scrapy.Field()
-    
-    # Analytics and tracking
-    google_analytics = scrapy.Field()
-    facebook_pixel = scrapy.Field()
-    
+    ('css_files', JSON),
+    ('js_files', JSON),
+    ('inline_css_count', INT),
+    ('inline_js_count', INT),
+    ('robots_directive', TEXT),
+    ('viewport', TEXT),
+    ('language', TEXT),
+    ('charset', TEXT),
+    ('all_meta_tags', JSON),
+    # Structured data, analytics and tracking
+    ('schema_scripts', INT),
+    ('structured_data_content', JSON),
+    ('google_analytics', BOOL),
+    ('facebook_pixel', BOOL),
     # Social and contact
-    social_media_links = scrapy.Field()
-    contact_links = scrapy.Field()
-    
+    ('social_media_links', JSON),
+    ('contact_links', JSON),
     # Performance indicators
-    has_ssl = scrapy.Field()
-    mobile_friendly = scrapy.Field()
-    seo_score = scrapy.Field() 
\ No newline at end of file
+    ('has_ssl', BOOL),
+    ('mobile_friendly', BOOL),
+    ('has_minified_css', BOOL),
+    ('has_minified_js', BOOL),
+    ('has_compressed_resources', BOOL),
+    # Score
+    ('seo_score', INT),
+    ('seo_recommendations', JSON),
+    # Response headers
+    ('security_headers', JSON),
+    ('server_info', JSON),
+    # Crawl and sitemap scans
+    ('outlinks', JSON),
+    ('crawl_depth', INT),
+    ('sitemap_lastmod', TEXT),
+    # Page resources (scraper/resources.py)
+    ('resource_urls', JSON),
+    ('resource_count', INT),
+    ('resource_bytes', INT),
+    ('broken_resources', INT),
+    ('redirected_resources', INT),
+    ('uncompressed_resources', INT),
+    ('uncached_resources', INT),
+    ('resource_details', JSON),
+    # Near-duplicate content (scraper/duplicates.py)
+    ('content_simhash', TEXT),
+    ('near_duplicate_count', INT),
+    ('near_duplicates', JSON),
+    # Site keywords (scraper/keywords.py)
+    ('term_counts', JSON),
+    ('tfidf_keywords', JSON),
+    ('competing_pages', JSON),
+    # Site link graph (scraper/linkgraph.py)
+    ('pagerank', REAL),
+    ('inlinks', INT),
+    ('outlink_count', INT),
+    ('click_depth', INT),
+    ('orphan', BOOL),
+    ('crawled', BOOL),
+    # Re-audit diffs (scraper/snapshots.py)
+    ('audit_status', TEXT),
+    ('changes', JSON),
+    # Diagnostics
+    ('debug_timings', JSON),
+    ('error', TEXT),
+)
+
+FIELD_NAMES = tuple(name for name, _ in FIELDS)
+FIELD_TYPES = dict(FIELDS)
+
+_MISSING = object()
+
+
+class SeoItem(MutableMapping):
+    """
+    One scraped page: the fields of FIELDS stored in slots, read and written like a dict
+
+    Only the fields that were set are present (`in`, iteration, len), in
+    schema order. Setting a field that is not in FIELDS raises KeyError.
+    """
+
+    __slots__ = FIELD_NAMES
+
+    def __init__(self, values=(), **fields):
+        if values:
+            self.update(values)
+        if fields:
+            self.update(fields)
+
+    def __getitem__(self, key):
+        if key in FIELD_TYPES:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in FIELD_TYPES:
+            raise KeyError(f"Unknown SEO field '{key}'")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __contains__(self, key):
+        return key in FIELD_TYPES and hasattr(self, key)
+
+    def __iter__(self):
+        for name in FIELD_NAMES:
+            if hasattr(self, name):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        if key in FIELD_TYPES:
+            return getattr(self, key, default)
+        return default
+
+    def to_dict(self):
+        """The set fields as a plain dict, in schema order"""
+        result = {}
+        for name in FIELD_NAMES:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                result[name] = value
+        return result
+
+    def copy(self):
+        return SeoItem(self.to_dict())
+
+    def __eq__(self, other):
+        if isinstance(other, SeoItem):
+            other = other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.update(state)
+
+    def __repr__(self):
+        return f'SeoItem({self.to_dict()!r})'
+
+
+def _default(value):
+    """JSON form of the values the encoders do not know: records, datetimes, str subclasses, ..."""
+    if isinstance(value, SeoItem):
+        return value.to_dict()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+_encoder = json.JSONEncoder(default=_default, separators=(',', ':'))
+
+if orjson is not None:
+    # Datetimes go through _default so both encoders write the same isoformat()
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(value):
+        """Compact JSON (bytes) of an item, a list of items or any JSON-like value"""
+        try:
+            return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Values orjson does not take, e.g. integers beyond 64 bits from JSON-LD
+            return _encoder.encode(value).encode('utf-8')
+else:
+    def dumps(value):
+        """Compact JSON (bytes) of an item, a list of items or any JSON-like value"""
+        return _encoder.encode(value).encode('utf-8')
+
+
+def ndjson_line(item):
+    """
+    An item as one NDJSON line
+
+    An item that cannot be encoded becomes an error record for its URL, so
+    a stream goes on with the next items instead of breaking off.
+    """
+    try:
+        return dumps(item) + b'\n'
+    except (TypeError, ValueError) as e:
+        return dumps({'url': item.get('url'), 'error': f"Could not encode the item: {e}"}) + b'\n'
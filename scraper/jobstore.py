@@ -0,0 +1,308 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from scraper import items, results, settings
+
+
+# Durable store for background scrape jobs and their results.
+#
+# A job row holds the request parameters and its progress; every finished
+# item is a row in job_results, numbered per job so results can be paged
+# through while the job is still running. Result rows use the column layout
+# of scraper/results.py (typed scalar columns plus one JSON column) and are
+# written with multi-row inserts. SQLite is used locally, MySQL
+# (mysql-connector-python) when SCRAPER_JOB_STORE=mysql.
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a job with different parameters"""
+
+
+def _now():
+    return time.time()
+
+
+class _SQLJobStore:
+    """Queries shared by the SQLite and MySQL stores; subclasses provide _execute"""
+
+    placeholder = '?'
+
+    def _sql(self, query):
+        return query.replace('?', self.placeholder)
+
+    def create_job(self, kind, params, idempotency_key=None):
+        """
+        Insert a new queued job; returns (job, created)
+
+        With an idempotency key that was already used, the existing job is
+        returned instead (created=False), so a retried submission does not
+        scrape again. Raises IdempotencyConflict if its parameters differ.
+        """
+        data = json.dumps(params, sort_keys=True)
+        if idempotency_key:
+            existing = self.get_job_by_key(idempotency_key)
+            if existing is not None:
+                return self._check_same(existing, kind, params), False
+
+        job_id = uuid.uuid4().hex
+        try:
+            self._execute('INSERT INTO jobs (id, kind, status, params, idempotency_key, created_at, completed) '
+                          'VALUES (?, ?, ?, ?, ?, ?, 0)', (job_id, kind, QUEUED, data, idempotency_key, _now()))
+        except self.integrity_errors:
+            # Same key submitted concurrently: the other request won
+            return self._check_same(self.get_job_by_key(idempotency_key), kind, params), False
+        return self.get_job(job_id), True
+
+    @staticmethod
+    def _check_same(job, kind, params):
+        if job['kind'] != kind or job['params'] != json.loads(json.dumps(params)):
+            raise IdempotencyConflict(f"Idempotency key already used for job {job['id']} with different parameters")
+        return job
+
+    def get_job(self, job_id):
+        rows = self._execute('SELECT id, kind, status, params, idempotency_key, created_at, started_at, finished_at, '
+                             'completed, error FROM jobs WHERE id = ?', (job_id,), fetch=True)
+        return self._job(rows[0]) if rows else None
+
+    def get_job_by_key(self, idempotency_key):
+        rows = self._execute('SELECT id FROM jobs WHERE idempotency_key = ?', (idempotency_key,), fetch=True)
+        return self.get_job(rows[0][0]) if rows else None
+
+    @staticmethod
+    def _job(row):
+        keys = ('id', 'kind', 'status', 'params', 'idempotency_key', 'created_at', 'started_at', 'finished_at',
+                'completed', 'error')
+        job = dict(zip(keys, row))
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def unfinished_jobs(self):
+        """Ids of queued jobs and of jobs a stopped process left running, oldest first"""
+        rows = self._execute('SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at',
+                             (QUEUED, RUNNING), fetch=True)
+        return [row[0] for row in rows]
+
+    def start_job(self, job_id):
+        """Mark a job running; results of an interrupted earlier run are discarded"""
+        self._execute('DELETE FROM job_results WHERE job_id = ?', (job_id,))
+        self._execute('UPDATE jobs SET status = ?, started_at = ?, completed = 0 WHERE id = ?',
+                      (RUNNING, _now(), job_id))
+
+    def _create_results_table(self, dialect, id_type):
+        columns = ', '.join(results.column_definitions(dialect))
+        self._execute(f'CREATE TABLE IF NOT EXISTS job_results ('
+                      f' job_id {id_type} NOT NULL, seq INTEGER NOT NULL, {columns}, PRIMARY KEY (job_id, seq))')
+        # Tables created before a field got its own column in the schema
+        existing = set(self._result_columns())
+        for name, definition in zip(results.column_names(), results.column_definitions(dialect)):
+            if name not in existing:
+                self._execute(f'ALTER TABLE job_results ADD COLUMN {definition}')
+
+    def add_results(self, job_id, items):
+        """Append result items with one multi-row insert"""
+        if not items:
+            return
+        rows = self._execute('SELECT completed FROM jobs WHERE id = ?', (job_id,), fetch=True)
+        start = rows[0][0]
+        columns = results.column_names()
+        self._execute_many(
+            f'INSERT INTO job_results (job_id, seq, {", ".join(columns)}) VALUES (?, ?{", ?" * len(columns)})',
+            [[job_id, start + i] + results.to_row(item) for i, item in enumerate(items)])
+        self._execute('UPDATE jobs SET completed = ? WHERE id = ?', (start + len(items), job_id))
+
+    def finish_job(self, job_id, error=None):
+        self._execute('UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?',
+                      (FAILED if error else DONE, _now(), error, job_id))
+
+    def _select_results(self, job_id, offset, limit):
+        return self._execute(f'SELECT {", ".join(results.column_names())} FROM job_results'
+                             f' WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?', (job_id, offset, limit), fetch=True)
+
+    def get_results(self, job_id, offset=0, limit=100):
+        return [results.from_row(row) for row in self._select_results(job_id, offset, limit)]
+
+    def rescore_results(self, job_id, rules, chunk_size=1000):
+        """
+        Recompute seo_score and seo_recommendations of a job's stored results with a scoring.RuleSet
+
+        Only the columns the rules read are selected (fields of the JSON
+        column are extracted by the database), chunk by chunk, and every
+        chunk is scored as columns; only the results whose score or
+        recommendations changed are written. Results without a score, or
+        stored without the fields the rules compare (a field selection), are
+        left as they are. Returns (rescored, changed, skipped).
+        """
+        selected = ['seq', 'seo_score', self.json_value.format(column=results.NESTED_COLUMN, key='seo_recommendations')]
+        conditions = ['job_id = ?', 'seq > ?', 'seo_score IS NOT NULL']
+        nested = []
+        for position, name in enumerate(rules.requires):
+            if name in results.SCALAR_FIELDS:
+                selected.append(name)
+                if name in rules.compared:
+                    conditions.append(f'{name} IS NOT NULL')
+            else:
+                selected.append(self.json_value.format(column=results.NESTED_COLUMN, key=name))
+                conditions.append(self.json_has.format(column=results.NESTED_COLUMN, key=name))
+                nested.append(position)
+        query = (f'SELECT {", ".join(selected)} FROM job_results WHERE {" AND ".join(conditions)}'
+                 f' ORDER BY seq LIMIT ?')
+        set_recommendations = self.json_set.format(column=results.NESTED_COLUMN, key='seo_recommendations')
+        update = (f'UPDATE job_results SET seo_score = ?, {results.NESTED_COLUMN} = {set_recommendations}'
+                  f' WHERE job_id = ? AND seq = ?')
+        update_score = 'UPDATE job_results SET seo_score = ? WHERE job_id = ? AND seq = ?'
+        rescored = changed = 0
+        last = -1
+        while True:
+            rows = self._execute(query, (job_id, last, chunk_size), fetch=True)
+            if not rows:
+                break
+            last = rows[-1][0]
+            seqs, old_scores, old_recommendations, *columns = zip(*rows)
+            for position in nested:
+                columns[position] = list(map(json.loads, columns[position]))
+            scores, recommendations = rules.score_columns(dict(zip(rules.requires, columns)))
+            updates, score_updates = [], []
+            for seq, score, texts, old_score, old_texts in zip(seqs, scores, recommendations, old_scores,
+                                                               old_recommendations):
+                # Compared decoded: MySQL returns JSON with spaces after separators, dumps() writes none
+                if old_texts is None or json.loads(old_texts) != texts:
+                    updates.append([score, items.dumps(texts).decode('utf-8'), job_id, seq])
+                elif score != old_score:
+                    score_updates.append([score, job_id, seq])
+            for statement, values in ((update, updates), (update_score, score_updates)):
+                if values:
+                    self._execute_many(statement, values)
+            rescored += len(rows)
+            changed += len(updates) + len(score_updates)
+        scored = self._execute('SELECT COUNT(*) FROM job_results WHERE job_id = ? AND seo_score IS NOT NULL',
+                               (job_id,), fetch=True)[0][0]
+        return rescored, changed, scored - rescored
+
+    def iter_result_rows(self, job_id, chunk_size=1000):
+        """Yield the raw result rows of a job in lists of up to chunk_size, for exports"""
+        offset = 0
+        while True:
+            rows = self._select_results(job_id, offset, chunk_size)
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            offset += len(rows)
+
+
+class SQLiteJobStore(_SQLJobStore):
+    """Job store in a local SQLite file"""
+
+    integrity_errors = (sqlite3.IntegrityError,)
+    # A field of a JSON column as JSON text, whether it is there, and setting it to the JSON text of a parameter
+    json_value = "json_quote(json_extract({column}, '$.{key}'))"
+    json_has = "json_type({column}, '$.{key}') IS NOT NULL"
+    json_set = "json_set({column}, '$.{key}', json(?))"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, params TEXT NOT NULL,'
+            ' idempotency_key TEXT UNIQUE, created_at REAL NOT NULL, started_at REAL, finished_at REAL,'
+            ' completed INTEGER NOT NULL DEFAULT 0, error TEXT)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        self._create_results_table('sqlite', 'TEXT')
+
+    def _result_columns(self):
+        return [row[1] for row in self._execute('PRAGMA table_info(job_results)', fetch=True)]
+
+    def _execute(self, query, params=(), fetch=False):
+        with self._lock:
+            cursor = self._db.execute(query, params)
+            return cursor.fetchall() if fetch else None
+
+    def _execute_many(self, query, rows):
+        with self._lock:
+            with self._db:
+                self._db.execute('BEGIN')
+                self._db.executemany(query, rows)
+
+
+class MySQLJobStore(_SQLJobStore):
+    """Job store in MySQL, for deployments where the local disk is not persistent"""
+
+    placeholder = '%s'
+    json_value = "JSON_EXTRACT({column}, '$.{key}')"
+    json_has = "JSON_CONTAINS_PATH({column}, 'one', '$.{key}')"
+    json_set = "JSON_SET({column}, '$.{key}', CAST(? AS JSON))"
+
+    def __init__(self, host, port, user, password, database, pool_size=5):
+        # Only needed when this backend is configured
+        import mysql.connector
+        from mysql.connector import pooling
+
+        self.integrity_errors = (mysql.connector.IntegrityError,)
+        self._pool = pooling.MySQLConnectionPool(pool_name='scraper_jobs', pool_size=pool_size, host=host, port=port,
+                                                 user=user, password=password, database=database, autocommit=True)
+        self._execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id VARCHAR(32) PRIMARY KEY, kind VARCHAR(16) NOT NULL, status VARCHAR(16) NOT NULL, params LONGTEXT NOT NULL,'
+            ' idempotency_key VARCHAR(255) UNIQUE, created_at DOUBLE NOT NULL, started_at DOUBLE, finished_at DOUBLE,'
+            ' completed INT NOT NULL DEFAULT 0, error TEXT, INDEX jobs_status (status, created_at))'
+        )
+        self._create_results_table('mysql', 'VARCHAR(32)')
+
+    def _result_columns(self):
+        rows = self._execute('SELECT COLUMN_NAME FROM information_schema.COLUMNS'
+                             ' WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = ?', ('job_results',), fetch=True)
+        return [row[0] for row in rows]
+
+    def _execute(self, query, params=(), fetch=False):
+        connection = self._pool.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self._sql(query), params)
+            rows = cursor.fetchall() if fetch else None
+            cursor.close()
+            return rows
+        finally:
+            connection.close()
+
+    def _execute_many(self, query, rows):
+        connection = self._pool.get_connection()
+        try:
+            cursor = connection.cursor()
+            connection.start_transaction()
+            cursor.executemany(self._sql(query), rows)
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide job store configured by SCRAPER_JOB_STORE"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.JOB_STORE == 'mysql':
+                    _store = MySQLJobStore(settings.MYSQL_HOST, settings.MYSQL_PORT, settings.MYSQL_USER,
+                                           settings.MYSQL_PASSWORD, settings.MYSQL_DATABASE)
+                else:
+                    _store = SQLiteJobStore(settings.JOB_DB_PATH)
+    return _store
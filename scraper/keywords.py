@@ -0,0 +1,168 @@
+import math
+import threading
+from array import array
+from heapq import nlargest
+
+from scraper import settings
+from scraper.duplicates import SiteIndexes
+
+
+# Site-level keyword index: TF-IDF keywords and pages competing for a term.
+#
+# Every site has a vocabulary that gives each term an integer id, the
+# document frequency of every term id in one array, and for every page the
+# ids and counts of its most frequent terms in two arrays. The postings of a
+# term (the pages it is indexed for) are an array of page ids. Indexing a page
+# only updates its own terms, and TF-IDF scores are computed from the current
+# counts when they are asked for, so nothing is recomputed over the corpus as
+# a crawl goes on. Scores of the first pages of a site are based on the few
+# pages indexed so far; GET /keywords answers with the counts at query time.
+
+# Most frequent terms of a page that are indexed; words further down the list
+# barely count towards its keywords and would make the index several times bigger
+TERMS_PER_PAGE = 100
+# TF-IDF keywords listed per page
+TOP_TERMS = 20
+# A page's best keywords that are looked up for competing pages, and pages listed per keyword
+COMPETING_TERMS = 3
+COMPETING_PAGES = 5
+
+
+class TermIndex:
+    """Terms of one site's pages with their document frequencies, updated page by page"""
+
+    def __init__(self):
+        self.terms = []
+        self._term_ids = {}
+        self.document_frequencies = array('I')
+        self._postings = []
+        self.urls = []
+        self._page_ids = {}
+        self._page_terms = []
+        self._page_counts = []
+        self._page_words = array('I')
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def _term_id(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self._term_ids[term] = len(self.terms)
+            self.terms.append(term)
+            self.document_frequencies.append(0)
+            self._postings.append(array('I'))
+        return term_id
+
+    def _idf(self, term_id):
+        # Tends to 0 for terms on every page; while a site has one page every term gets log(2)
+        return math.log((1 + len(self.urls)) / max(self.document_frequencies[term_id], 1))
+
+    def add(self, url, term_counts, total_words):
+        """
+        Index a page's (term, count) pairs, most frequent first; returns its TF-IDF keywords
+
+        A page that is already indexed replaces its previous terms.
+        """
+        term_counts = term_counts[:TERMS_PER_PAGE]
+        with self._lock:
+            page = self._page_ids.get(url)
+            if page is None:
+                page = self._page_ids[url] = len(self.urls)
+                self.urls.append(url)
+                self._page_terms.append(None)
+                self._page_counts.append(None)
+                self._page_words.append(0)
+            else:
+                for term_id in self._page_terms[page]:
+                    self.document_frequencies[term_id] -= 1
+                    self._postings[term_id].remove(page)
+            term_ids = array('I', [self._term_id(term) for term, _ in term_counts])
+            for term_id in term_ids:
+                self.document_frequencies[term_id] += 1
+                self._postings[term_id].append(page)
+            self._page_terms[page] = term_ids
+            self._page_counts[page] = array('I', [count for _, count in term_counts])
+            self._page_words[page] = total_words
+            return self._keywords(page)
+
+    def _keywords(self, page, limit=TOP_TERMS):
+        # TF-IDF = count / words * idf, with the idf of _idf() inlined for the whole page
+        words = self._page_words[page] or 1
+        pages = 1 + len(self.urls)
+        frequencies = self.document_frequencies
+        log = math.log
+        term_ids = self._page_terms[page]
+        scores = [count / words * log(pages / max(frequencies[term_id], 1))
+                  for term_id, count in zip(term_ids, self._page_counts[page])]
+        best = nlargest(limit, range(len(scores)), key=scores.__getitem__)
+        return [(self.terms[term_ids[position]], round(scores[position], 6)) for position in best]
+
+    def _competing(self, term_id, limit, exclude=None):
+        # The idf is the same for every page of the term: rank by term frequency
+        ranked = []
+        for page in self._postings[term_id]:
+            if page != exclude:
+                count = self._page_counts[page][self._page_terms[page].index(term_id)]
+                ranked.append((count / (self._page_words[page] or 1), count, page))
+        idf = self._idf(term_id)
+        return [{'url': self.urls[page], 'score': round(frequency * idf, 6), 'count': count}
+                for frequency, count, page in nlargest(limit, ranked)]
+
+    def keywords(self, url, limit=TOP_TERMS):
+        """Current TF-IDF keywords of an indexed page as (term, score), None if it is not indexed"""
+        with self._lock:
+            page = self._page_ids.get(url)
+            return None if page is None else self._keywords(page, limit)
+
+    def competing(self, term, limit=None):
+        """
+        Pages indexed for a term, best TF-IDF score first: {url, score, count}
+
+        Pages that rank for the same term compete with each other in search
+        results (keyword cannibalization).
+        """
+        with self._lock:
+            term_id = self._term_ids.get(term.strip().lower())
+            if term_id is None:
+                return []
+            return self._competing(term_id, limit or len(self._postings[term_id]))
+
+    def competing_pages(self, url, keywords):
+        """Other pages indexed for the first COMPETING_TERMS of a page's keywords: {term: [{url, score, count}]}"""
+        with self._lock:
+            page = self._page_ids.get(url)
+            competing = {}
+            for term, _ in keywords[:COMPETING_TERMS]:
+                pages = self._competing(self._term_ids[term], COMPETING_PAGES, exclude=page)
+                if pages:
+                    competing[term] = pages
+            return competing
+
+    def document_frequency(self, term):
+        with self._lock:
+            term_id = self._term_ids.get(term.strip().lower())
+            return 0 if term_id is None else self.document_frequencies[term_id]
+
+
+indexes = SiteIndexes(TermIndex, settings.KEYWORD_SITES)
+
+
+def check_items(scraped):
+    """
+    Index the term_counts of every item (removed from it) and add its tfidf_keywords and competing_pages
+
+    competing_pages holds, for the page's best keywords, the other pages of
+    the site scraped before it in this process that are indexed for them.
+    """
+    for item in scraped:
+        term_counts = item.pop('term_counts', None)
+        if term_counts is None or 'error' in item:
+            continue
+        index = indexes.get(item['url'])
+        keywords = index.add(item['url'], [tuple(pair) for pair in term_counts['terms']],
+                             term_counts['total_words'])
+        item['tfidf_keywords'] = keywords
+        item['competing_pages'] = index.competing_pages(item['url'], keywords)
+    return scraped
@@ -0,0 +1,218 @@
+import itertools
+from array import array
+from collections import Counter, deque
+from operator import mul, sub
+from urllib.parse import urlsplit
+
+from scraper.frontier import SKIP_EXTENSIONS, normalize_url, site_key
+from scraper.items import SeoItem
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Internal link graph of a crawled site.
+#
+# Pages get integer ids in the order they are found, and every internal link
+# is appended to two flat arrays of 32-bit ids (source, target) while the
+# crawl runs; there are no per-page lists or sets. Once the crawl is done the
+# edges are sorted into CSR form (per page an offset into one array of
+# neighbours), once for outgoing and once for incoming links, and PageRank,
+# inlink counts, click depth from the seed and orphan pages are computed
+# over those arrays. With numpy installed the PageRank iterations are
+# vectorized; otherwise they run over the arrays with map/sum, which still
+# handles a few hundred thousand pages.
+#
+# Link targets that were never crawled (beyond max_pages or max_depth, failed
+# to load, or only listed in the sitemap) stay in the graph with crawled
+# false: they count for inlinks, click depth and orphans, but their own links
+# are unknown, so PageRank is computed over the crawled pages and the links
+# between them only, and is None for the others.
+
+DAMPING = 0.85
+MAX_ITERATIONS = 100
+# Sum of the rank changes of all pages at which the iterations stop
+TOLERANCE = 1e-6
+
+
+class CSR:
+    """Adjacency of `size` nodes: the neighbours of node i are indices[indptr[i]:indptr[i + 1]]"""
+
+    __slots__ = ('indptr', 'indices')
+
+    def __init__(self, size, sources, targets):
+        # Stable sort: the neighbours of a node keep the order they were added in
+        order = sorted(range(len(sources)), key=sources.__getitem__)
+        self.indices = array('I', map(targets.__getitem__, order))
+        counts = Counter(sources)
+        self.indptr = array('Q', itertools.accumulate((counts[node] for node in range(size)), initial=0))
+
+    def degrees(self):
+        return array('I', map(sub, itertools.islice(self.indptr, 1, None), self.indptr))
+
+    def neighbours(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+
+def pagerank(incoming, out_degrees, damping=DAMPING, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """
+    PageRank of every node by power iteration over the incoming-link CSR; the ranks sum to 1
+
+    Pages without outgoing links spread their rank evenly over all pages.
+    """
+    size = len(out_degrees)
+    if not size:
+        return []
+    if numpy is not None:
+        return _pagerank_numpy(incoming, out_degrees, damping, max_iterations, tolerance)
+    inverse = [1.0 / degree if degree else 0.0 for degree in out_degrees]
+    dangling = [node for node, degree in enumerate(out_degrees) if not degree]
+    indices = incoming.indices
+    bounds = list(zip(incoming.indptr, itertools.islice(incoming.indptr, 1, None)))
+    ranks = [1.0 / size] * size
+    for _ in range(max_iterations):
+        shares = list(map(mul, ranks, inverse))
+        base = (1 - damping + damping * sum(map(ranks.__getitem__, dangling))) / size
+        new = [base + damping * sum(map(shares.__getitem__, indices[start:end])) for start, end in bounds]
+        change = sum(map(abs, map(sub, new, ranks)))
+        ranks = new
+        if change < tolerance:
+            break
+    return ranks
+
+
+def _pagerank_numpy(incoming, out_degrees, damping, max_iterations, tolerance):
+    size = len(out_degrees)
+    degrees = numpy.asarray(out_degrees, dtype=numpy.float64)
+    inverse = numpy.divide(1.0, degrees, out=numpy.zeros(size), where=degrees > 0)
+    dangling = degrees == 0
+    sources = numpy.asarray(incoming.indices, dtype=numpy.int64)
+    # Target of every incoming edge, so one bincount is the sparse matrix-vector product
+    targets = numpy.repeat(numpy.arange(size), numpy.diff(numpy.asarray(incoming.indptr, dtype=numpy.int64)))
+    ranks = numpy.full(size, 1.0 / size)
+    for _ in range(max_iterations):
+        shares = ranks * inverse
+        base = (1 - damping + damping * ranks[dangling].sum()) / size
+        new = base + damping * numpy.bincount(targets, weights=shares[sources], minlength=size)
+        change = numpy.abs(new - ranks).sum()
+        ranks = new
+        if change < tolerance:
+            break
+    return ranks.tolist()
+
+
+def click_depths(outgoing, start=0):
+    """Fewest clicks from `start` to every node (breadth-first); -1 where it cannot be reached"""
+    depths = array('i', [-1]) * (len(outgoing.indptr) - 1)
+    depths[start] = 0
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        depth = depths[node] + 1
+        for neighbour in outgoing.neighbours(node):
+            if depths[neighbour] < 0:
+                depths[neighbour] = depth
+                queue.append(neighbour)
+    return depths
+
+
+class LinkGraph:
+    """Pages and internal links of one site, collected during a crawl; the seed is page 0"""
+
+    def __init__(self, seed):
+        self.seed = normalize_url(seed)
+        if not self.seed:
+            raise ValueError(f"Invalid seed URL: {seed}")
+        self.site = site_key(self.seed)
+        self.urls = []
+        self._ids = {}
+        # 1 for the pages whose links were added
+        self._crawled = bytearray()
+        self._sources = array('I')
+        self._targets = array('I')
+        self._id(self.seed)
+
+    def __len__(self):
+        return len(self.urls)
+
+    @property
+    def link_count(self):
+        return len(self._targets)
+
+    def _id(self, url):
+        page = self._ids.get(url)
+        if page is None:
+            page = self._ids[url] = len(self.urls)
+            self.urls.append(url)
+            self._crawled.append(0)
+        return page
+
+    def _page_url(self, url):
+        """Normalized URL of a page of the site, None for other sites and non-HTML links (like the crawler)"""
+        if url in self._ids:
+            # Already normalized and in scope
+            return url
+        url = normalize_url(url)
+        if not url or site_key(url) != self.site or urlsplit(url).path.lower().endswith(SKIP_EXTENSIONS):
+            return None
+        return url
+
+    def add_page(self, url):
+        """Add a known page (from the sitemap, ...) that links may or may not point to"""
+        url = self._page_url(url)
+        if url is not None:
+            self._id(url)
+
+    def add_links(self, url, links):
+        """Add a crawled page and its links (absolute URLs); links to other sites and self-links are dropped"""
+        url = self._page_url(url)
+        if url is None:
+            return
+        source = self._id(url)
+        self._crawled[source] = 1
+        targets = {self._id(target) for target in map(self._page_url, links) if target is not None}
+        targets.discard(source)
+        self._sources.extend(itertools.repeat(source, len(targets)))
+        self._targets.extend(targets)
+
+    def _crawled_ranks(self, damping):
+        # PageRank of the subgraph of crawled pages, None for the other pages
+        crawled = [page for page, flag in enumerate(self._crawled) if flag]
+        ids = array('i', [-1]) * len(self.urls)
+        for node, page in enumerate(crawled):
+            ids[page] = node
+        sources, targets = array('I'), array('I')
+        for source, target in zip(self._sources, self._targets):
+            if ids[target] >= 0:
+                sources.append(ids[source])
+                targets.append(ids[target])
+        ranks = pagerank(CSR(len(crawled), targets, sources), CSR(len(crawled), sources, targets).degrees(), damping)
+        result = [None] * len(self.urls)
+        for node, page in enumerate(crawled):
+            result[page] = ranks[node]
+        return result
+
+    def analyze(self, damping=DAMPING):
+        """
+        One item per page with its pagerank, inlinks, outlink_count, click_depth, orphan and crawled flags
+
+        Crawled pages come first, best ranked first; pages only known from
+        links or the sitemap follow with crawled false and pagerank None.
+        click_depth counts the clicks from the seed (None if no link path
+        reaches the page); orphans are pages other than the seed that no
+        crawled page links to, i.e. pages only known from the sitemap.
+        """
+        size = len(self.urls)
+        outgoing = CSR(size, self._sources, self._targets)
+        incoming = CSR(size, self._targets, self._sources)
+        out_degrees = outgoing.degrees()
+        in_degrees = incoming.degrees()
+        ranks = self._crawled_ranks(damping)
+        depths = click_depths(outgoing)
+        order = sorted(range(size), key=lambda page: (ranks[page] is not None, ranks[page] or 0), reverse=True)
+        for page in order:
+            yield SeoItem(url=self.urls[page], pagerank=ranks[page], inlinks=in_degrees[page],
+                          outlink_count=out_degrees[page], click_depth=depths[page] if depths[page] >= 0 else None,
+                          orphan=page != 0 and not in_degrees[page], crawled=bool(self._crawled[page]))
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from scraper import settings
+
+
+# Memo table of finished analyses keyed by a hash of the response body.
+#
+# Many sites serve byte-identical HTML on every request without any cache
+# validators, so the HTTP cache cannot help. Hashing the body is far cheaper
+# than parsing it, and an identical body (for the same URL, analyzer version
+# and optional field groups) always produces the same analysis.
+
+_stats_lock = threading.Lock()
+stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        stats[name] += 1
+
+
+def memo_key(body, url, version, include=(), fields=None):
+    """Key of an analysis: body hash plus everything else the analysis depends on"""
+    selection = ",".join(sorted(fields)) if fields is not None else '*'
+    digest = hashlib.blake2b(body, digest_size=16)
+    digest.update(f'\0{url}\0{version}\0{",".join(sorted(include))}\0{selection}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class AnalysisMemo:
+    """LRU table bounded both by entry count and by total (JSON) size"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Stored analysis as a new dict, or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        _count('misses' if data is None else 'hits')
+        return json.loads(data) if data is not None else None
+
+    def put(self, key, analysis):
+        if self.max_entries <= 0:
+            return
+        data = json.dumps(analysis, default=str)
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                _count('evictions')
+
+    def size(self):
+        with self._lock:
+            return len(self._entries), self._bytes
+
+
+table = AnalysisMemo(settings.MEMO_MAX_ENTRIES, settings.MEMO_MAX_BYTES)
+
+
+def get_stats():
+    with _stats_lock:
+        snapshot = dict(stats)
+    snapshot['entries'], snapshot['bytes'] = table.size()
+    return snapshot
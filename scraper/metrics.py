@@ -0,0 +1,157 @@
+import threading
+from bisect import bisect_left
+
+from scraper import settings
+
+
+# In-process metrics served by GET /metrics in the Prometheus text format.
+#
+# Counters, gauges and histograms are plain Python objects guarded by a lock;
+# observing a value is a dict lookup and an increment, so recording on the hot
+# path costs microseconds. Values are per process: with several uvicorn
+# workers each one exposes its own series. SCRAPER_METRICS=off turns every
+# recording into a no-op and the phase timers are not run at all.
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(9))  # 1 KB .. 64 MB
+NODES_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+
+_registry = []
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [f'{self.name}{_labels(self.labels, key)} {_number(value)}' for key, value in values]
+
+
+class Counter(_Metric):
+    """Monotonic count per label values, e.g. errors.inc('Timeout')"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not settings.METRICS:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. scrapes in flight"""
+
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        if not settings.METRICS:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets, per label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not settings.METRICS:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self._header()
+        names = self.labels + ('le',)
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(names, key + (_number(bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+scrape_phase_seconds = Histogram('scraper_phase_seconds', 'Seconds spent per scrape phase', ('phase',))
+response_bytes = Histogram('scraper_response_bytes', 'Size of downloaded response bodies', buckets=BYTES_BUCKETS)
+parse_nodes = Histogram('scraper_parse_nodes', 'Element nodes in parsed documents', buckets=NODES_BUCKETS)
+scrapes_total = Counter('scraper_scrapes_total', 'Finished scrapes by mode and outcome', ('mode', 'outcome'))
+errors_total = Counter('scraper_errors_total', 'Failed scrapes by exception class', ('error',))
+scrapes_in_flight = Gauge('scraper_scrapes_in_flight', 'Scrapes currently running')
+resource_checks_total = Counter('scraper_resource_checks_total', 'Page resource lookups by source (cache or request)',
+                                ('source',))
+
+
+def enabled(debug_timings=False):
+    """Whether a scrape should time its phases: metrics are on or the caller asked for debug_timings"""
+    return settings.METRICS or debug_timings
+
+
+def record_scrape(mode, timings, content_length):
+    """Record the phase timings (and node count) of a finished scrape"""
+    for phase, seconds in timings.items():
+        if phase == 'parse_nodes':
+            parse_nodes.observe(seconds)
+        else:
+            scrape_phase_seconds.observe(seconds, phase)
+    if content_length is not None:
+        response_bytes.observe(content_length)
+    scrapes_total.inc(mode, 'ok')
+
+
+def record_error(mode, error):
+    """Count a failed scrape; `error` is the exception that was raised"""
+    scrapes_total.inc(mode, 'error')
+    errors_total.inc(type(error).__name__)
+
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
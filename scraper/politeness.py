@@ -0,0 +1,260 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from scraper import client, settings
+
+
+# Per-host politeness for the fetch layer.
+#
+# Every host (scheme, host and port) has a token bucket: a request takes a
+# token and waits when the bucket is empty, so bursts are allowed but the
+# average rate stays at SCRAPER_HOST_RATE. A 429 or 503 answer pauses the host
+# for its Retry-After (or an exponential backoff) and the scrape is retried.
+# robots.txt is fetched once per origin and kept for SCRAPER_ROBOTS_TTL; its
+# Crawl-delay lowers the host's rate. The waiting itself is left to the
+# callers (time.sleep in start_scraper, asyncio.sleep in the engine), this
+# module only decides how long.
+
+THROTTLE_STATUSES = (429, 503)
+
+# robots.txt bodies larger than this are cut off (RFC 9309 asks for at least 500 KiB)
+ROBOTS_MAX_BYTES = 512 * 1024
+
+
+class RobotsDisallowed(Exception):
+    """robots.txt does not allow fetching the URL"""
+
+
+class Throttled(Exception):
+    """The host answered 429 / 503; `delay` is how long it is paused, `retry` whether to try again"""
+
+    def __init__(self, message, delay, retry=True):
+        super().__init__(message)
+        self.delay = delay
+        self.retry = retry
+
+
+def origin(url):
+    """scheme://host[:port] of a URL, the unit of rate limits and robots.txt"""
+    parts = urlsplit(url)
+    return f'{parts.scheme.lower()}://{parts.netloc.lower()}'
+
+
+def retry_after(response):
+    """Seconds from a Retry-After header (delay or HTTP date), or None"""
+    value = response.headers.get('retry-after', '').strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Host:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'blocked_until', 'failures', 'connections', 'active')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.blocked_until = 0
+        self.failures = 0
+        self.connections = threading.BoundedSemaphore(settings.HOST_MAX_CONNECTIONS)
+        self.active = 0
+
+
+class HostScheduler:
+    """Token buckets and backoff state of the hosts seen recently (LRU, at most max_hosts)"""
+
+    def __init__(self, rate, burst, max_hosts=10000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_hosts = max_hosts
+        self._hosts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _host(self, key, now):
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = _Host(self.rate, self.burst, now)
+            if len(self._hosts) > self.max_hosts:
+                # Forget the least recently used idle host
+                for old_key, old in self._hosts.items():
+                    if not old.active and old_key != key:
+                        del self._hosts[old_key]
+                        break
+        else:
+            self._hosts.move_to_end(key)
+        return host
+
+    def reserve(self, url):
+        """Take a token for a request to the URL's host; returns the seconds to wait before sending it"""
+        if not settings.POLITENESS:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            host = self._host(origin(url), now)
+            wait = 0
+            if host.rate > 0:
+                host.tokens = min(host.burst, host.tokens + (now - host.updated) * host.rate)
+                host.updated = now
+                # Tokens go negative: requests queue up behind each other at the host's rate
+                host.tokens -= 1
+                if host.tokens < 0:
+                    wait = -host.tokens / host.rate
+            return max(wait, host.blocked_until - now)
+
+    def refund(self, url):
+        """Give back the token of a request that was not sent (served from the cache)"""
+        if not settings.POLITENESS:
+            return
+        with self._lock:
+            host = self._hosts.get(origin(url))
+            if host is not None and host.rate > 0:
+                host.tokens = min(host.burst, host.tokens + 1)
+
+    def set_crawl_delay(self, url, delay):
+        """Lower the host's rate to one request per `delay` seconds (robots.txt Crawl-delay)"""
+        with self._lock:
+            host = self._host(origin(url), time.monotonic())
+            rate = 1 / delay
+            host.rate = min(self.rate, rate) if self.rate > 0 else rate
+            host.burst = 1
+            host.tokens = min(host.tokens, 1)
+
+    def backoff(self, url, delay=None):
+        """Pause the host after a 429 / 503, for `delay` (Retry-After) or an exponential backoff; returns the pause"""
+        with self._lock:
+            now = time.monotonic()
+            host = self._host(origin(url), now)
+            host.failures += 1
+            if delay is None:
+                delay = min(settings.BACKOFF_BASE * 2 ** (host.failures - 1), settings.RETRY_MAX_WAIT)
+            host.blocked_until = max(host.blocked_until, now + delay)
+            return delay
+
+    def success(self, url):
+        with self._lock:
+            host = self._hosts.get(origin(url))
+            if host is not None:
+                host.failures = 0
+
+    @contextmanager
+    def connection(self, url):
+        """Hold one of the host's SCRAPER_HOST_MAX_CONNECTIONS connections (blocking, for threads)"""
+        if not settings.POLITENESS:
+            yield
+            return
+        with self._lock:
+            host = self._host(origin(url), time.monotonic())
+            host.active += 1
+        try:
+            with host.connections:
+                yield
+        finally:
+            with self._lock:
+                host.active -= 1
+
+
+class RobotsCache:
+    """Parsed robots.txt per origin, kept for `ttl` seconds (LRU, at most max_entries)"""
+
+    def __init__(self, ttl, error_ttl, max_entries=10000):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fetching = {}
+
+    def get(self, key):
+        """RobotFileParser of an origin, fetched when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[0]
+            # One download per origin; concurrent scrapes of the same site wait for it
+            fetch_lock = self._fetching.setdefault(key, threading.Lock())
+
+        with fetch_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > time.monotonic():
+                    return entry[0]
+            try:
+                parser, ttl = self._fetch(key)
+                with self._lock:
+                    self._entries[key] = (parser, time.monotonic() + ttl)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._fetching.pop(key, None)
+            return parser
+
+    def _fetch(self, key):
+        """
+        Download and parse robots.txt; returns (parser, seconds to keep it)
+
+        As in RFC 9309, a missing file (4xx) allows everything, while a
+        server error disallows everything until the entry expires after
+        `error_ttl`. Connection errors are raised and nothing is cached:
+        the page itself could not be fetched either.
+        """
+        parser = RobotFileParser(key + '/robots.txt')
+        response = client.get(key + '/robots.txt', headers={'User-Agent': settings.ROBOTS_USER_AGENT}, stream=True)
+        client.read_body(response, ROBOTS_MAX_BYTES)
+        if response.status_code >= 500:
+            parser.disallow_all = True
+            return parser, self.error_ttl
+        if response.status_code >= 400:
+            parser.allow_all = True
+            return parser, self.ttl
+        parser.parse(response.content.decode('utf-8', errors='replace').splitlines())
+        return parser, self.ttl
+
+
+scheduler = HostScheduler(settings.HOST_RATE, settings.HOST_BURST)
+robots = RobotsCache(settings.ROBOTS_TTL, settings.ROBOTS_ERROR_TTL)
+
+
+def check_robots(url):
+    """Raise RobotsDisallowed if robots.txt forbids the URL; applies its Crawl-delay to the host (blocking I/O)"""
+    if not settings.POLITENESS or not settings.ROBOTS:
+        return
+    parser = robots.get(origin(url))
+    delay = parser.crawl_delay(settings.ROBOTS_USER_AGENT)
+    if delay:
+        scheduler.set_crawl_delay(url, float(delay))
+    if not parser.can_fetch(settings.ROBOTS_USER_AGENT, url):
+        raise RobotsDisallowed(f"{url} is disallowed by robots.txt")
+
+
+def check_response(url, response):
+    """
+    Raise for error statuses like raise_for_status, pausing the host on 429 / 503
+
+    A throttled host is paused for its Retry-After (or an exponential backoff)
+    and Throttled is raised; its `retry` is False when the pause is longer
+    than SCRAPER_RETRY_MAX_WAIT.
+    """
+    if settings.POLITENESS:
+        if response.status_code in THROTTLE_STATUSES:
+            requested = retry_after(response)
+            retry = requested is None or requested <= settings.RETRY_MAX_WAIT
+            delay = scheduler.backoff(url, min(requested, settings.RETRY_MAX_WAIT) if requested is not None else None)
+            response.close()
+            raise Throttled(f"{response.status_code} from {origin(url)}, host paused for {delay:g}s", delay, retry)
+        scheduler.success(url)
+    response.raise_for_status()
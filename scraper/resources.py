@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from scraper import cache, client, metrics, politeness, settings
+
+
+# Checks of the files a page loads: stylesheets, scripts, icons, images and media.
+#
+# Each file is checked with a HEAD request that follows redirects. Servers
+# that refuse HEAD, or leave out the size, get a GET of the first byte
+# (Range: bytes=0-0) whose Content-Range holds the full size; the body is
+# never downloaded. Results are kept per absolute URL in one cache shared by
+# all pages, for SCRAPER_RESOURCE_TTL seconds, and a check that is still
+# running is shared as well, so the stylesheet, scripts and logo used on
+# every page of a site are checked once per crawl instead of once per page.
+
+# Content types that compress well; images, video and fonts mostly are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'javascript', 'json', 'xml', 'svg')
+# Smaller files gain nothing from compression
+COMPRESSION_MIN_BYTES = 1024
+# HEAD answers that mean the server only talks GET
+HEAD_REFUSED = (403, 405, 501)
+
+REQUEST_HEADERS = {'User-Agent': settings.ROBOTS_USER_AGENT, 'Accept-Encoding': 'gzip, deflate, br'}
+
+
+def _size(response):
+    """Full size of the file from Content-Range (ranged GET) or Content-Length, None if unknown"""
+    total = response.headers.get('content-range', '').rpartition('/')[2]
+    if response.status_code == 206 and total.isdigit():
+        return int(total)
+    length = response.headers.get('content-length', '')
+    return int(length) if length.isdigit() else None
+
+
+def _request(method, url, headers):
+    time.sleep(politeness.scheduler.reserve(url))
+    with politeness.scheduler.connection(url):
+        response = client.request(method, url, headers=headers, allow_redirects=True, stream=True)
+        response.close()
+    return response
+
+
+def check(url):
+    """
+    Status, size, compression, cache lifetime and redirect chain of one file (blocking I/O)
+
+    Returns {url, status, bytes, content_type, encoding, cache_lifetime,
+    redirects} and an `error` when the file could not be reached at all.
+    """
+    try:
+        response = _request('HEAD', url, REQUEST_HEADERS)
+        if response.status_code in HEAD_REFUSED or (response.status_code < 400 and _size(response) is None):
+            response = _request('GET', url, dict(REQUEST_HEADERS, Range='bytes=0-0'))
+    except Exception as e:
+        # Any failure is this file's result: the shared check must not raise for every page using it
+        return {'url': url, 'status': None, 'error': f"{type(e).__name__}: {e}"}
+    headers = response.headers
+    return {
+        'url': url,
+        'status': response.status_code,
+        'bytes': _size(response),
+        'content_type': headers.get('content-type', '').split(';')[0].strip().lower() or None,
+        'encoding': headers.get('content-encoding', '').lower() or None,
+        'cache_lifetime': int(cache.freshness_lifetime(headers)),
+        'redirects': [hop.url for hop in response.history] + [response.url] if response.history else [],
+    }
+
+
+def is_broken(result):
+    return result['status'] is None or result['status'] >= 400
+
+
+def is_uncompressed(result):
+    return (not is_broken(result) and result['encoding'] in (None, 'identity')
+            and (result['bytes'] or 0) >= COMPRESSION_MIN_BYTES
+            and any(kind in (result['content_type'] or '') for kind in COMPRESSIBLE_TYPES))
+
+
+class ResourceCache:
+    """
+    Check of every resource URL, reused for `ttl` seconds (`error_ttl` for broken ones; LRU, at most max_entries)
+
+    Entries hold the Future of the check, so pages that need a file while it
+    is being checked wait for that check instead of starting their own.
+    """
+
+    def __init__(self, ttl, error_ttl, max_entries, workers):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='resource-check')
+
+    def get(self, url):
+        """Future of the check of a URL, started when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and (not entry[0].done() or entry[1] > time.monotonic()):
+                self._entries.move_to_end(url)
+                metrics.resource_checks_total.inc('cache')
+                return entry[0]
+            future = self._pool.submit(check, url)
+            entry = self._entries[url] = [future, time.monotonic() + self.ttl]
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        metrics.resource_checks_total.inc('request')
+        future.add_done_callback(lambda done: self._expire(entry, done))
+        return future
+
+    def _expire(self, entry, future):
+        failed = future.cancelled() or future.exception() is not None
+        result = None if failed else future.result()
+        ttl = self.error_ttl if failed or result['status'] is None or result['status'] >= 500 else self.ttl
+        entry[1] = time.monotonic() + ttl
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+checks = ResourceCache(settings.RESOURCE_TTL, settings.RESOURCE_ERROR_TTL, settings.RESOURCE_CACHE_ENTRIES,
+                       settings.RESOURCE_WORKERS)
+
+
+def add_totals(item, urls, results):
+    """
+    Set an item's resource fields from the checks (`results`) of its resource_urls (`urls`, in the same order)
+
+    resource_bytes adds up the sizes that are known; a file counts as
+    uncached when browsers must revalidate it on every page view.
+    """
+    details = [dict(result, kind=kind) for kind, result in zip(urls.values(), results)]
+    working = [result for result in details if not is_broken(result)]
+    item['resource_count'] = len(details)
+    item['resource_bytes'] = sum(result['bytes'] or 0 for result in working)
+    item['broken_resources'] = len(details) - len(working)
+    item['redirected_resources'] = sum(1 for result in details if result.get('redirects'))
+    item['uncompressed_resources'] = sum(1 for result in working if is_uncompressed(result))
+    item['uncached_resources'] = sum(1 for result in working if not result['cache_lifetime'])
+    item['resource_details'] = details
+    return item
+
+
+def check_items(scraped):
+    """Replace the resource_urls of every item that is not an error by the checks of those files (blocking I/O)"""
+    for item in scraped:
+        if 'error' not in item:
+            urls = item.pop('resource_urls', None) or {}
+            futures = [checks.get(url) for url in urls]
+            add_totals(item, urls, [future.result() for future in futures])
+    return scraped
@@ -0,0 +1,217 @@
+import csv
+import io
+import json
+
+from scraper import items
+from scraper.items import BOOL, INT, JSON, REAL, TEXT
+
+
+# Column layout of stored result items and streaming exports.
+#
+# The layout follows the schema in scraper/items.py: scalar fields get a
+# typed column of their own so they can be filtered and exported without
+# decoding anything; lists and dicts (h1_texts, external_domains,
+# security_headers, ...) are kept together in one JSON column. Exports read
+# rows in chunks straight from the store and turn them into CSV / NDJSON
+# lines or Arrow record batches, so no more than one chunk is held in memory
+# whatever the number of results.
+
+# (field, type) of every scalar column, in schema order
+SCALAR_COLUMNS = [(name, kind) for name, kind in items.FIELDS if kind != JSON]
+SCALAR_FIELDS = frozenset(name for name, _ in SCALAR_COLUMNS)
+
+# Name of the JSON column holding every non-scalar field
+NESTED_COLUMN = 'nested'
+
+SQL_TYPES = {
+    'sqlite': {INT: 'INTEGER', REAL: 'REAL', BOOL: 'INTEGER', TEXT: 'TEXT', JSON: 'TEXT'},
+    'mysql': {INT: 'BIGINT', REAL: 'DOUBLE', BOOL: 'BOOLEAN', TEXT: 'TEXT', JSON: 'LONGTEXT'},
+}
+
+
+def all_fields():
+    """Every field an item can have, in schema order"""
+    return list(items.FIELD_NAMES)
+
+
+def column_definitions(dialect):
+    """SQL column definitions of the scalar and JSON columns"""
+    types = SQL_TYPES[dialect]
+    return [f'{name} {types[kind]}' for name, kind in SCALAR_COLUMNS] + [f'{NESTED_COLUMN} {types[JSON]}']
+
+
+def column_names():
+    return [name for name, _ in SCALAR_COLUMNS] + [NESTED_COLUMN]
+
+
+def to_row(item):
+    """Column values of an item: scalars in their columns (NULL when absent), the rest as JSON"""
+    row = [item.get(name) for name, _ in SCALAR_COLUMNS]
+    nested = {key: value for key, value in item.items() if key not in SCALAR_FIELDS}
+    row.append(items.dumps(nested).decode('utf-8') if nested else None)
+    return row
+
+
+def _row_dict(row):
+    """Fields of a to_row row as a plain dict: the scalar columns, then the JSON ones"""
+    fields = {}
+    for (name, kind), value in zip(SCALAR_COLUMNS, row):
+        if value is not None:
+            fields[name] = bool(value) if kind == BOOL else value
+    if row[-1]:
+        fields.update(json.loads(row[-1]))
+    return fields
+
+
+def from_row(row):
+    """Rebuild an item from to_row's column values"""
+    return items.SeoItem(_row_dict(row))
+
+
+def _columns(fields):
+    """Export columns: the selected fields (url and error first) or every known field"""
+    if fields is None:
+        return all_fields()
+    return ['url', 'error'] + [name for name in fields if name not in ('url', 'error')]
+
+
+def _cells(rows, fields):
+    """Yield each row as export cells: scalar values as stored, nested fields decoded"""
+    positions = {name: index for index, (name, _) in enumerate(SCALAR_COLUMNS)}
+    kinds = dict(SCALAR_COLUMNS)
+    for row in rows:
+        nested = json.loads(row[-1]) if row[-1] else {}
+        cells = []
+        for name in fields:
+            if name in positions:
+                value = row[positions[name]]
+                cells.append(bool(value) if kinds[name] == BOOL and value is not None else value)
+            else:
+                cells.append(nested.get(name))
+        yield cells
+
+
+def export_ndjson(chunks, fields=None):
+    """NDJSON lines (bytes), one item per line"""
+    for rows in chunks:
+        yield b''.join(items.dumps(_row_dict(row)) + b'\n' for row in rows)
+
+
+def export_csv(chunks, fields=None):
+    """CSV (bytes) with a header row; lists and dicts are written as JSON"""
+    columns = _columns(fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        for cells in _cells(rows, columns):
+            writer.writerow([items.dumps(cell).decode('utf-8') if isinstance(cell, (list, dict)) else cell for cell in cells])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _Drain:
+    """Write-only file that hands out what was written so far, for streaming pyarrow output"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_schema(pa, columns):
+    types = {INT: pa.int64(), REAL: pa.float64(), BOOL: pa.bool_(), TEXT: pa.string()}
+    kinds = dict(SCALAR_COLUMNS)
+    # Nested fields become JSON strings
+    return pa.schema([(name, types[kinds.get(name, TEXT)]) for name in columns])
+
+
+def _record_batches(pa, rows_chunks, columns, schema):
+    kinds = dict(SCALAR_COLUMNS)
+    for rows in rows_chunks:
+        cells = list(_cells(rows, columns))
+        arrays = []
+        for index, name in enumerate(columns):
+            values = [row[index] for row in cells]
+            if name not in kinds:
+                values = [items.dumps(value).decode('utf-8') if value is not None else None for value in values]
+            elif kinds[name] == REAL:
+                values = [float(value) if value is not None else None for value in values]
+            arrays.append(pa.array(values, type=schema.field(name).type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError("Arrow and Parquet export need pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def export_arrow(chunks, fields=None):
+    """Arrow IPC stream (bytes), one record batch per chunk of rows"""
+    pa = _require_pyarrow()
+    columns = _columns(fields)
+    schema = _arrow_schema(pa, columns)
+    sink = _Drain()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in _record_batches(pa, chunks, columns, schema):
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+
+def export_parquet(chunks, fields=None):
+    """Parquet file (bytes), one row group per chunk of rows"""
+    pa = _require_pyarrow()
+    import pyarrow.parquet as pq
+
+    columns = _columns(fields)
+    schema = _arrow_schema(pa, columns)
+    sink = _Drain()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in _record_batches(pa, chunks, columns, schema):
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+
+# format -> (writer, media type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson', 'ndjson'),
+    'csv': (export_csv, 'text/csv', 'csv'),
+    'arrow': (export_arrow, 'application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': (export_parquet, 'application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def exporter(fmt):
+    """(writer, media type, extension) of an export format; ValueError if unknown or unavailable"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt in ('arrow', 'parquet'):
+        _require_pyarrow()
+    return EXPORT_FORMATS[fmt]
@@ -0,0 +1,286 @@
+import json
+import math
+import string
+
+from scraper import settings
+from scraper.items import BOOL, FIELD_TYPES, INT, JSON, REAL, TEXT
+
+
+# SEO score and recommendations as data.
+#
+# A rule is (field, predicate, operand, result): the predicate is one of
+# PREDICATES, the operand a constant, another field ({"field": name,
+# "times": factor}) or None for truthy/falsy, and the result the points a
+# score rule adds or the text a recommendation rule adds ({field} in the text
+# is replaced by the field's value). A RuleSet compiles the rules once into
+# Python functions with an if per rule, as fast as a hand-written chain: one
+# scores an item, as the analysis does after extraction; the other scores a
+# batch of items given as columns (a sequence of values per field, as they
+# come out of the job store), with every field value in a local variable.
+# Stored results can so be rescored without fetching anything when the
+# rules change, about a million items in a few seconds.
+
+PREDICATES = ('truthy', 'falsy', '==', '!=', '>', '>=', '<', '<=')
+# Predicates testing the field's value alone
+TRUTH_PREDICATES = ('truthy', 'falsy')
+# Field types compared as numbers (booleans compare as 0 and 1)
+NUMBER_TYPES = (INT, REAL, BOOL)
+
+MAX_SCORE = 100
+
+SCORE_RULES = (
+    # Basic SEO (25 points)
+    ('title', 'truthy', None, 5),
+    ('meta_description', 'truthy', None, 5),
+    ('canonical_url', 'truthy', None, 3),
+    ('h1_count', '==', 1, 5),
+    ('images_with_alt', '>', 0, 3),
+    ('has_ssl', 'truthy', None, 4),
+    # Content quality (25 points)
+    ('total_words', '>', 300, 5),
+    ('total_words', '>', 1000, 5),
+    ('paragraph_count', '>', 5, 3),
+    ('sentence_count', '>', 10, 3),
+    ('flesch_reading_ease', '>', 60, 4),
+    ('unique_words', '>', 100, 5),
+    # Technical SEO (25 points)
+    ('mobile_friendly', 'truthy', None, 5),
+    ('og_title', 'truthy', None, 3),
+    ('og_description', 'truthy', None, 3),
+    ('twitter_card', 'truthy', None, 3),
+    ('schema_scripts', '>', 0, 5),
+    ('robots_directive', 'truthy', None, 3),
+    ('language', 'truthy', None, 3),
+    # Link structure (15 points)
+    ('internal_links', '>', 5, 5),
+    ('external_links', '>', 0, 3),
+    ('total_links', '>', 10, 4),
+    ('nofollow_links', '<', {'field': 'total_links', 'times': 0.5}, 3),
+    # Media optimization (10 points)
+    ('images_with_alt', '>', {'field': 'total_images', 'times': 0.8}, 5),
+    ('video_count', '>', 0, 3),
+    ('css_files', 'truthy', None, 2),
+)
+
+RECOMMENDATION_RULES = (
+    ('title', 'falsy', None, "Missing page title"),
+    ('meta_description', 'falsy', None, "Missing meta description"),
+    ('h1_count', '==', 0, "Missing H1 tag"),
+    ('h1_count', '>', 1, "Multiple H1 tags found"),
+    ('images_without_alt', '>', 0, "{images_without_alt} images missing alt text"),
+    ('has_ssl', 'falsy', None, "Website not using HTTPS"),
+    ('mobile_friendly', 'falsy', None, "No viewport meta tag for mobile"),
+    ('total_words', '<', 300, "Content too short (less than 300 words)"),
+    ('flesch_reading_ease', '<', 60, "Content may be too complex to read"),
+    ('nofollow_links', '>', {'field': 'total_links', 'times': 0.5}, "Too many nofollow links"),
+    ('og_title', 'falsy', None, "Missing Open Graph title"),
+    ('og_description', 'falsy', None, "Missing Open Graph description"),
+    ('twitter_card', 'falsy', None, "Missing Twitter Card"),
+    ('schema_scripts', '==', 0, "No structured data found"),
+    ('robots_directive', 'falsy', None, "No robots meta tag"),
+)
+
+
+def _known_field(name):
+    if name not in FIELD_TYPES:
+        raise ValueError(f"Unknown field '{name}' in scoring rule")
+    return name
+
+
+class Rule:
+    """One validated rule; condition() is its test as Python source"""
+
+    __slots__ = ('field', 'predicate', 'operand', 'result', 'other', 'times', 'message_fields')
+
+    def __init__(self, field, predicate, operand, result):
+        if predicate not in PREDICATES:
+            raise ValueError(f"Unknown predicate '{predicate}', expected one of: {', '.join(PREDICATES)}")
+        self.field = _known_field(field)
+        self.predicate = predicate
+        self.operand = operand
+        self.result = result
+        self.other = self.times = None
+        if predicate in TRUTH_PREDICATES:
+            if operand is not None:
+                raise ValueError(f"Predicate '{predicate}' takes no operand")
+        elif FIELD_TYPES[field] == JSON:
+            raise ValueError(f"'{field}' is a list or object, it only takes 'truthy' and 'falsy'")
+        elif isinstance(operand, dict):
+            self.other = _known_field(operand.get('field'))
+            self.times = operand.get('times', 1)
+            if not _is_number(self.times):
+                raise ValueError(f"The factor of '{self.other}' must be a number")
+            for name in (field, self.other):
+                if FIELD_TYPES[name] not in NUMBER_TYPES:
+                    raise ValueError(f"'{name}' is not a number, it cannot be compared to a multiple of a field")
+        elif FIELD_TYPES[field] == TEXT:
+            if not isinstance(operand, str):
+                raise ValueError(f"'{field}' is a text, predicate '{predicate}' needs a text")
+        elif not (_is_number(operand) or FIELD_TYPES[field] == BOOL and isinstance(operand, bool)):
+            raise ValueError(f"'{field}' is a number, predicate '{predicate}' needs a number")
+        self.message_fields = ()
+        if isinstance(result, str):
+            placeholders = [(name, spec, conversion) for _, name, spec, conversion in string.Formatter().parse(result)
+                            if name is not None]
+            for name, spec, conversion in placeholders:
+                if not name or name.isdigit():
+                    raise ValueError(f"Placeholders in '{result}' must name a field, like {{total_words}}")
+                # A format spec like {total_words:>1000000000} would build huge texts for every scored item
+                if spec or conversion:
+                    raise ValueError(f"Placeholders in '{result}' take no format spec or conversion")
+            names = [name for name, _, _ in placeholders]
+            self.message_fields = tuple(dict.fromkeys(_known_field(name) for name in names))
+
+    @property
+    def fields(self):
+        """Fields the rule reads"""
+        return (self.field,) + ((self.other,) if self.other else ()) + self.message_fields
+
+    @property
+    def compared(self):
+        """Fields that must hold a value for the comparison (truthy and falsy also take None)"""
+        if self.predicate in TRUTH_PREDICATES:
+            return ()
+        return (self.field, self.other) if self.other else (self.field,)
+
+    def to_list(self):
+        return [self.field, self.predicate, self.operand, self.result]
+
+    def condition(self, value, operand, times):
+        """
+        Python source of the rule's test
+
+        `value(field)` gives the source of a field's value, `operand` and
+        `times` the source of the rule's constants.
+        """
+        if self.predicate in TRUTH_PREDICATES:
+            return value(self.field) if self.predicate == 'truthy' else f'not {value(self.field)}'
+        if self.other is None:
+            return f'{value(self.field)} {self.predicate} {operand}'
+        return f'{value(self.field)} {self.predicate} {value(self.other)} * {times}'
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class RuleSet:
+    """Score and recommendation rules compiled for single items and for columns of many items"""
+
+    def __init__(self, score_rules=SCORE_RULES, recommendation_rules=RECOMMENDATION_RULES, max_score=MAX_SCORE):
+        self.score_rules = [Rule(*rule) for rule in score_rules]
+        self.recommendation_rules = [Rule(*rule) for rule in recommendation_rules]
+        self.max_score = max_score
+        if not _is_number(max_score):
+            raise ValueError("max_score must be a number")
+        for rule in self.score_rules:
+            if not _is_number(rule.result):
+                raise ValueError(f"Score rule on '{rule.field}' must give a number of points")
+        for rule in self.recommendation_rules:
+            if not isinstance(rule.result, str):
+                raise ValueError(f"Recommendation rule on '{rule.field}' must give a text")
+        rules = self.score_rules + self.recommendation_rules
+        if not rules:
+            raise ValueError("A rule set needs at least one score or recommendation rule")
+        # Fields the rules read, in rule order
+        self.requires = tuple(dict.fromkeys(name for rule in rules for name in rule.fields))
+        self.compared = frozenset(name for rule in rules for name in rule.compared)
+        self._namespace = {'max_score': max_score}
+        self.score = self._compile_item()
+        self._score_rows = self._compile_rows()
+
+    def _constant(self, name, value):
+        # Numbers are written into the source, everything else is looked up by name
+        if _is_number(value) and math.isfinite(value):
+            return repr(value)
+        self._namespace[name] = value
+        return name
+
+    def _condition(self, name, rule, value):
+        return rule.condition(value, self._constant(f'{name}_operand', rule.operand),
+                              self._constant(f'{name}_times', rule.times))
+
+    def _rule_lines(self, value, indent):
+        # An if per rule, setting `points` and `recommendations`
+        lines = ['points = 0']
+        for index, rule in enumerate(self.score_rules):
+            name = f'score{index}'
+            lines.append(f'if {self._condition(name, rule, value)}: points += {self._constant(name, rule.result)}')
+        lines.append('recommendations = []')
+        for index, rule in enumerate(self.recommendation_rules):
+            name = f'recommendation{index}'
+            text = self._constant(name, rule.result)
+            if rule.message_fields:
+                values = ', '.join(f'{field!r}: {value(field)}' for field in rule.message_fields)
+                text = f'{text}.format_map({{{values}}})'
+            lines.append(f'if {self._condition(name, rule, value)}: recommendations.append({text})')
+        return [' ' * indent + line for line in lines]
+
+    def _define(self, name, lines):
+        exec(compile('\n'.join(lines), '<scoring rules>', 'exec'), self._namespace)
+        return self._namespace[name]
+
+    def _compile_item(self):
+        # As fast as the hand-written if chain it replaces
+        lines = ['def score(item):'] + self._rule_lines(lambda field: f'item[{field!r}]', 4) + [
+            "    item['seo_score'] = min(points, max_score)",
+            "    item['seo_recommendations'] = recommendations",
+        ]
+        score = self._define('score', lines)
+        score.__doc__ = "Add seo_score and seo_recommendations to an analysed item"
+        return score
+
+    def _compile_rows(self):
+        # The same chain over the rows of columns, with every field value in a local variable
+        variables = {field: f'value{index}' for index, field in enumerate(self.requires)}
+        lines = ['def score_rows(columns):',
+                 '    scores, all_recommendations = [], []',
+                 f"    for {', '.join(variables.values())}, in zip(*columns):"]
+        lines += self._rule_lines(variables.__getitem__, 8)
+        lines += ['        scores.append(min(points, max_score))',
+                  '        all_recommendations.append(recommendations)',
+                  '    return scores, all_recommendations']
+        return self._define('score_rows', lines)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rules from their JSON form: {"score": [[field, predicate, operand, points], ...], "recommendations": [...]}"""
+        if not isinstance(data, dict):
+            raise ValueError("Scoring rules must be an object with 'score' and 'recommendations' lists")
+        try:
+            return cls(data.get('score', SCORE_RULES), data.get('recommendations', RECOMMENDATION_RULES),
+                       data.get('max_score', MAX_SCORE))
+        except (TypeError, AttributeError, KeyError) as e:
+            # Rules of the wrong shape, e.g. not a list of four values
+            raise ValueError(f"Invalid scoring rule: {e}")
+
+    def to_dict(self):
+        return {
+            'max_score': self.max_score,
+            'score': [rule.to_list() for rule in self.score_rules],
+            'recommendations': [rule.to_list() for rule in self.recommendation_rules],
+        }
+
+    def score_columns(self, columns):
+        """
+        seo_score and seo_recommendations of a batch of items given as columns: ([score], [[recommendation]])
+
+        `columns` maps every field of `requires` to a sequence with the
+        values of that field, one per item.
+        """
+        return self._score_rows([columns[field] for field in self.requires])
+
+
+def columns(records, fields):
+    """Columns (one list per field) of dict-like records"""
+    return {name: [record.get(name) for record in records] for name in fields}
+
+
+def load(path):
+    """RuleSet from a JSON file, see RuleSet.from_dict"""
+    with open(path, encoding='utf-8') as f:
+        return RuleSet.from_dict(json.load(f))
+
+
+# The rules of SCRAPER_SCORE_RULES (a JSON file), the default ones otherwise
+rules = load(settings.SCORE_RULES) if settings.SCORE_RULES else RuleSet()
@@ -57,4 +57,5 @@ class SeoSpider(scrapy.Spider):
         images_without_alt = [img for img in images if not img.get('alt')]
         item['images_without_alt'] = len(images_without_alt)
         
-        yield item 
\ No newline at end of file
+        # Scrapy takes dicts, not SeoItem (a MutableMapping it does not recognise as an item)
+        yield item.to_dict() 
\ No newline at end of file
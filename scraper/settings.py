@@ -0,0 +1,121 @@
+import os
+
+# Runtime settings, overridable through environment variables (e.g. in render.yaml)
+
+# Maximum number of scrapes the API runs at the same time (per worker process)
+MAX_CONCURRENT_SCRAPES = int(os.environ.get('SCRAPER_MAX_CONCURRENCY', '100'))
+
+# Default number of URLs of one batch scraped in parallel (capped by MAX_CONCURRENT_SCRAPES)
+BATCH_CONCURRENCY = int(os.environ.get('SCRAPER_BATCH_CONCURRENCY', '20'))
+
+# Default page limit of a site crawl
+CRAWL_MAX_PAGES = int(os.environ.get('SCRAPER_CRAWL_MAX_PAGES', '500'))
+
+# Number of threads used for the CPU bound HTML analysis
+ANALYSIS_WORKERS = int(os.environ.get('SCRAPER_ANALYSIS_WORKERS', str(os.cpu_count() or 1)))
+
+# Worker processes for parsing and scoring, so analysis runs beside the GIL-bound
+# event loop and fetch threads; 0 analyses on the ANALYSIS_WORKERS threads instead
+ANALYSIS_PROCESSES = int(os.environ.get('SCRAPER_ANALYSIS_PROCESSES', str(os.cpu_count() if (os.cpu_count() or 1) > 1 else 0)))
+
+# Pages handed to the analysis workers at once (see app/engine.py)
+ANALYSIS_QUEUE_SIZE = int(os.environ.get('SCRAPER_ANALYSIS_QUEUE_SIZE', str(max(ANALYSIS_PROCESSES, ANALYSIS_WORKERS) * 4)))
+
+# Shared HTTP client (scraper/client.py)
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('SCRAPER_CONNECT_TIMEOUT', '10'))
+HTTP_READ_TIMEOUT = float(os.environ.get('SCRAPER_READ_TIMEOUT', '30'))
+# Number of hosts whose connection pools are kept open
+HTTP_POOL_HOSTS = int(os.environ.get('SCRAPER_POOL_HOSTS', '100'))
+# Keep-alive connections kept per host
+HTTP_POOL_SIZE_PER_HOST = int(os.environ.get('SCRAPER_POOL_SIZE_PER_HOST', '10'))
+# Seconds a resolved host address is reused
+DNS_CACHE_TTL = float(os.environ.get('SCRAPER_DNS_CACHE_TTL', '300'))
+
+# Bytes of a response body read at most; larger pages are analysed from their first
+# MAX_BODY_BYTES and flagged with body_truncated
+MAX_BODY_BYTES = int(os.environ.get('SCRAPER_MAX_BODY_BYTES', str(10 * 1024 * 1024)))
+# Bytes read at most in mode=head when </head> does not come earlier
+HEAD_MAX_BYTES = int(os.environ.get('SCRAPER_HEAD_MAX_BYTES', str(256 * 1024)))
+
+# Per-host politeness (scraper/politeness.py); 'off' disables rate limits, robots.txt and retries
+POLITENESS = os.environ.get('SCRAPER_POLITENESS', 'on').lower() not in ('off', '0', 'false', 'no')
+# Average requests per second and burst size per host; 0 means no rate limit
+HOST_RATE = float(os.environ.get('SCRAPER_HOST_RATE', '4'))
+HOST_BURST = int(os.environ.get('SCRAPER_HOST_BURST', '8'))
+# Requests to one host in flight at the same time
+HOST_MAX_CONNECTIONS = int(os.environ.get('SCRAPER_HOST_MAX_CONNECTIONS', '4'))
+# Retries after a 429 / 503; a Retry-After longer than RETRY_MAX_WAIT seconds fails the scrape
+RETRY_MAX = int(os.environ.get('SCRAPER_RETRY_MAX', '2'))
+RETRY_MAX_WAIT = float(os.environ.get('SCRAPER_RETRY_MAX_WAIT', '60'))
+# First pause of a throttled host without Retry-After, doubled on every further 429 / 503
+BACKOFF_BASE = float(os.environ.get('SCRAPER_BACKOFF_BASE', '1'))
+# robots.txt: obeyed unless 'off', cached per origin for ROBOTS_TTL seconds
+# (ROBOTS_ERROR_TTL after a server error or an unreachable host)
+ROBOTS = os.environ.get('SCRAPER_ROBOTS', 'on').lower() not in ('off', '0', 'false', 'no')
+ROBOTS_USER_AGENT = os.environ.get('SCRAPER_ROBOTS_USER_AGENT', 'SEOScraperBot')
+ROBOTS_TTL = float(os.environ.get('SCRAPER_ROBOTS_TTL', '3600'))
+ROBOTS_ERROR_TTL = float(os.environ.get('SCRAPER_ROBOTS_ERROR_TTL', '300'))
+
+# Sitemap ingestion (scraper/sitemap.py): uncompressed size limit per file, levels of
+# sitemap index files followed and URLs scanned at most per request
+SITEMAP_MAX_BYTES = int(os.environ.get('SCRAPER_SITEMAP_MAX_BYTES', str(64 * 1024 * 1024)))
+SITEMAP_MAX_DEPTH = int(os.environ.get('SCRAPER_SITEMAP_MAX_DEPTH', '3'))
+SITEMAP_MAX_URLS = int(os.environ.get('SCRAPER_SITEMAP_MAX_URLS', '50000'))
+
+# Checks of the files pages load with resources=true (scraper/resources.py): parallel checks,
+# and how long a result is reused across pages (RESOURCE_ERROR_TTL for unreachable files)
+RESOURCE_WORKERS = int(os.environ.get('SCRAPER_RESOURCE_WORKERS', '16'))
+RESOURCE_TTL = float(os.environ.get('SCRAPER_RESOURCE_TTL', '3600'))
+RESOURCE_ERROR_TTL = float(os.environ.get('SCRAPER_RESOURCE_ERROR_TTL', '300'))
+RESOURCE_CACHE_ENTRIES = int(os.environ.get('SCRAPER_RESOURCE_CACHE_ENTRIES', '100000'))
+
+# Near-duplicate detection with duplicates=true (scraper/duplicates.py): SimHash bits two
+# pages may differ in, and sites whose page fingerprints are kept in memory
+DUPLICATE_MAX_DISTANCE = int(os.environ.get('SCRAPER_DUPLICATE_MAX_DISTANCE', '3'))
+DUPLICATE_SITES = int(os.environ.get('SCRAPER_DUPLICATE_SITES', '1000'))
+
+# Sites whose keyword index is kept in memory for keywords=true (scraper/keywords.py)
+KEYWORD_SITES = int(os.environ.get('SCRAPER_KEYWORD_SITES', '100'))
+
+# Phase timings, sizes and error counters for GET /metrics (scraper/metrics.py); 'off' disables them
+METRICS = os.environ.get('SCRAPER_METRICS', 'on').lower() not in ('off', '0', 'false', 'no')
+
+# BeautifulSoup parser: 'lxml' (fast, in requirements.txt) or 'html.parser'
+HTML_PARSER = os.environ.get('SCRAPER_HTML_PARSER', 'lxml')
+
+# HTTP response cache (scraper/cache.py): 'memory', 'sqlite' or 'off'
+CACHE_BACKEND = os.environ.get('SCRAPER_CACHE', 'memory')
+CACHE_MAX_BYTES = int(os.environ.get('SCRAPER_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_PATH = os.environ.get('SCRAPER_CACHE_PATH', 'data/http_cache.sqlite3')
+
+# Last analysis of every URL for diff=true re-audits (scraper/snapshots.py)
+SNAPSHOT_DB_PATH = os.environ.get('SCRAPER_SNAPSHOT_DB_PATH', 'data/snapshots.sqlite3')
+
+# Memoized analyses keyed by response body hash (scraper/memo.py); 0 entries disables it
+MEMO_MAX_ENTRIES = int(os.environ.get('SCRAPER_MEMO_MAX_ENTRIES', '1000'))
+MEMO_MAX_BYTES = int(os.environ.get('SCRAPER_MEMO_MAX_BYTES', str(32 * 1024 * 1024)))
+
+# JSON file of scoring rules replacing the default ones (scraper/scoring.py)
+SCORE_RULES = os.environ.get('SCRAPER_SCORE_RULES', '')
+
+# Append-only archive of the raw pages fetched, for GET /archive/replay (scraper/archive.py); empty disables it
+ARCHIVE_DIR = os.environ.get('SCRAPER_ARCHIVE_DIR', '')
+# Size a segment file of the archive grows to before the next one is started, and its gzip level
+# (3 compresses HTML about as well as 6 at more than twice the speed)
+ARCHIVE_SEGMENT_BYTES = int(os.environ.get('SCRAPER_ARCHIVE_SEGMENT_BYTES', str(1024 * 1024 * 1024)))
+ARCHIVE_COMPRESSION = int(os.environ.get('SCRAPER_ARCHIVE_COMPRESSION', '3'))
+# Archived pages an analysis worker reads and analyses per task during a replay
+ARCHIVE_REPLAY_CHUNK = int(os.environ.get('SCRAPER_ARCHIVE_REPLAY_CHUNK', '16'))
+
+# Background jobs (app/jobs.py, scraper/jobstore.py): 'sqlite' locally or 'mysql'
+JOB_STORE = os.environ.get('SCRAPER_JOB_STORE', 'sqlite')
+JOB_DB_PATH = os.environ.get('SCRAPER_JOB_DB_PATH', 'data/jobs.sqlite3')
+# Jobs run at the same time; each batch job still scrapes its URLs concurrently
+JOB_WORKERS = int(os.environ.get('SCRAPER_JOB_WORKERS', '4'))
+# Results written to the store per insert
+JOB_RESULTS_BATCH_SIZE = int(os.environ.get('SCRAPER_JOB_RESULTS_BATCH_SIZE', '50'))
+MYSQL_HOST = os.environ.get('MYSQL_HOST', 'localhost')
+MYSQL_PORT = int(os.environ.get('MYSQL_PORT', '3306'))
+MYSQL_USER = os.environ.get('MYSQL_USER', '')
+MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD', '')
+MYSQL_DATABASE = os.environ.get('MYSQL_DATABASE', 'seo_scraper')
@@ -0,0 +1,176 @@
+import gzip
+import io
+import time
+from datetime import datetime, timezone
+
+from lxml import etree
+
+from scraper import client, politeness, settings
+
+
+# Streaming sitemap ingestion, used to seed scans of a whole site.
+#
+# Sitemaps are found through the Sitemap: lines of robots.txt (or /sitemap.xml)
+# and sitemap index files are followed. Each file is read straight off the
+# socket (gunzipped on the fly for .xml.gz) by lxml's iterparse, and every
+# <url> element is cleared once its loc and lastmod are read, so a 50 MB file
+# with 50,000 URLs is processed in constant memory. Only the locations of
+# child sitemaps of an index are kept until the index is done.
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class SitemapError(Exception):
+    """A sitemap could not be downloaded or parsed"""
+
+
+def parse_lastmod(value):
+    """
+    Timezone-aware datetime from a W3C datetime (2024-05-01, 2024-05-01T10:00:00+02:00, ...)
+
+    Values without a timezone are taken as UTC. Raises ValueError for
+    anything else.
+    """
+    value = value.strip()
+    if len(value) in (4, 7):
+        # Year or year-month precision
+        value += '-01-01'[len(value) - 4:]
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _lastmod(value):
+    try:
+        return parse_lastmod(value) if value else None
+    except ValueError:
+        return None
+
+
+def discover(url):
+    """
+    Sitemap URLs of a site: the URL itself if it is a sitemap, else robots.txt's Sitemap: lines or /sitemap.xml
+    """
+    path = url.split('?', 1)[0].lower()
+    if path.endswith(('.xml', '.xml.gz')):
+        return [url]
+    site = politeness.origin(url)
+    try:
+        listed = politeness.robots.get(site).site_maps()
+    except Exception:
+        listed = None
+    return listed or [site + '/sitemap.xml']
+
+
+class _Reader(io.RawIOBase):
+    """
+    Readable over `stream` that starts with `prefix` (bytes already read from it)
+
+    With max_bytes it fails once more than that was read, against oversized
+    or gzip-bomb sitemaps.
+    """
+
+    def __init__(self, stream, prefix=b'', max_bytes=None, url=None):
+        self._stream = stream
+        self._prefix = prefix
+        self._remaining = max_bytes
+        self._url = url
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            data, self._prefix = self._prefix[:len(buffer)], self._prefix[len(buffer):]
+        else:
+            data = self._stream.read(len(buffer)) or b''
+        if self._remaining is not None:
+            self._remaining -= len(data)
+            if self._remaining < 0:
+                raise SitemapError(f"Sitemap {self._url} is larger than {settings.SITEMAP_MAX_BYTES} bytes")
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _open(url):
+    """Streamed, decompressed body of a sitemap as a file object"""
+    time.sleep(politeness.scheduler.reserve(url))
+    response = client.get(url, headers={'User-Agent': settings.ROBOTS_USER_AGENT}, stream=True)
+    politeness.check_response(url, response)
+    # Undo Content-Encoding: gzip; a .xml.gz file is gzipped once more
+    response.raw.decode_content = True
+    magic = response.raw.read(2) or b''
+    stream = _Reader(response.raw, magic)
+    if magic == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+    return response, _Reader(stream, max_bytes=settings.SITEMAP_MAX_BYTES, url=url)
+
+
+def _children(elem):
+    """(loc, lastmod) text of a <url> or <sitemap> element"""
+    loc = lastmod = None
+    for child in elem:
+        if not isinstance(child.tag, str):
+            continue
+        name = etree.QName(child).localname
+        if name == 'loc':
+            loc = (child.text or '').strip()
+        elif name == 'lastmod':
+            lastmod = child.text
+    return loc, lastmod
+
+
+def _parse(url, since):
+    """
+    Yield ('url' | 'sitemap', loc, lastmod) for every entry of one sitemap file
+
+    Elements are cleared as soon as they are read, together with the siblings
+    before them, so the tree never grows.
+    """
+    response, stream = _open(url)
+    try:
+        for _, elem in etree.iterparse(stream, events=('end',), tag=('{*}url', '{*}sitemap'),
+                                       resolve_entities=False, no_network=True, load_dtd=False):
+            kind = etree.QName(elem).localname
+            loc, lastmod = _children(elem)
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+            if not loc:
+                continue
+            lastmod = _lastmod(lastmod)
+            if since is not None and lastmod is not None and lastmod < since:
+                # Unchanged page, or a child sitemap with no page changed since
+                continue
+            yield ('url' if kind == 'url' else 'sitemap'), loc, lastmod
+    except etree.XMLSyntaxError as e:
+        raise SitemapError(f"Invalid sitemap {url}: {e}")
+    finally:
+        response.close()
+
+
+def iter_urls(url, since=None, max_depth=None):
+    """
+    Yield (page url, lastmod datetime or None) from the sitemaps of a site, streaming
+
+    `url` is a site URL (sitemaps are discovered) or a sitemap / sitemap index
+    URL. With `since` (an aware datetime) only pages whose lastmod is at or
+    after it are returned; pages without a lastmod are always returned, they
+    may have changed. Index files are followed up to `max_depth` levels
+    (default SCRAPER_SITEMAP_MAX_DEPTH); each sitemap is read once.
+    """
+    max_depth = settings.SITEMAP_MAX_DEPTH if max_depth is None else max_depth
+    pending = [(sitemap, 0) for sitemap in discover(url)]
+    seen = set()
+    while pending:
+        sitemap, depth = pending.pop(0)
+        if sitemap in seen:
+            continue
+        seen.add(sitemap)
+        children = []
+        for kind, loc, lastmod in _parse(sitemap, since):
+            if kind == 'url':
+                yield loc, lastmod
+            elif depth < max_depth:
+                children.append((loc, depth + 1))
+        # Children of an index are read depth-first, after the index itself is closed
+        pending[:0] = children
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from scraper import items, settings
+from scraper.items import SeoItem
+
+
+# Snapshots of the last analysis of every URL, for incremental re-audits.
+#
+# A snapshot keeps the fields of a URL's last item and a short hash of each
+# one. Comparing a new scrape with it hashes the new values and compares the
+# hashes, so large nested fields (link_texts, image_details, ...) are never
+# compared element by element, and the stored values are only decoded when
+# something changed. Fields that differ on every request (timings, timestamp,
+# ...) are not part of a snapshot. A comparison returns a small item with
+# `audit_status` ('new', 'changed' or 'unchanged') and `changes`
+# ({field: {'old': ..., 'new': ...}}) instead of the full record.
+
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+# Fields of a comparison result besides url (and error)
+DIFF_FIELDS = ('timestamp', 'audit_status', 'changes')
+
+# Request-dependent fields, headers like Expires that change every day, and the
+# near-duplicate and keyword results, which depend on the other pages indexed so far
+VOLATILE_FIELDS = frozenset((
+    'timestamp', 'user_agent', 'load_time', 'dns_time', 'connect_time', 'tls_time', 'ttfb',
+    'connection_reused', 'cache_status', 'memoized', 'server_info', 'outlinks', 'crawl_depth',
+    'near_duplicate_count', 'near_duplicates', 'tfidf_keywords', 'competing_pages',
+    'debug_timings', 'audit_status', 'changes', 'error',
+))
+
+
+def field_hash(value):
+    """Stable hash of a field value, the same across processes and restarts"""
+    return hashlib.blake2b(items.dumps(value), digest_size=8).hexdigest()
+
+
+def field_hashes(item):
+    return {name: field_hash(value) for name, value in item.items() if name not in VOLATILE_FIELDS}
+
+
+class SnapshotStore:
+    """Last snapshot of every URL in a local SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS snapshots ('
+            ' url TEXT PRIMARY KEY, hashes TEXT NOT NULL, fields TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    def compare(self, item):
+        """
+        Changes of a scraped item since its URL's snapshot, which is updated to the item
+
+        Only the fields present in the item are compared, so a scrape limited
+        to some fields neither reports nor forgets the others. Items with an
+        error are returned as they are and leave the snapshot alone.
+        """
+        if 'error' in item:
+            return item
+        url = item['url']
+        hashes = field_hashes(item)
+        with self._lock:
+            row = self._db.execute('SELECT hashes FROM snapshots WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                status, changes = NEW, {}
+                self._db.execute('INSERT INTO snapshots (url, hashes, fields, updated_at) VALUES (?, ?, ?, ?)',
+                                 (url, json.dumps(hashes), self._fields(item, hashes), time.time()))
+            else:
+                old_hashes = json.loads(row[0])
+                changed = [name for name, digest in hashes.items() if old_hashes.get(name) != digest]
+                status, changes = (CHANGED if changed else UNCHANGED), {}
+                if changed:
+                    old_fields = json.loads(self._db.execute('SELECT fields FROM snapshots WHERE url = ?',
+                                                             (url,)).fetchone()[0])
+                    for name in changed:
+                        changes[name] = {'old': old_fields.get(name), 'new': item[name]}
+                        old_fields[name] = item[name]
+                    old_hashes.update(hashes)
+                    self._db.execute('UPDATE snapshots SET hashes = ?, fields = ?, updated_at = ? WHERE url = ?',
+                                     (json.dumps(old_hashes), items.dumps(old_fields).decode('utf-8'), time.time(),
+                                      url))
+        return SeoItem(url=url, timestamp=item.get('timestamp'), audit_status=status, changes=changes)
+
+    @staticmethod
+    def _fields(item, hashes):
+        return items.dumps({name: item[name] for name in hashes}).decode('utf-8')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide snapshot store (SCRAPER_SNAPSHOT_DB_PATH)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SnapshotStore(settings.SNAPSHOT_DB_PATH)
+    return _store
+
+
+def compare_items(scraped):
+    """Replace scraped items by their changes since the last snapshot (blocking I/O)"""
+    store = get_store()
+    return [store.compare(item) for item in scraped]
@@ -0,0 +1,74 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from heapq import nlargest
+from operator import itemgetter
+
+
+# Text statistics of the page content: word frequency, keyword density and readability.
+#
+# The text is tokenized once and counted in bulk; everything per word (the
+# keyword filter, syllables) is computed per distinct word and weighted by its
+# count, so repeated words cost nothing extra.
+
+WORD_RE = re.compile(r'\b\w+\b')
+VOWEL_GROUP_RE = re.compile(r'[aeiouy]+')
+# A sentence is the text between [.!?] runs that contains anything but whitespace,
+# and its words are the whitespace separated tokens (punctuation also separates)
+SENTENCE_RE = re.compile(r'[^.!?\s][^.!?]*')
+SENTENCE_WORD_RE = re.compile(r'[^.!?\s]+')
+
+TOP_KEYWORDS = 20
+DENSITY_KEYWORDS = 10
+MIN_KEYWORD_LENGTH = 3
+
+
+@lru_cache(maxsize=65536)
+def syllables(word):
+    """Estimated syllables of a word (groups of vowels)"""
+    return len(VOWEL_GROUP_RE.findall(word.lower()))
+
+
+def words(text):
+    """Lowercased words of a text, the token stream every statistic is computed from"""
+    return WORD_RE.findall(text.lower())
+
+
+def top_keywords(counts, limit=TOP_KEYWORDS):
+    """Most frequent (word, count) pairs, skipping short words; ties keep first-seen order like a stable sort"""
+    keywords = [(word, count) for word, count in counts.items() if len(word) >= MIN_KEYWORD_LENGTH]
+    return nlargest(limit, keywords, key=itemgetter(1))
+
+
+def text_statistics(text, counts=None):
+    """
+    Word, keyword and readability statistics of a text
+
+    Returns total_words, unique_words, top_keywords, keyword_density,
+    sentence_count, avg_sentence_length, avg_syllables_per_word and
+    flesch_reading_ease. `counts` are the word counts of the text if they
+    were already computed (Counter of words()).
+    """
+    if counts is None:
+        counts = Counter(words(text))
+    total_words = sum(counts.values())
+    stats = {'total_words': total_words, 'unique_words': len(counts)}
+
+    top = top_keywords(counts)
+    stats['top_keywords'] = top
+    stats['keyword_density'] = {word: round((count / total_words * 100), 2) for word, count in top[:DENSITY_KEYWORDS]}
+
+    # Readability analysis
+    sentence_count = len(SENTENCE_RE.findall(text))
+    stats['sentence_count'] = sentence_count
+    stats['avg_sentence_length'] = round(len(SENTENCE_WORD_RE.findall(text)) / sentence_count, 2) if sentence_count else 0
+
+    total_syllables = sum(syllables(word) * count for word, count in counts.items())
+    stats['avg_syllables_per_word'] = round(total_syllables / total_words, 2) if total_words else 0
+
+    # Flesch Reading Ease (simplified)
+    if stats['avg_sentence_length'] > 0 and stats['avg_syllables_per_word'] > 0:
+        stats['flesch_reading_ease'] = round(206.835 - (1.015 * stats['avg_sentence_length']) - (84.6 * stats['avg_syllables_per_word']), 2)
+    else:
+        stats['flesch_reading_ease'] = 0
+    return stats
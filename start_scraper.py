@@ -1,21 +1,38 @@
 import os
 import sys
-import requests
-from bs4 import BeautifulSoup
+import itertools
+import json
+import time
 from datetime import datetime
-import re
-from fake_useragent import UserAgent
-from urllib.parse import urlparse
 
+from scraper import (analysis, archive, cache, client, duplicates, extract, keywords, memo, metrics, politeness,
+                     resources, settings)
+from scraper.items import SeoItem
 
-def run_spider(url):
-    """Run the SEO spider for a given URL using requests and BeautifulSoup"""
-    # Add the current directory to Python path
-    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Download phases reported by the client, see record_timings
+FETCH_PHASES = ('dns', 'connect', 'tls', 'ttfb', 'download')
+
+# Optional field groups behind check_resources, check_duplicates and check_keywords
+RESOURCE_INCLUDE = ('resource_urls',)
+DUPLICATE_INCLUDE = ('content_fingerprint',)
+KEYWORD_INCLUDE = ('term_counts',)
+
+
+def fetch_page(url, include=(), mode='full', fields=None):
+    """
+    Download a page and return the response together with the user agent used
     
-    # Create a fake user agent
-    ua = UserAgent()
-    user_agent = ua.random
+    With the response cache enabled a fresh cached page is returned without a
+    request, and a stale one is revalidated; in both cases the response carries
+    the stored analysis in `cached_analysis`.
+    
+    The body is read up to SCRAPER_MAX_BODY_BYTES. In 'head' mode the download
+    stops as soon as the end of <head> arrives (or SCRAPER_HEAD_MAX_BYTES),
+    and the response cache is bypassed. `fields` is the field selection the
+    page is analysed for (see analysis.resolve_fields), part of the cache key.
+    """
+    # Pick a user agent from the pool loaded once per process
+    user_agent = client.random_user_agent()
     
     # Configure headers
     headers = {
@@ -26,424 +43,315 @@ def run_spider(url):
         'Connection': 'keep-alive',
     }
     
-    try:
-        # Make the request
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        # Parse with BeautifulSoup
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Create comprehensive SEO item
-        item = {}
-        item['url'] = url
-        item['timestamp'] = datetime.now().isoformat()
-        item['user_agent'] = user_agent
-        
-        # Basic page info
-        item['status_code'] = response.status_code
-        item['content_type'] = response.headers.get('content-type', '')
-        item['content_length'] = len(response.content)
-        item['load_time'] = response.elapsed.total_seconds()
-        
-        # Title analysis
-        title_tag = soup.find('title')
-        item['title'] = title_tag.get_text().strip() if title_tag else ''
-        item['title_length'] = len(item['title'])
-        item['title_optimal'] = 50 <= len(item['title']) <= 60
-        
-        # Meta tags analysis
-        meta_desc = soup.find('meta', attrs={'name': 'description'})
-        item['meta_description'] = meta_desc.get('content', '') if meta_desc else ''
-        item['meta_description_length'] = len(item['meta_description'])
-        item['meta_description_optimal'] = 150 <= len(item['meta_description']) <= 160
-        
-        meta_keywords = soup.find('meta', attrs={'name': 'keywords'})
-        item['meta_keywords'] = meta_keywords.get('content', '') if meta_keywords else ''
-        
-        # Open Graph tags
-        og_title = soup.find('meta', attrs={'property': 'og:title'})
-        item['og_title'] = og_title.get('content', '') if og_title else ''
-        
-        og_description = soup.find('meta', attrs={'property': 'og:description'})
-        item['og_description'] = og_description.get('content', '') if og_description else ''
-        
-        og_image = soup.find('meta', attrs={'property': 'og:image'})
-        item['og_image'] = og_image.get('content', '') if og_image else ''
-        
-        og_url = soup.find('meta', attrs={'property': 'og:url'})
-        item['og_url'] = og_url.get('content', '') if og_url else ''
-        
-        # Twitter Card tags
-        twitter_card = soup.find('meta', attrs={'name': 'twitter:card'})
-        item['twitter_card'] = twitter_card.get('content', '') if twitter_card else ''
-        
-        twitter_title = soup.find('meta', attrs={'name': 'twitter:title'})
-        item['twitter_title'] = twitter_title.get('content', '') if twitter_title else ''
-        
-        twitter_description = soup.find('meta', attrs={'name': 'twitter:description'})
-        item['twitter_description'] = twitter_description.get('content', '') if twitter_description else ''
-        
-        # Canonical and alternate links
-        canonical = soup.find('link', attrs={'rel': 'canonical'})
-        item['canonical_url'] = canonical.get('href', '') if canonical else ''
-        
-        alternate_links = soup.find_all('link', attrs={'rel': 'alternate'})
-        item['alternate_links'] = [link.get('href', '') for link in alternate_links]
-        
-        # Heading analysis
-        h1_tags = soup.find_all('h1')
-        item['h1_count'] = len(h1_tags)
-        item['h1_texts'] = [h1.get_text().strip() for h1 in h1_tags]
-        
-        h2_tags = soup.find_all('h2')
-        item['h2_count'] = len(h2_tags)
-        item['h2_texts'] = [h2.get_text().strip() for h2 in h2_tags]
-        
-        h3_tags = soup.find_all('h3')
-        item['h3_count'] = len(h3_tags)
-        item['h3_texts'] = [h3.get_text().strip() for h3 in h3_tags]
-        
-        h4_tags = soup.find_all('h4')
-        item['h4_count'] = len(h4_tags)
-        item['h4_texts'] = [h4.get_text().strip() for h4 in h4_tags]
-        
-        h5_tags = soup.find_all('h5')
-        item['h5_count'] = len(h5_tags)
-        
-        h6_tags = soup.find_all('h6')
-        item['h6_count'] = len(h6_tags)
-        
-        # Content analysis
-        for script in soup(["script", "style", "nav", "footer", "header"]):
-            script.decompose()
-        
-        text = soup.get_text()
-        words = re.findall(r'\b\w+\b', text.lower())
-        item['total_words'] = len(words)
-        item['unique_words'] = len(set(words))
-        
-        # Advanced content analysis
-        # Keyword density analysis
-        word_freq = {}
-        for word in words:
-            if len(word) > 2:  # Skip short words
-                word_freq[word] = word_freq.get(word, 0) + 1
-        
-        # Get top keywords
-        sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        item['top_keywords'] = sorted_words[:20]  # Top 20 keywords
-        
-        # Keyword density
-        item['keyword_density'] = {word: round((count/len(words)*100), 2) for word, count in sorted_words[:10]}
-        
-        # Readability analysis
-        sentences = re.split(r'[.!?]+', text)
-        sentences = [s.strip() for s in sentences if s.strip()]
-        item['sentence_count'] = len(sentences)
-        item['avg_sentence_length'] = round(sum(len(s.split()) for s in sentences) / len(sentences), 2) if sentences else 0
-        
-        # Reading level estimation
-        syllables = 0
-        for word in words:
-            syllables += len(re.findall(r'[aeiouy]+', word.lower()))
-        item['avg_syllables_per_word'] = round(syllables / len(words), 2) if words else 0
-        
-        # Flesch Reading Ease (simplified)
-        if item['avg_sentence_length'] > 0 and item['avg_syllables_per_word'] > 0:
-            item['flesch_reading_ease'] = round(206.835 - (1.015 * item['avg_sentence_length']) - (84.6 * item['avg_syllables_per_word']), 2)
-        else:
-            item['flesch_reading_ease'] = 0
-        
-        # Paragraph analysis
-        paragraphs = soup.find_all('p')
-        item['paragraph_count'] = len(paragraphs)
-        item['paragraphs_with_text'] = len([p for p in paragraphs if p.get_text().strip()])
-        
-        # Link analysis
-        all_links = soup.find_all('a', href=True)
-        item['total_links'] = len(all_links)
-        
-        internal_links = [link for link in all_links if url in link.get('href', '')]
-        item['internal_links'] = len(internal_links)
-        
-        external_links = [link for link in all_links if url not in link.get('href', '') and link.get('href', '').startswith('http')]
-        item['external_links'] = len(external_links)
-        
-        # Advanced link analysis
-        link_texts = [link.get_text().strip() for link in all_links if link.get_text().strip()]
-        item['link_texts'] = link_texts[:20]  # First 20 link texts
-        
-        # Nofollow links
-        nofollow_links = [link for link in all_links if link.get('rel') and 'nofollow' in link.get('rel')]
-        item['nofollow_links'] = len(nofollow_links)
-        
-        # External domains
-        external_domains = set()
-        for link in external_links:
+    if mode == 'head':
+        response = client.get(url, headers=headers, stream=True)
+        politeness.check_response(url, response)
+        started = time.perf_counter()
+        client.read_body(response, settings.HEAD_MAX_BYTES, stop=extract.HeadScanner().feed_chunk)
+        response.timings['download'] = round(time.perf_counter() - started, 6)
+        response.cache_status = 'bypass'
+        return response, user_agent
+    
+    response_cache = cache.get_cache()
+    key = cache.cache_key(url, extract.ANALYZER_VERSION, include, fields)
+    entry = response_cache.get(key) if response_cache else None
+    if entry and entry.is_fresh():
+        cache.count('hits')
+        cache.count('bytes_saved', entry.content_length)
+        return cache.CachedResponse(url, entry), user_agent
+    if entry:
+        headers.update(entry.validators())
+    
+    # Make the request over the shared keep-alive connection pools
+    response = client.get(url, headers=headers, stream=True)
+    politeness.check_response(url, response)
+    started = time.perf_counter()
+    client.read_body(response, settings.MAX_BODY_BYTES)
+    response.timings['download'] = round(time.perf_counter() - started, 6)
+    
+    if entry and response.status_code == 304:
+        cache.count('revalidated')
+        cache.count('bytes_saved', entry.content_length)
+        entry.revalidated(response.headers)
+        response_cache.set(key, entry)
+        response.cached_analysis = entry.analysis
+        response.cache_status = 'revalidated'
+    else:
+        if response_cache:
+            cache.count('misses')
+        response.cache_status = 'miss'
+    return response, user_agent
+
+
+def polite_fetch(url, include=(), mode='full', fields=None):
+    """
+    fetch_page behind the per-host politeness rules (scraper/politeness.py)
+
+    Checks robots.txt, then waits for a free connection to the host and a
+    token of its rate limit. A 429 / 503 pauses the host and the page is
+    fetched again, up to SCRAPER_RETRY_MAX times. Blocks the calling thread;
+    the engine has an asyncio version of the same steps.
+    """
+    politeness.check_robots(url)
+    for attempt in itertools.count():
+        with politeness.scheduler.connection(url):
+            time.sleep(politeness.scheduler.reserve(url))
             try:
-                domain = urlparse(link.get('href')).netloc
-                external_domains.add(domain)
-            except:
-                pass
-        item['external_domains'] = list(external_domains)
-        
-        # Internal page links
-        internal_pages = []
-        for link in internal_links:
-            href = link.get('href', '')
-            if href and not href.startswith('#') and not href.startswith('mailto:'):
-                internal_pages.append(href)
-        item['internal_pages'] = internal_pages[:20]  # First 20 internal pages
-        
-        # Image analysis
-        images = soup.find_all('img')
-        item['total_images'] = len(images)
-        
-        images_without_alt = [img for img in images if not img.get('alt')]
-        item['images_without_alt'] = len(images_without_alt)
-        item['images_with_alt'] = item['total_images'] - item['images_without_alt']
-        
-        # Advanced image analysis
-        image_details = []
-        for img in images[:10]:  # First 10 images
-            img_info = {
-                'src': img.get('src', ''),
-                'alt': img.get('alt', ''),
-                'title': img.get('title', ''),
-                'width': img.get('width', ''),
-                'height': img.get('height', ''),
-                'loading': img.get('loading', ''),
-                'decoding': img.get('decoding', '')
-            }
-            image_details.append(img_info)
-        item['image_details'] = image_details
-        
-        # Image sources
-        image_srcs = [img.get('src', '') for img in images if img.get('src')]
-        item['image_sources'] = image_srcs[:10]  # First 10 image sources
-        
-        # Video analysis
-        videos = soup.find_all(['video', 'iframe'])
-        item['video_count'] = len(videos)
-        video_sources = []
-        for video in videos:
-            if video.name == 'video':
-                sources = video.find_all('source')
-                for source in sources:
-                    video_sources.append(source.get('src', ''))
-            elif video.name == 'iframe':
-                video_sources.append(video.get('src', ''))
-        item['video_sources'] = video_sources
-        
-        # Audio analysis
-        audio = soup.find_all('audio')
-        item['audio_count'] = len(audio)
-        
-        # Form analysis
-        forms = soup.find_all('form')
-        item['form_count'] = len(forms)
-        
-        # Table analysis
-        tables = soup.find_all('table')
-        item['table_count'] = len(tables)
-        
-        # List analysis
-        ul_lists = soup.find_all('ul')
-        ol_lists = soup.find_all('ol')
-        item['unordered_lists'] = len(ul_lists)
-        item['ordered_lists'] = len(ol_lists)
-        
-        # CSS and JS analysis
-        css_files = soup.find_all('link', rel='stylesheet')
-        js_files = soup.find_all('script', src=True)
-        item['css_files'] = [css.get('href', '') for css in css_files]
-        item['js_files'] = [js.get('src', '') for js in js_files]
-        
-        # Inline CSS and JS
-        inline_css = soup.find_all('style')
-        inline_js = soup.find_all('script', src=False)
-        item['inline_css_count'] = len(inline_css)
-        item['inline_js_count'] = len(inline_js)
-        
-        # Meta robots
-        robots = soup.find('meta', attrs={'name': 'robots'})
-        item['robots_directive'] = robots.get('content', '') if robots else ''
-        
-        # Viewport
-        viewport = soup.find('meta', attrs={'name': 'viewport'})
-        item['viewport'] = viewport.get('content', '') if viewport else ''
-        
-        # Language
-        lang = soup.get('lang', '')
-        item['language'] = lang
-        
-        # Character encoding
-        charset = soup.find('meta', attrs={'charset': True})
-        if charset:
-            item['charset'] = charset.get('charset', '')
+                response, user_agent = fetch_page(url, include, mode, fields)
+            except politeness.Throttled as e:
+                if attempt >= settings.RETRY_MAX or not e.retry:
+                    raise
+                continue
+        if response.cache_status == 'hit':
+            politeness.scheduler.refund(url)
+        return response, user_agent
+
+
+def remember_page(url, response, items, include=(), fields=None):
+    """
+    Store a freshly analysed page in the response cache if its headers allow it
+
+    With SCRAPER_ARCHIVE_DIR set, every downloaded page (not served from the
+    cache, not cut at </head>) is also appended to the page archive.
+    """
+    response_cache = cache.get_cache()
+    if response_cache and response.cache_status == 'miss' and items and cache.is_cacheable(response):
+        response_cache.set(cache.cache_key(url, extract.ANALYZER_VERSION, include, fields), cache.CacheEntry.from_response(response, items[0]))
+        cache.count('stores')
+    page_archive = archive.get_archive()
+    if page_archive and response.cache_status == 'miss':
+        page_archive.add(url, response, response.request.headers.get('User-Agent', ''))
+
+
+def _add_request_info(item, response, user_agent, memoized=False):
+    """Fields describing this particular request rather than the page content"""
+    item['timestamp'] = datetime.now().isoformat()
+    item['user_agent'] = user_agent
+    item['load_time'] = response.elapsed.total_seconds()
+    
+    # Connection timings (0 when a keep-alive connection was reused)
+    timings = getattr(response, 'timings', {})
+    item['dns_time'] = timings.get('dns', 0)
+    item['connect_time'] = timings.get('connect', 0)
+    item['tls_time'] = timings.get('tls', 0)
+    item['ttfb'] = timings.get('ttfb', 0)
+    item['connection_reused'] = timings.get('connection_reused', False)
+    item['cache_status'] = getattr(response, 'cache_status', 'miss')
+    item['memoized'] = memoized
+
+
+def _add_header_info(item, response):
+    """Fields taken from the response headers"""
+    # Security headers check
+    security_headers = {
+        'x-frame-options': response.headers.get('x-frame-options', ''),
+        'x-content-type-options': response.headers.get('x-content-type-options', ''),
+        'x-xss-protection': response.headers.get('x-xss-protection', ''),
+        'strict-transport-security': response.headers.get('strict-transport-security', ''),
+        'content-security-policy': response.headers.get('content-security-policy', '')
+    }
+    item['security_headers'] = security_headers
+    
+    # Server information
+    server_info = {
+        'server': response.headers.get('server', ''),
+        'x-powered-by': response.headers.get('x-powered-by', ''),
+        'cache-control': response.headers.get('cache-control', ''),
+        'expires': response.headers.get('expires', ''),
+        'last-modified': response.headers.get('last-modified', '')
+    }
+    item['server_info'] = server_info
+
+
+def _memo_key(url, response, include, fields):
+    # Computed once per response, it is needed for the lookup and for storing
+    if getattr(response, 'memo_key', None) is None:
+        response.memo_key = memo.memo_key(response.content, url, extract.ANALYZER_VERSION, include, fields)
+    return response.memo_key
+
+
+def reuse_analysis(url, response, user_agent, include=(), fields=None):
+    """
+    Item for a page whose analysis is already known, or None if it has to be analysed
+    
+    Reuses the analysis stored by the response cache (fresh hit or 304) or
+    memoized for a byte-identical body, refreshing only the request fields.
+    """
+    # Served from the response cache: reuse the analysis, refresh the request fields
+    cached_analysis = getattr(response, 'cached_analysis', None)
+    if cached_analysis is not None:
+        item = SeoItem(cached_analysis)
+        _add_request_info(item, response, user_agent)
+        return [analysis.select_fields(item, fields, include)]
+    
+    if response.cache_status == 'bypass':
+        return None
+    
+    # Byte-identical page already analysed: skip parsing, refresh what depends on this response
+    page_analysis = memo.table.get(_memo_key(url, response, include, fields))
+    if page_analysis is not None:
+        return build_items(url, response, user_agent, page_analysis, include, fields, memoized=True)
+    return None
+
+
+def analysis_args(url, response, include=(), mode='full', fields=None):
+    """Arguments for analysis.analyze_document; plain values that can be sent to a worker process"""
+    headers = {name.lower(): value for name, value in response.headers.items()}
+    return url, response.content, headers, tuple(include), response.url, mode, fields
+
+
+def build_items(url, response, user_agent, page_analysis, include=(), fields=None, memoized=False):
+    """Combine the page analysis with the request and header fields into the final item"""
+    if not memoized and response.cache_status not in ('bypass', archive.CACHE_STATUS):
+        memo.table.put(_memo_key(url, response, include, fields), page_analysis)
+    
+    # Create comprehensive SEO item
+    item = SeoItem()
+    item['url'] = url
+    item['timestamp'] = datetime.now().isoformat()
+    item['user_agent'] = user_agent
+    
+    # Basic page info
+    item['status_code'] = response.status_code
+    item['content_type'] = response.headers.get('content-type', '')
+    item['content_length'] = len(response.content)
+    item['body_truncated'] = getattr(response, 'truncated', False)
+    _add_request_info(item, response, user_agent, memoized)
+    
+    item.update(page_analysis)
+    _add_header_info(item, response)
+    return [analysis.select_fields(item, fields, include)]
+
+
+def analyze_page(url, response, user_agent, include=(), mode='full', fields=None, timed=False):
+    """
+    Build the SEO item for an already downloaded page (CPU bound, no network I/O)
+    
+    `include` names optional field groups to add, e.g. 'outlinks' for crawling;
+    mode='head' only adds the fields found in <head>, and `fields` (from
+    analysis.resolve_fields) limits the analysis and the item to those fields.
+    With `timed` the analysis phases are kept in response.analysis_timings.
+    """
+    items = reuse_analysis(url, response, user_agent, include, fields)
+    if items is None:
+        args = analysis_args(url, response, include, mode, fields)
+        if timed:
+            page_analysis, response.analysis_timings = analysis.analyze_document_timed(*args)
         else:
-            charset_meta = soup.find('meta', attrs={'http-equiv': 'content-type'})
-            item['charset'] = charset_meta.get('content', '').split('charset=')[-1] if charset_meta else ''
-        
-        # All meta tags analysis
-        all_meta_tags = soup.find_all('meta')
-        meta_analysis = {}
-        for meta in all_meta_tags:
-            name = meta.get('name', meta.get('property', ''))
-            content = meta.get('content', '')
-            if name and content:
-                meta_analysis[name] = content
-        item['all_meta_tags'] = meta_analysis
-        
-        # Schema.org structured data
-        schema_scripts = soup.find_all('script', type='application/ld+json')
-        item['schema_scripts'] = len(schema_scripts)
-        
-        # Structured data content
-        structured_data = []
-        for script in schema_scripts:
-            try:
-                import json
-                data = json.loads(script.string)
-                structured_data.append(data)
-            except:
-                pass
-        item['structured_data_content'] = structured_data
-        
-        # Google Analytics
-        ga_scripts = soup.find_all('script', src=re.compile(r'google-analytics|gtag|googletagmanager'))
-        item['google_analytics'] = len(ga_scripts) > 0
-        
-        # Facebook Pixel
-        fb_scripts = soup.find_all('script', src=re.compile(r'facebook|fbevents'))
-        item['facebook_pixel'] = len(fb_scripts) > 0
-        
-        # Social media links
-        social_links = []
-        for link in all_links:
-            href = link.get('href', '').lower()
-            if any(social in href for social in ['facebook.com', 'twitter.com', 'linkedin.com', 'instagram.com', 'youtube.com', 'tiktok.com', 'pinterest.com']):
-                social_links.append(href)
-        item['social_media_links'] = social_links
-        
-        # Contact information
-        contact_info = []
-        for link in all_links:
-            href = link.get('href', '').lower()
-            if any(contact in href for contact in ['mailto:', 'tel:', 'contact', 'about', 'support']):
-                contact_info.append(href)
-        item['contact_links'] = contact_info
-        
-        # Performance indicators
-        item['has_ssl'] = url.startswith('https://')
-        item['mobile_friendly'] = bool(item['viewport'])
-        
-        # Page speed indicators
-        item['has_minified_css'] = any('min.css' in css for css in item['css_files'])
-        item['has_minified_js'] = any('min.js' in js for js in item['js_files'])
-        item['has_compressed_resources'] = item['has_minified_css'] or item['has_minified_js']
-        
-        # Security headers check
-        security_headers = {
-            'x-frame-options': response.headers.get('x-frame-options', ''),
-            'x-content-type-options': response.headers.get('x-content-type-options', ''),
-            'x-xss-protection': response.headers.get('x-xss-protection', ''),
-            'strict-transport-security': response.headers.get('strict-transport-security', ''),
-            'content-security-policy': response.headers.get('content-security-policy', '')
-        }
-        item['security_headers'] = security_headers
-        
-        # Server information
-        server_info = {
-            'server': response.headers.get('server', ''),
-            'x-powered-by': response.headers.get('x-powered-by', ''),
-            'cache-control': response.headers.get('cache-control', ''),
-            'expires': response.headers.get('expires', ''),
-            'last-modified': response.headers.get('last-modified', '')
-        }
-        item['server_info'] = server_info
-        
-        # Advanced SEO scoring
-        seo_score = 0
-        
-        # Basic SEO (25 points)
-        if item['title']: seo_score += 5
-        if item['meta_description']: seo_score += 5
-        if item['canonical_url']: seo_score += 3
-        if item['h1_count'] == 1: seo_score += 5
-        if item['images_with_alt'] > 0: seo_score += 3
-        if item['has_ssl']: seo_score += 4
-        
-        # Content quality (25 points)
-        if item['total_words'] > 300: seo_score += 5
-        if item['total_words'] > 1000: seo_score += 5
-        if item['paragraph_count'] > 5: seo_score += 3
-        if item['sentence_count'] > 10: seo_score += 3
-        if item['flesch_reading_ease'] > 60: seo_score += 4
-        if item['unique_words'] > 100: seo_score += 5
-        
-        # Technical SEO (25 points)
-        if item['mobile_friendly']: seo_score += 5
-        if item['og_title']: seo_score += 3
-        if item['og_description']: seo_score += 3
-        if item['twitter_card']: seo_score += 3
-        if item['schema_scripts'] > 0: seo_score += 5
-        if item['robots_directive']: seo_score += 3
-        if item['language']: seo_score += 3
-        
-        # Link structure (15 points)
-        if item['internal_links'] > 5: seo_score += 5
-        if item['external_links'] > 0: seo_score += 3
-        if item['total_links'] > 10: seo_score += 4
-        if item['nofollow_links'] < item['total_links'] * 0.5: seo_score += 3
-        
-        # Media optimization (10 points)
-        if item['images_with_alt'] > item['total_images'] * 0.8: seo_score += 5
-        if item['video_count'] > 0: seo_score += 3
-        if item['css_files']: seo_score += 2
-        
-        item['seo_score'] = min(seo_score, 100)  # Cap at 100
-        
-        # SEO recommendations
-        recommendations = []
-        if not item['title']: recommendations.append("Missing page title")
-        if not item['meta_description']: recommendations.append("Missing meta description")
-        if item['h1_count'] == 0: recommendations.append("Missing H1 tag")
-        if item['h1_count'] > 1: recommendations.append("Multiple H1 tags found")
-        if item['images_without_alt'] > 0: recommendations.append(f"{item['images_without_alt']} images missing alt text")
-        if not item['has_ssl']: recommendations.append("Website not using HTTPS")
-        if not item['mobile_friendly']: recommendations.append("No viewport meta tag for mobile")
-        if item['total_words'] < 300: recommendations.append("Content too short (less than 300 words)")
-        if item['flesch_reading_ease'] < 60: recommendations.append("Content may be too complex to read")
-        if item['nofollow_links'] > item['total_links'] * 0.5: recommendations.append("Too many nofollow links")
-        if not item['og_title']: recommendations.append("Missing Open Graph title")
-        if not item['og_description']: recommendations.append("Missing Open Graph description")
-        if not item['twitter_card']: recommendations.append("Missing Twitter Card")
-        if item['schema_scripts'] == 0: recommendations.append("No structured data found")
-        if not item['robots_directive']: recommendations.append("No robots meta tag")
-        
-        item['seo_recommendations'] = recommendations
-        
-        return [item]
+            page_analysis = analysis.analyze_document(*args)
+        items = build_items(url, response, user_agent, page_analysis, include, fields)
+    return items
+
+
+def analyze_archived(directory, locations, include=(), fields=None):
+    """
+    Analyse pages of the archive in `directory` again from their locations (archive.Archive.select)
+
+    Runs in the analysis workers during a replay, reading the records itself.
+    Items keep the time their page was fetched as timestamp; a page that cannot
+    be read or analysed gives an item with an error.
+    """
+    reader = archive.reader(directory)
+    scraped = []
+    for location in locations:
+        url = f'archive:{location[0]}:{location[1]}'
+        try:
+            response = reader.read(location)
+            url = response.requested_url
+            page_analysis = analysis.analyze_document(*analysis_args(url, response, include, 'full', fields))
+            items = build_items(url, response, response.user_agent, page_analysis, include, fields)
+        except Exception as e:
+            scraped.append(SeoItem(url=url, error=str(e)))
+            continue
+        if 'timestamp' in items[0]:
+            items[0]['timestamp'] = response.fetched.isoformat()
+        scraped.extend(items)
+    return scraped
+
+
+def record_timings(response, items, mode, timings, debug_timings=False):
+    """
+    Record the phases of a finished scrape in the metrics, and in the item as `debug_timings` if asked
+
+    `timings` holds phases measured by the caller (e.g. 'total'); download
+    phases that did not happen (no DNS lookup or connect on a reused
+    connection, no download on a cache hit) are left out.
+    """
+    response_timings = getattr(response, 'timings', {})
+    phases = {phase: response_timings[phase] for phase in FETCH_PHASES if response_timings.get(phase)}
+    phases.update(getattr(response, 'analysis_timings', {}))
+    phases.update(timings)
+    downloaded = response.cache_status != 'hit'
+    metrics.record_scrape(mode, phases, len(response.content) if downloaded else None)
+    if debug_timings and items:
+        debug = {phase: round(value, 6) for phase, value in phases.items()}
+        debug['response_bytes'] = len(response.content)
+        items[0]['debug_timings'] = debug
+
+
+def run_spider(url, mode='full', fields=(), profile=None, debug_timings=False, check_resources=False,
+               check_duplicates=False, check_keywords=False):
+    """
+    Run the SEO spider for a given URL using requests and BeautifulSoup
+    
+    mode='head' only downloads and analyses the <head> of the page. `fields`
+    (field names) and `profile` (a name from analysis.PROFILES) limit the
+    analysis to the groups those fields need; by default every field is returned.
+    `debug_timings` adds the seconds spent per phase to the item.
+    `check_resources` checks the files the page loads (scraper/resources.py)
+    and `check_duplicates` looks for near-duplicates of its content among the
+    pages of the site scraped before (scraper/duplicates.py). `check_keywords`
+    adds the page to its site's keyword index and reports its TF-IDF keywords
+    (scraper/keywords.py).
+    """
+    fields = analysis.resolve_fields(fields, profile)
+    include = ((RESOURCE_INCLUDE if check_resources else ()) + (DUPLICATE_INCLUDE if check_duplicates else ())
+               + (KEYWORD_INCLUDE if check_keywords else ()))
+    # Add the current directory to Python path
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    
+    timed = metrics.enabled(debug_timings)
+    started = time.perf_counter()
+    metrics.scrapes_in_flight.inc()
+    try:
+        response, user_agent = polite_fetch(url, include, mode, fields)
+        items = analyze_page(url, response, user_agent, include, mode, fields, timed)
+        remember_page(url, response, items, include, fields)
+        if check_duplicates:
+            duplicates.check_items(items)
+        if check_keywords:
+            keywords.check_items(items)
+        phases = {}
+        if check_resources:
+            checking = time.perf_counter()
+            resources.check_items(items)
+            phases['resources'] = time.perf_counter() - checking
+        if timed:
+            phases['total'] = time.perf_counter() - started
+            record_timings(response, items, mode, phases, debug_timings)
+        return items
         
     except Exception as e:
+        metrics.record_error(mode, e)
         raise Exception(f"Failed to scrape {url}: {str(e)}")
+    finally:
+        metrics.scrapes_in_flight.dec()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python start_scraper.py <url>")
+    if len(sys.argv) not in (2, 3) or sys.argv[2:] not in ([], ['full'], ['head']):
+        print("Usage: python start_scraper.py <url> [full|head]")
         sys.exit(1)
     
     url = sys.argv[1]
+    mode = sys.argv[2] if len(sys.argv) == 3 else 'full'
     print(f"Starting SEO scraping for: {url}")
     
     try:
-        results = run_spider(url)
+        results = run_spider(url, mode)
         print(f"Scraping completed. Found {len(results)} results.")
         for result in results:
-            print(json.dumps(result, indent=2))
+            print(json.dumps(result.to_dict(), indent=2, default=str))
     except Exception as e:
         print(f"Error during scraping: {e}")
         sys.exit(1) 
\ No newline at end of file
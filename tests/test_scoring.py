@@ -0,0 +1,86 @@
+"""Scoring rules: parity with the hand-written if chain (benchmarks/bench_scoring.py), validation and rescoring"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fixtures
+from benchmarks.bench_scoring import generate_item, legacy_score
+from scraper import analysis, jobstore, scoring
+
+
+@pytest.fixture(scope='module')
+def items():
+    rng = random.Random(0)
+    analysed = [analysis.analyze_document(url, html, {'content-type': 'text/html; charset=utf-8'})
+                for html in fixtures.corpus().values() if len(html) < 256 * 1024
+                for url in ('https://bench.local/', 'http://bench.local/')]
+    return analysed + [generate_item(rng) for _ in range(5000)]
+
+
+def legacy(item):
+    item = dict(item)
+    legacy_score(item)
+    return item['seo_score'], item['seo_recommendations']
+
+
+def test_score_matches_legacy(items):
+    rules = scoring.RuleSet()
+    for item in items:
+        scored = dict(item)
+        rules.score(scored)
+        assert (scored['seo_score'], scored['seo_recommendations']) == legacy(item)
+
+
+def test_score_columns_matches_legacy(items):
+    rules = scoring.RuleSet()
+    scores, recommendations = rules.score_columns(scoring.columns(items, rules.requires))
+    assert list(zip(scores, recommendations)) == [legacy(item) for item in items]
+
+
+def test_rules_round_trip_through_json_form():
+    rules = scoring.RuleSet()
+    assert scoring.RuleSet.from_dict(rules.to_dict()).to_dict() == rules.to_dict()
+
+
+@pytest.mark.parametrize('data', [
+    {'score': [], 'recommendations': []},
+    {'score': [['total_words', '>', 'abc', 5]]},
+    {'score': [['title', '>', 3, 5]]},
+    {'score': [['h1_texts', '>', 3, 5]]},
+    {'score': [['total_words', '>', {'field': 'title'}, 5]]},
+    {'score': [['no_such_field', 'truthy', None, 5]]},
+    {'score': [['title', 'truthy', None]]},
+    {'score': 'abc'},
+    {'recommendations': [['title', 'falsy', None, 'x {}']]},
+    {'recommendations': [['title', 'falsy', None, 'x {0}']]},
+    {'recommendations': [['title', 'falsy', None, 'x {title']]},
+    {'recommendations': [['total_words', '>', 0, '{total_words:>1000000000}']]},
+    {'recommendations': [['total_words', '>', 0, '{total_words!r}']]},
+])
+def test_invalid_rules_are_rejected(data):
+    with pytest.raises(ValueError):
+        scoring.RuleSet.from_dict(data)
+
+
+def test_rescore_writes_only_changed_results(tmp_path, items):
+    store = jobstore.SQLiteJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job, _ = store.create_job('batch', {'urls': []})
+    stored = []
+    for index, item in enumerate(items[:500]):
+        item = dict(item, url=f'https://bench.local/{index}')
+        legacy_score(item)
+        stored.append(item)
+    store.add_results(job['id'], stored)
+
+    rules = scoring.RuleSet()
+    assert store.rescore_results(job['id'], rules) == (500, 0, 0)
+    changed_rules = scoring.RuleSet.from_dict(dict(rules.to_dict(), score=[
+        [field, predicate, operand, 10 if field == 'h1_count' else points]
+        for field, predicate, operand, points in rules.to_dict()['score']]))
+    rescored, changed, skipped = store.rescore_results(job['id'], changed_rules)
+    assert (rescored, skipped) == (500, 0) and changed > 0
+    assert store.rescore_results(job['id'], changed_rules) == (500, 0, 0)
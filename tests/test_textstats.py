@@ -0,0 +1,28 @@
+"""Parity of scraper/textstats.py with the per-word loops it replaced (benchmarks/bench_textstats.py)"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_textstats import EDGE_CASES, generate_text, legacy_statistics
+from scraper import textstats
+
+GENERATED = [generate_text(random.Random(seed).randint(1, 300), seed) for seed in range(300)]
+
+
+@pytest.mark.parametrize('text', EDGE_CASES)
+def test_edge_cases_match_legacy(text):
+    assert textstats.text_statistics(text) == legacy_statistics(text)
+
+
+def test_generated_texts_match_legacy():
+    for text in GENERATED:
+        assert textstats.text_statistics(text) == legacy_statistics(text), text[:60]
+
+
+def test_large_text_matches_legacy():
+    text = generate_text(20000, seed=1)
+    assert textstats.text_statistics(text) == legacy_statistics(text)